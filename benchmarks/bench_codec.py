@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark the JSON codec backends on typical protocol frames.
+
+Measures encode and decode throughput of every installed backend
+(stdlib json, orjson, msgspec) for a search response, a tool call and a
+list_tools response, the frames the stdio transport handles most.
+
+Usage:
+    python benchmarks/bench_codec.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+# Add the repository root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_mcp_pkg import codec
+
+PLAN = {
+    "should_expand": True,
+    "expanded_query": "wireless headphones noise cancellation commute travel",
+    "ranking_algorithm": "hybrid",
+    "filters": {"categories": ["Electronics"], "price_range": {"max": 200}},
+    "search_fields": ["product_name", "description", "tags"],
+    "sort_by": "relevance",
+    "explanation": "The user wants noise cancelling headphones for commuting.",
+}
+
+
+def search_result(hits):
+    """Build a search tool result string shaped like core.search's output."""
+    products = "\n\n".join(
+        f"Product {i + 1}:\n"
+        f"Name: Commuter Wireless Headphones {i}\n"
+        f"Brand: SoundMaster\n"
+        f"Price: $149.99\n"
+        f"Rating: 4.6/5\n"
+        f"In Stock: Yes\n"
+        f"Category: Electronics\n"
+        f"Description: Lightweight wireless headphones with noise cancellation "
+        f"perfect for daily commute. Foldable design with 15-hour battery life..."
+        for i in range(hits)
+    )
+    return (
+        "Search results for: wireless headphones for my commute\n\n"
+        f"Query plan:\n{codec.dumps(PLAN)}\n\nResults:\n{products}\n"
+    )
+
+
+FRAMES = {
+    "search response (10 hits)": {
+        "id": "msg-42",
+        "type": "tool_call_response",
+        "result": search_result(10),
+    },
+    "search response (100 hits)": {
+        "id": "msg-43",
+        "type": "tool_call_response",
+        "result": search_result(100),
+    },
+    "tool call": {
+        "id": "msg-44",
+        "type": "tool_call",
+        "tool": "search",
+        "args": {"query": "wireless headphones for my commute", "index": "ecommerce"},
+    },
+    "list_tools response": {
+        "id": "msg-45",
+        "type": "list_tools_response",
+        "tools": [
+            {
+                "name": f"tool_{i}",
+                "description": "Search for products in a specific category " * 3,
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "title": "Query"},
+                        "index": {"type": "string", "default": "ecommerce"},
+                    },
+                    "required": ["query"],
+                },
+            }
+            for i in range(8)
+        ],
+    },
+}
+
+
+def throughput(func, arg, iterations):
+    """Return calls per second of func(arg)."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f"Active backend: {codec.BACKEND}; {iterations} iterations per case\n")
+    print(
+        f"{'frame':<28} {'backend':<8} {'bytes':>7} {'encode/s':>12} {'decode/s':>12}"
+    )
+
+    for label, frame in FRAMES.items():
+        for name, (dumps_bytes, loads) in codec.BACKENDS.items():
+            encoded = dumps_bytes(frame)
+            encode_rate = throughput(dumps_bytes, frame, iterations)
+            decode_rate = throughput(loads, encoded, iterations)
+            print(
+                f"{label:<28} {name:<8} {len(encoded):>7} "
+                f"{encode_rate:>12,.0f} {decode_rate:>12,.0f}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark the search result formatter.
+
+Formats 10, 100 and 1000 synthetic hits in every output profile and
+compares the text and JSON profiles with the formatting they replaced
+(per-field f-strings joined per tool, and JSON re-serialized after each
+hit dropped to fit max_response_bytes), with and without a limit.
+
+Usage:
+    python benchmarks/bench_formatting.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+# Add the repository root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_mcp_pkg import codec
+from search_mcp_pkg.formatting import (
+    DEFAULT_RESULT_FIELDS,
+    OUTPUT_FORMATS,
+    format_results,
+)
+
+SIZES = (10, 100, 1000)
+
+# Limit of the truncated cases, in bytes
+BYTE_LIMIT = 8192
+
+PLAN = {
+    "should_expand": True,
+    "expanded_query": "wireless headphones noise cancellation commute travel",
+    "ranking_algorithm": "hybrid",
+    "filters": {"categories": ["Electronics"], "price_range": {"max": 200}},
+    "search_fields": ["product_name", "description", "tags"],
+    "sort_by": "relevance",
+    "explanation": "The user wants noise cancelling headphones for commuting.",
+}
+
+
+def hits(count):
+    """Build search results shaped like Elasticsearch sources."""
+    return [
+        {
+            "product_name": f"Commuter Wireless Headphones {i}",
+            "brand": "SoundMaster",
+            "price": 149.99,
+            "rating": 4.6,
+            "in_stock": i % 3 != 0,
+            "category": "Electronics",
+            "description": "Lightweight wireless headphones with noise "
+            "cancellation perfect for daily commute. Foldable design with "
+            "15-hour battery life and a carrying case.",
+            "tags": ["wireless", "audio", "travel"],
+            "score": 12.5 - i / count,
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_text(results, limit=None):
+    """The text formatting the search tool used before the shared formatter."""
+    blocks = [
+        f"Product {i+1}:\n"
+        f"Name: {result.get('product_name', 'Unnamed product')}\n"
+        f"Brand: {result.get('brand', 'N/A')}\n"
+        f"Price: ${result.get('price', 'N/A')}\n"
+        f"Rating: {result.get('rating', 'N/A')}/5\n"
+        f"In Stock: {'Yes' if result.get('in_stock', False) else 'No'}\n"
+        f"Category: {result.get('category', 'N/A')}\n"
+        f"Description: {result.get('description', 'No description')[:150]}..."
+        for i, result in enumerate(results)
+    ]
+    header = (
+        "Search results for: headphones\n\n"
+        f"Query plan:\n{codec.dumps(PLAN)}\n\nResults:\n"
+    )
+    text = header + "\n\n".join(blocks) + "\n"
+    if limit is None or len(text.encode("utf-8")) <= limit:
+        return text
+    budget = limit - len(header.encode("utf-8")) - 80
+    kept = []
+    for block in blocks:
+        budget -= len(block.encode("utf-8")) + 2
+        if budget < 0:
+            break
+        kept.append(block)
+    omitted = len(blocks) - len(kept)
+    return (
+        header
+        + "\n\n".join(kept)
+        + f"\n\n[{omitted} more results left out to fit max_response_bytes]\n"
+    )
+
+
+def legacy_json(results, limit=None):
+    """The JSON formatting the search tools used before the shared formatter."""
+    hits = [
+        {field: result[field] for field in DEFAULT_RESULT_FIELDS if field in result}
+        for result in results
+    ]
+    response = {"query": "headphones", "plan": PLAN, "total": len(hits), "hits": hits}
+    text = codec.dumps(response)
+    while limit is not None and hits and len(text.encode("utf-8")) > limit:
+        hits.pop()
+        response["omitted"] = response["total"] - len(hits)
+        text = codec.dumps(response)
+    return text
+
+
+def formatted(output_format, limit=None):
+    """Format with the shared formatter, as the search tool does."""
+    return lambda results: format_results(
+        results,
+        output_format,
+        title="Search results for: headphones",
+        context={"query": "headphones"},
+        plan=PLAN,
+        byte_limit=limit,
+    )
+
+
+def per_second(func, arg, iterations):
+    """Return calls per second of func(arg)."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"JSON backend: {codec.BACKEND}; {iterations} iterations per case\n")
+    print(f"{'case':<26} {'hits':>5} {'bytes':>8} {'calls/s':>10} {'us/hit':>8}")
+
+    cases = [(name, formatted(name)) for name in OUTPUT_FORMATS]
+    cases += [
+        ("legacy text", legacy_text),
+        ("legacy json", legacy_json),
+        (f"text ({BYTE_LIMIT} byte limit)", formatted("text", BYTE_LIMIT)),
+        ("legacy text (limit)", lambda results: legacy_text(results, BYTE_LIMIT)),
+        (f"json ({BYTE_LIMIT} byte limit)", formatted("json", BYTE_LIMIT)),
+        ("legacy json (limit)", lambda results: legacy_json(results, BYTE_LIMIT)),
+    ]
+    for size in SIZES:
+        results = hits(size)
+        # The legacy JSON formatter is quadratic under a limit; keep it brief
+        runs = max(1, iterations * 10 // size)
+        for label, func in cases:
+            output = func(results)
+            rate = per_second(func, results, runs)
+            print(
+                f"{label:<26} {size:>5} {len(output.encode('utf-8')):>8} "
+                f"{rate:>10,.0f} {1e6 / rate / size:>8.2f}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark the tuned e-commerce mapping profile against the original mapping.
+
+Builds two indexes from the same synthetic catalog and times the two query
+shapes the server runs most:
+1. The planner's facet aggregations over category, brand and tags
+2. Sorted category browsing (rating desc, price asc), as in
+   search_products_by_category
+
+Usage:
+    poetry run python benchmarks/bench_mapping_profile.py [num_products] [rounds]
+"""
+
+import os
+import sys
+import time
+import statistics
+
+# Add the repository root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.catalog import CATEGORIES, generate_products, load_catalog
+from search_mcp_pkg.core import es
+from search_mcp_pkg.mappings import FACET_FIELDS, ecommerce_index_body
+
+# The mapping create_ecommerce_test_index used before profiles existed
+LEGACY_BODY = {
+    "mappings": {
+        "properties": {
+            "product_name": {"type": "text"},
+            "description": {"type": "text"},
+            "price": {"type": "float"},
+            "brand": {"type": "keyword"},
+            "category": {"type": "keyword"},
+            "rating": {"type": "float"},
+            "in_stock": {"type": "boolean"},
+            "tags": {"type": "keyword"},
+            "sku": {"type": "keyword"},
+        }
+    }
+}
+
+FACETS_QUERY = {
+    "size": 0,
+    "aggs": {field: {"terms": {"field": field, "size": 50}} for field in FACET_FIELDS},
+}
+
+
+def time_queries(index, bodies, rounds):
+    """Run each query body `rounds` times and return latencies in milliseconds."""
+    latencies = []
+    for i in range(rounds):
+        body = bodies[i % len(bodies)]
+        start = time.perf_counter()
+        es.search(index=index, body=body, request_cache=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    """Print p50/p95 for a list of latencies."""
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"  {label:<28} p50 {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms"
+    )
+
+
+def main():
+    num_products = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    browse_queries = [
+        {
+            "size": 10,
+            "query": {"bool": {"filter": [{"term": {"category": category}}]}},
+            "sort": [{"rating": {"order": "desc"}}, {"price": {"order": "asc"}}],
+            "track_total_hits": False,
+        }
+        for category in CATEGORIES
+    ]
+
+    indexes = {
+        "bench_mapping_legacy": LEGACY_BODY,
+        "bench_mapping_tuned": ecommerce_index_body(),
+    }
+
+    print(f"Indexing {num_products} synthetic products into each index...")
+    for name, body in indexes.items():
+        start = time.perf_counter()
+        load_catalog(es, name, body, num_products)
+        print(f"  {name}: {time.perf_counter() - start:.1f} s")
+
+    try:
+        for name in indexes:
+            print(f"\n{name} ({rounds} rounds)")
+            # The first aggregation after a write and refresh pays for building
+            # global ordinals unless they are loaded eagerly
+            product = next(generate_products(1, seed=num_products))
+            es.index(index=name, id="bench-refresh", document=product)
+            es.indices.refresh(index=name)
+            report("first facet aggregation", time_queries(name, [FACETS_QUERY], 1))
+            report("facet aggregations", time_queries(name, [FACETS_QUERY], rounds))
+            report("sorted category browse", time_queries(name, browse_queries, rounds))
+    finally:
+        for name in indexes:
+            es.indices.delete(index=name, ignore_unavailable=True)
+
+
+if __name__ == "__main__":
+    main()
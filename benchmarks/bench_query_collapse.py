@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-field match clauses against a single collapsed clause.
+
+Loads a large synthetic catalog into an index built with the e-commerce
+profile and times the same text queries built three ways:
+1. per-field: one match clause per search field (the original builder)
+2. multi_match: one most_fields multi_match over the search fields
+3. catch-all: one match on the copy_to catch-all field
+
+Usage:
+    poetry run python benchmarks/bench_query_collapse.py [num_products] [rounds]
+"""
+
+import os
+import sys
+import time
+import statistics
+
+# Add the repository root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.catalog import load_catalog
+from search_mcp_pkg.core import es
+from search_mcp_pkg.mappings import CATCH_ALL_FIELD, ecommerce_index_body
+
+INDEX = "bench_query_collapse"
+
+SEARCH_FIELDS = ["product_name", "description", "brand", "category"]
+
+QUERIES = [
+    "wireless headphones",
+    "ergonomic office chair",
+    "insulated water bottle for hiking",
+    "organic coffee beans",
+    "lightweight waterproof jacket",
+    "premium kitchen knife",
+    "compact speaker",
+    "eco-friendly yoga mat",
+]
+
+
+def per_field(query):
+    return {"bool": {"should": [{"match": {f: query}} for f in SEARCH_FIELDS]}}
+
+
+def multi_match(query):
+    return {
+        "bool": {
+            "should": [
+                {
+                    "multi_match": {
+                        "query": query,
+                        "fields": SEARCH_FIELDS,
+                        "type": "most_fields",
+                    }
+                }
+            ]
+        }
+    }
+
+
+def catch_all(query):
+    return {"bool": {"should": [{"match": {CATCH_ALL_FIELD: query}}]}}
+
+
+def main():
+    num_products = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+
+    print(f"Indexing {num_products} synthetic products...")
+    start = time.perf_counter()
+    load_catalog(es, INDEX, ecommerce_index_body(), num_products)
+    print(f"  done in {time.perf_counter() - start:.1f} s")
+
+    builders = {
+        "per-field": per_field,
+        "multi_match": multi_match,
+        "catch-all": catch_all,
+    }
+
+    try:
+        # Warm up caches and JIT before measuring
+        for build in builders.values():
+            for query in QUERIES:
+                es.search(index=INDEX, query=build(query), size=10)
+
+        print(f"\n{rounds} queries per builder")
+        for label, build in builders.items():
+            latencies = []
+            took = []
+            for i in range(rounds):
+                body = build(QUERIES[i % len(QUERIES)])
+                start = time.perf_counter()
+                response = es.search(
+                    index=INDEX, query=body, size=10, request_cache=False
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                took.append(response["took"])
+            latencies.sort()
+            print(
+                f"  {label:<12} p50 {statistics.median(latencies):7.2f} ms   "
+                f"p95 {latencies[int(len(latencies) * 0.95) - 1]:7.2f} ms   "
+                f"server p50 {statistics.median(took):5.1f} ms"
+            )
+    finally:
+        es.indices.delete(index=INDEX, ignore_unavailable=True)
+
+
+if __name__ == "__main__":
+    main()
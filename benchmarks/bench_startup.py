@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Benchmark server cold start.
+
+Reports the import time of each module on the startup path, measured in a
+fresh interpreter with `python -X importtime`, along with the slowest
+imports each one pulls in. Then starts run_server.py and measures the time
+until the ready message and until the first list_tools response (which
+waits for the tools to finish loading).
+
+Usage:
+    poetry run python benchmarks/bench_startup.py [rounds]
+"""
+
+import os
+import re
+import sys
+import time
+import statistics
+import subprocess
+from collections import defaultdict
+
+# Add the repository root to the Python path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from search_mcp_pkg import codec
+
+# Modules on the server's startup path, cheapest first
+MODULES = [
+    "search_mcp_pkg",
+    "search_mcp_pkg.codec",
+    "search_mcp_pkg.logging_utils",
+    "search_mcp_pkg.core",
+    "elasticsearch",
+    "openai",
+    "mcp.server.fastmcp",
+]
+
+# Number of slowest nested imports shown for each module
+TOP_IMPORTS = 5
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|( +)(\S+)")
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter and measure it.
+
+    Args:
+        module: The dotted module name
+
+    Returns:
+        The module's import time in microseconds (including its parent
+        packages) and the cumulative time of each module it imports directly,
+        or None if the import failed
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return None
+
+    # Packages a dotted import loads on the way to the module itself
+    targets = {
+        ".".join(module.split(".")[: i + 1]) for i in range(module.count(".") + 1)
+    }
+
+    total = 0
+    children = {}
+    pending = []
+    # Nested imports are listed before their parent, indented one level deeper
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, level, name = (
+            int(match.group(1)),
+            len(match.group(2)),
+            match.group(3),
+        )
+        nested = []
+        while pending and pending[-1][0] > level:
+            nested.append(pending.pop())
+        if name in targets:
+            total += cumulative
+            for _, child, child_time in nested:
+                if child not in targets:
+                    children[child] = child_time
+        pending.append((level, name, cumulative))
+    return total, children
+
+
+def report_imports(rounds):
+    """Print the median import time of each startup module."""
+    print(f"Import time, median of {rounds} fresh interpreters\n")
+    for module in MODULES:
+        totals = []
+        samples = defaultdict(list)
+        for _ in range(rounds):
+            measured = import_times(module)
+            if measured is None:
+                break
+            totals.append(measured[0])
+            for name, cumulative in measured[1].items():
+                samples[name].append(cumulative)
+
+        if not totals:
+            print(f"{module:<32} not importable")
+            continue
+
+        print(f"{module:<32} {statistics.median(totals) / 1000:8.1f} ms")
+        nested = sorted(
+            (
+                (statistics.median(values) / 1000, name)
+                for name, values in samples.items()
+            ),
+            reverse=True,
+        )
+        for elapsed, name in nested[:TOP_IMPORTS]:
+            print(f"    {name:<28} {elapsed:8.1f} ms")
+
+
+def time_server_start():
+    """
+    Start the server and time its first responses.
+
+    Returns:
+        Seconds until the ready message and until the list_tools response
+    """
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "run_server.py")],
+        cwd=ROOT,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        ready = codec.loads(proc.stdout.readline())
+        ready_at = time.perf_counter() - started
+        if ready.get("type") != "ready":
+            raise RuntimeError(f"Unexpected first message: {ready}")
+
+        proc.stdin.write(codec.dumps_bytes({"id": "1", "type": "list_tools"}) + b"\n")
+        proc.stdin.flush()
+        response = codec.loads(proc.stdout.readline())
+        tools_at = time.perf_counter() - started
+        if response.get("type") != "list_tools_response":
+            raise RuntimeError(f"Tools failed to load: {response}")
+        return ready_at, tools_at
+    finally:
+        proc.stdin.close()
+        proc.wait(timeout=30)
+
+
+def report_server_start(rounds):
+    """Print the median time until the server is ready and its tools loaded."""
+    print(f"\nServer start, median of {rounds} runs\n")
+    try:
+        timings = [time_server_start() for _ in range(rounds)]
+    except Exception as e:
+        print(f"Server did not start: {e}")
+        return
+    ready = statistics.median(t[0] for t in timings) * 1000
+    tools = statistics.median(t[1] for t in timings) * 1000
+    print(f"{'ready message':<32} {ready:8.1f} ms")
+    print(f"{'first list_tools response':<32} {tools:8.1f} ms")
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    report_imports(rounds)
+    report_server_start(rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Synthetic e-commerce catalog shared by the Elasticsearch benchmarks.
+"""
+
+import random
+from typing import Any, Dict, Iterator
+
+from elasticsearch import Elasticsearch, helpers
+from faker import Faker
+
+CATEGORIES = [
+    "Electronics",
+    "Kitchen",
+    "Sports",
+    "Furniture",
+    "Clothing",
+    "Grocery",
+    "Accessories",
+    "Toys",
+    "Beauty",
+    "Garden",
+]
+
+NOUNS = {
+    "Electronics": ["Headphones", "Earbuds", "Speaker", "Charger", "Smartwatch"],
+    "Kitchen": ["Skillet", "Knife", "Scale", "Water Bottle", "Utensil Set"],
+    "Sports": ["Yoga Mat", "Resistance Bands", "Daypack", "Dumbbells", "Jump Rope"],
+    "Furniture": ["Office Chair", "Desk", "Bookshelf", "Lamp", "Stool"],
+    "Clothing": ["T-Shirt", "Hoodie", "Jacket", "Socks", "Cap"],
+    "Grocery": ["Coffee Beans", "Green Tea", "Olive Oil", "Granola", "Honey"],
+    "Accessories": ["Wallet", "Belt", "Sunglasses", "Backpack", "Umbrella"],
+    "Toys": ["Puzzle", "Building Blocks", "Board Game", "Plush Bear", "Kite"],
+    "Beauty": ["Face Cream", "Shampoo", "Lip Balm", "Perfume", "Hair Dryer"],
+    "Garden": ["Hose", "Planter", "Pruners", "Gloves", "Bird Feeder"],
+}
+
+ADJECTIVES = [
+    "Premium",
+    "Wireless",
+    "Ergonomic",
+    "Compact",
+    "Insulated",
+    "Organic",
+    "Lightweight",
+    "Waterproof",
+    "Eco-friendly",
+    "Professional",
+]
+
+
+def generate_products(count: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    """
+    Generate a reproducible synthetic product catalog.
+
+    Args:
+        count: Number of products to generate
+        seed: Random seed, so every run indexes the same catalog
+
+    Yields:
+        Product documents shaped like the sample e-commerce index
+    """
+    fake = Faker()
+    Faker.seed(seed)
+    rng = random.Random(seed)
+    brands = [fake.unique.company().split()[0] for _ in range(200)]
+
+    for i in range(count):
+        category = rng.choice(CATEGORIES)
+        noun = rng.choice(NOUNS[category])
+        adjectives = rng.sample(ADJECTIVES, 2)
+        yield {
+            "sku": f"SKU-{i:08d}",
+            "product_name": f"{' '.join(adjectives)} {noun}",
+            "description": fake.paragraph(nb_sentences=3),
+            "price": round(rng.uniform(5, 500), 2),
+            "brand": rng.choice(brands),
+            "category": category,
+            "rating": round(rng.uniform(1, 5), 1),
+            "in_stock": rng.random() > 0.1,
+            "tags": [a.lower() for a in adjectives] + [noun.lower()],
+        }
+
+
+def load_catalog(
+    es: Elasticsearch, index: str, body: Dict[str, Any], count: int
+) -> None:
+    """
+    (Re)create an index and bulk load the synthetic catalog into it.
+
+    The index is force-merged to one segment so that runs are comparable.
+
+    Args:
+        es: The Elasticsearch client
+        index: The index to create
+        body: Settings and mappings for the index
+        count: Number of products to load
+    """
+    if es.indices.exists(index=index):
+        es.indices.delete(index=index)
+    es.indices.create(index=index, body=body)
+    helpers.bulk(
+        es,
+        (
+            {"_index": index, "_id": product["sku"], "_source": product}
+            for product in generate_products(count)
+        ),
+        chunk_size=2000,
+    )
+    es.indices.refresh(index=index)
+    es.indices.forcemerge(index=index, max_num_segments=1)
@@ -16,15 +16,21 @@ Features:
 import os
 import sys
 import json
-import time
 import subprocess
 import threading
-import select
+import time
 import re
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 import anthropic
 
+from search_mcp_pkg import codec
+from search_mcp_pkg.connection import SERVER_ADDRESS, ServerConnection
+from search_mcp_pkg.history import ConversationHistory
+from search_mcp_pkg.reader import ResponseReader
+
 # Load environment variables
 load_dotenv()
 
@@ -38,6 +44,9 @@ if parent_dir not in sys.path:
 # Define the index name
 INDEX_NAME = "ecommerce"
 
+# Most rounds of tool calls Claude can make before it has to answer
+MAX_TOOL_ROUNDS = 5
+
 # Initialize the Claude client
 claude_client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
 
@@ -48,55 +57,59 @@ class MCPClient:
     def __init__(self, server_process):
         self.server_process = server_process
         self.message_id = 0
+        self.tools = []
+        self.tools_version = None
         self.debug_mode = os.environ.get("DEBUG_MODE", "False").lower() == "true"
+        # Responses are read on a background thread and matched to requests by id
+        self.reader = ResponseReader(server_process, on_message=self._unexpected)
 
     def _get_next_id(self):
         """Get the next message ID."""
         self.message_id += 1
         return f"msg-{self.message_id}"
 
+    def _unexpected(self, message):
+        """Report a message no request is waiting for (e.g. a late response)."""
+        if self.debug_mode:
+            print(f"📥 Unmatched message: {codec.dumps(message)}")
+
+    def cancel(self, message_id):
+        """Cancel a request the server is still working on."""
+        if self.debug_mode:
+            print(f"📤 Cancelling request {message_id}")
+        try:
+            self.reader.send({"type": "cancel", "request_id": message_id})
+        except Exception as e:
+            print(f"Error cancelling request: {e}")
+
     def list_tools(self):
         """List all available tools from the MCP server."""
         message_id = self._get_next_id()
-        message = json.dumps({"id": message_id, "type": "list_tools"}) + "\n"
+        request = {"id": message_id, "type": "list_tools"}
+        if self.tools_version:
+            # Only ask for the manifest again if it changed
+            request["if_none_match"] = self.tools_version
 
         if self.debug_mode:
             print("\n🔄 Sending list_tools request to MCP server")
-            print(f"📤 Outgoing message: {message.strip()}")
+            print(f"📤 Outgoing message: {codec.dumps(request)}")
 
         try:
-            self.server_process.stdin.write(message)
-            self.server_process.stdin.flush()
-
-            # Wait for response with timeout
-            start_time = time.time()
-            timeout = 10  # seconds
-
-            while time.time() - start_time < timeout:
-                readable, _, _ = select.select(
-                    [self.server_process.stdout], [], [], 0.1
-                )
-                if readable:
-                    line = self.server_process.stdout.readline().strip()
-                    if line:
-                        if self.debug_mode:
-                            print(f"📥 Incoming response: {line}")
-
-                        try:
-                            response = json.loads(line)
-                            if (
-                                response.get("id") == message_id
-                                and response.get("type") == "list_tools_response"
-                            ):
-                                if self.debug_mode:
-                                    print(
-                                        "✅ Successfully received and parsed tools list"
-                                    )
-                                return response.get("tools", [])
-                        except json.JSONDecodeError:
-                            print(f"Error parsing response: {line}")
-                time.sleep(0.1)
-
+            response = self.reader.request(request, timeout=10)
+            if self.debug_mode:
+                print(f"📥 Incoming response: {codec.dumps(response)}")
+
+            if response.get("type") == "list_tools_response":
+                if self.debug_mode:
+                    print("✅ Successfully received and parsed tools list")
+                if not response.get("not_modified"):
+                    self.tools = response.get("tools", [])
+                    self.tools_version = response.get("version")
+                return self.tools
+
+            print(f"Error listing tools: {response.get('error')}")
+            return []
+        except TimeoutError:
             print("No response received within timeout")
             return []
         except Exception as e:
@@ -105,126 +118,176 @@ class MCPClient:
 
     def call_tool(self, tool_name, args):
         """Call a tool on the MCP server."""
+        result, _ = self.call_tools([(tool_name, args)])[0]
+        return result
+
+    def call_tools(self, calls, timeout=15):
+        """
+        Call several tools at once.
+
+        The requests are all sent before any response is awaited, so the
+        server works on them concurrently.
+
+        Args:
+            calls: (tool name, arguments) pairs
+            timeout: Seconds to wait for all of the responses
+
+        Returns:
+            A (result, seconds taken) pair per call, in call order
+        """
+        pending = [self.start_tool(tool_name, args) for tool_name, args in calls]
+        return self.finish_tools(pending, timeout)
+
+    def start_tool(self, tool_name, args, error=None):
+        """
+        Send a tool call without waiting for its response.
+
+        Args:
+            tool_name: Name of the tool to call
+            args: Arguments to pass to the tool
+            error: Fail the call with this instead of sending it
+
+        Returns:
+            The pending call, to pass to finish_tools
+        """
         message_id = self._get_next_id()
-        message = (
-            json.dumps(
-                {"id": message_id, "type": "tool_call", "tool": tool_name, "args": args}
-            )
-            + "\n"
-        )
+        request = {
+            "id": message_id,
+            "type": "tool_call",
+            "tool": tool_name,
+            "args": args,
+        }
 
         if self.debug_mode:
             print(f"\n🔄 Calling tool: {tool_name}")
             print(f"📤 Arguments: {json.dumps(args, indent=2)}")
-            print(f"📤 Outgoing message: {message.strip()}")
-
+            print(f"📤 Outgoing message: {codec.dumps(request)}")
+
+        pending = {"id": message_id, "tool": tool_name, "started": time.perf_counter()}
+        if error is None:
+            try:
+                pending["future"] = self.reader.submit(request)
+            except Exception as e:
+                error = e
+        if error is not None:
+            pending["future"] = Future()
+            pending["future"].set_exception(error)
+        # Note when the response arrives, to time the call on its own
+        pending["future"].add_done_callback(
+            lambda _: pending.setdefault("arrived", time.perf_counter())
+        )
+        return pending
+
+    def finish_tools(self, pending, timeout=15):
+        """
+        Wait for tool calls started with start_tool.
+
+        Args:
+            pending: The pending calls
+            timeout: Seconds to wait for all of the responses
+
+        Returns:
+            A (result, seconds taken) pair per call, in call order
+        """
+        deadline = time.perf_counter() + timeout
+        results = []
+        for call in pending:
+            result = self._result(call["id"], call["tool"], call["future"], deadline)
+            elapsed = call.get("arrived", time.perf_counter()) - call["started"]
+            results.append((result, elapsed))
+        return results
+
+    def _result(self, message_id, tool_name, future, deadline):
+        """Wait for the response to a tool call and get its result."""
         try:
-            self.server_process.stdin.write(message)
-            self.server_process.stdin.flush()
-
-            # Wait for response with timeout
-            start_time = time.time()
-            timeout = 15  # seconds
-
-            while time.time() - start_time < timeout:
-                readable, _, _ = select.select(
-                    [self.server_process.stdout], [], [], 0.1
-                )
-                if readable:
-                    line = self.server_process.stdout.readline().strip()
-                    if line:
-                        if self.debug_mode:
-                            print(f"📥 Incoming response: {line}")
-
-                        try:
-                            response = json.loads(line)
-                            if (
-                                response.get("id") == message_id
-                                and response.get("type") == "tool_call_response"
-                            ):
-                                result = response.get("result", "")
-
-                                # Extract and display the query plan if debug mode is on
-                                if (
-                                    self.debug_mode
-                                    and tool_name == "search"
-                                    and "Query plan:" in result
-                                ):
-                                    match = re.search(
-                                        r"Query plan:\s*\n([\s\S]*?)(?=\n\nResults:|\Z)",
-                                        result,
-                                        re.DOTALL,
-                                    )
-                                    if match:
-                                        try:
-                                            plan_text = match.group(1).strip()
-                                            print(f"📋 Query Plan: {plan_text}")
-                                        except Exception as e:
-                                            print(
-                                                f"Error displaying query plan: {str(e)}"
-                                            )
-
-                                return result
-                            elif (
-                                response.get("id") == message_id
-                                and response.get("type") == "error"
-                            ):
-                                if self.debug_mode:
-                                    print(
-                                        f"❌ Error from server: {response.get('error')}"
-                                    )
-                                return f"Error: {response.get('error')}"
-                        except json.JSONDecodeError:
-                            print(f"Error parsing response: {line}")
-                time.sleep(0.1)
-
+            response = future.result(max(0, deadline - time.perf_counter()))
+        except FutureTimeoutError:
             print("No response received within timeout")
+            # Stop the server working on a response nobody will read
+            self.cancel(message_id)
             return "No response received"
         except Exception as e:
             print(f"Error calling tool: {e}")
             return f"Error: {str(e)}"
+        finally:
+            self.reader.discard(message_id)
+
+        if self.debug_mode:
+            print(f"📥 Incoming response: {codec.dumps(response)}")
+
+        if response.get("type") == "error":
+            if self.debug_mode:
+                print(f"❌ Error from server: {response.get('error')}")
+            return f"Error: {response.get('error')}"
+
+        result = response.get("result", "")
+
+        # Extract and display the query plan if debug mode is on
+        if self.debug_mode and tool_name == "search" and "Query plan:" in result:
+            match = re.search(
+                r"Query plan:\s*\n([\s\S]*?)(?=\n\nResults:|\Z)",
+                result,
+                re.DOTALL,
+            )
+            if match:
+                try:
+                    plan_text = match.group(1).strip()
+                    print(f"📋 Query Plan: {plan_text}")
+                except Exception as e:
+                    print(f"Error displaying query plan: {str(e)}")
+
+        return result
 
 
 def start_mcp_server():
-    """Start the MCP server in a separate process."""
+    """Start the MCP server in a separate process, or connect to a shared one."""
     print("\n=== Starting MCP Server ===")
 
-    # Start the server process
-    process = subprocess.Popen(
-        [
-            "poetry",
-            "run",
-            "python",
-            os.path.join(current_dir, "run_server.py"),  # Use current directory
-        ],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1,
-    )
+    if SERVER_ADDRESS:
+        # Connect to a shared server (run_server.py --listen) instead of starting one
+        print(f"Connecting to MCP server at {SERVER_ADDRESS}...")
+        try:
+            process = ServerConnection(SERVER_ADDRESS)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not connect to MCP server: {e}")
+            return None
+    else:
+        # Start the server process
+        process = subprocess.Popen(
+            [
+                "poetry",
+                "run",
+                "python",
+                os.path.join(current_dir, "run_server.py"),  # Use current directory
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
 
-    # Monitor stderr in a separate thread
-    def capture_stderr():
-        for line in iter(process.stderr.readline, ""):
-            if (
-                "OpenAI" in line
-                or "Elasticsearch" in line
-                or "query plan" in line
-                or "ERROR" in line
-            ):
-                print(f"🖥️ SERVER: {line.strip()}")
-
-    stderr_thread = threading.Thread(target=capture_stderr)
-    stderr_thread.daemon = True
-    stderr_thread.start()
+        # Monitor stderr in a separate thread
+        def capture_stderr():
+            for line in iter(process.stderr.readline, ""):
+                if (
+                    "OpenAI" in line
+                    or "Elasticsearch" in line
+                    or "query plan" in line
+                    or "ERROR" in line
+                ):
+                    print(f"🖥️ SERVER: {line.strip()}")
+
+        stderr_thread = threading.Thread(target=capture_stderr)
+        stderr_thread.daemon = True
+        stderr_thread.start()
 
     # Wait for the ready message
     print("Waiting for server to start...")
     ready_line = process.stdout.readline().strip()
 
     try:
-        ready_json = json.loads(ready_line)
+        ready_json = codec.loads(ready_line)
         if ready_json.get("type") == "ready":
             print(f"✅ MCP server started successfully: {ready_json.get('message')}")
             return process
@@ -246,17 +309,8 @@ def initialize_catalog(client):
     """Initialize the e-commerce catalog by creating test data."""
     print("\n=== Initializing E-commerce Catalog ===")
 
-    # First, delete the existing index if it exists
-    print("Cleaning up any existing data...")
-    try:
-        result = client.call_tool(
-            "search", {"query": "DELETE_INDEX", "index": INDEX_NAME}
-        )
-        print(f"✅ {result}")
-    except Exception as e:
-        print(f"⚠️ {e}")
-
-    # Create the ecommerce test index with fresh data
+    # Build the catalog into a new index generation; the alias is swapped
+    # atomically, so there's no need to delete the live index first
     print("Creating test e-commerce catalog...")
     result = client.call_tool("create_ecommerce_test_index", {"index": INDEX_NAME})
     print(f"✅ {result}")
@@ -277,32 +331,18 @@ def claude_search_conversation(client):
     # Get tools from the MCP server
     tools = client.list_tools()
 
-    # Convert tools to Claude's format
-    claude_tools = []
-    for tool in tools:
-        # For each tool, convert its parameters to the format Claude expects
-        parameters = tool.get("parameters", {})
-        input_schema = {"type": "object", "properties": {}, "required": []}
-
-        # If parameters is a proper JSON Schema object, extract properties and required fields
-        if "properties" in parameters:
-            for param_name, param_details in parameters.get("properties", {}).items():
-                input_schema["properties"][param_name] = {
-                    "type": param_details.get("type", "string"),
-                    "description": param_details.get("description", ""),
-                }
-
-            # Add required fields if they exist
-            if "required" in parameters:
-                input_schema["required"] = parameters.get("required", [])
-
-        claude_tools.append(
-            {
-                "name": tool.get("name"),
-                "description": tool.get("description", ""),
-                "input_schema": input_schema,
-            }
-        )
+    # Convert tools to Claude's format; the server's manifest already carries
+    # each tool's JSON input schema
+    claude_tools = [
+        {
+            "name": tool.get("name"),
+            "description": tool.get("description", ""),
+            "input_schema": tool.get(
+                "input_schema", {"type": "object", "properties": {}}
+            ),
+        }
+        for tool in tools
+    ]
 
     # Set up the system prompt for Claude
     system_prompt = """You are a helpful e-commerce search assistant that can search through product data.
@@ -321,8 +361,14 @@ For follow-up questions, consider the context from previous searches.
 Always ensure that you include the 'index' parameter with value 'ecommerce' in your tool calls.
 """
 
-    # Initialize conversation without system message
-    messages = []
+    # Initialize conversation; the system prompt is sent separately, but
+    # counts against the history's token budget
+    history = ConversationHistory(system_prompt, system_message=False)
+
+    # Time saved on each turn by running its tool calls together, and the
+    # time to first token of each Claude request
+    savings = []
+    first_token_times = []
 
     # Main conversation loop
     while True:
@@ -331,6 +377,17 @@ Always ensure that you include the 'index' parameter with value 'ecommerce' in y
 
         # Check for exit command
         if user_query.lower() in ["exit", "quit", "bye"]:
+            if savings:
+                print(
+                    f"⚡ Running tools in parallel saved ~{sum(savings):.2f}s "
+                    f"over {len(savings)} turns"
+                )
+            if first_token_times:
+                print(
+                    f"⏱️ Mean time to first token: "
+                    f"{sum(first_token_times) / len(first_token_times):.2f}s "
+                    f"over {len(first_token_times)} requests"
+                )
             print(
                 "🤖 Claude: Goodbye! Thanks for using the e-commerce search assistant."
             )
@@ -341,91 +398,185 @@ Always ensure that you include the 'index' parameter with value 'ecommerce' in y
             print("🤖 Claude: I didn't catch that. Please try again.")
             continue
 
-        # Add user query to messages
-        messages.append({"role": "user", "content": user_query})
+        # Start a new turn with the user's query
+        history.add_user(user_query)
 
         try:
             print("🔍 Processing your request...")
 
-            # Call Claude with tools parameter
-            response = claude_client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1024,
-                system=system_prompt,  # Use system as a top-level parameter
-                messages=messages,
-                tools=claude_tools,
-            )
+            # Claude may ask for several tools at once; each starts as soon as
+            # its input has streamed in, they all run together, and their
+            # results go back in a single follow-up request
+            saved = 0.0
+            sequential_requests = 0
+            for round_number in range(MAX_TOOL_ROUNDS + 1):
+                request = {
+                    "model": "claude-3-opus-20240229",
+                    "max_tokens": 2048,
+                    "system": system_prompt,  # Use system as a top-level parameter
+                    "messages": history.prepare(),
+                    "tools": claude_tools,
+                }
+                if round_number == MAX_TOOL_ROUNDS:
+                    # Enough tools; make Claude answer with what it has
+                    request["tool_choice"] = {"type": "none"}
+                print(f"📏 {history.describe()}")
+
+                pending = []
+                blocks, first_token, llm_seconds = stream_claude_response(
+                    request,
+                    on_tool_use=lambda block, error: pending.append(
+                        start_tool_use(client, block, error)
+                    ),
+                )
+                if first_token is not None:
+                    first_token_times.append(first_token)
+                    print(f"⏱️ First token after {first_token:.2f}s")
+
+                # A follow-up per tool would have cost this request again for
+                # every tool after the first
+                saved += sequential_requests * llm_seconds
 
-            # Extract text content from the response
-            message_content = ""
-            tool_calls = []
-
-            # Process different content types
-            for content in response.content:
-                if hasattr(content, "text"):
-                    message_content += content.text
-                elif hasattr(content, "type") and content.type == "tool_use":
-                    # This is a tool use block
-                    tool_calls.append(
-                        {
-                            "name": content.name,
-                            "parameters": (
-                                content.input if hasattr(content, "input") else {}
-                            ),
-                        }
-                    )
-                    message_content += f"[Using tool: {content.name}]"
-
-            # Display Claude's initial response
-            print(f"\n🤖 Claude: {message_content}")
-
-            # Add Claude's response to conversation history
-            messages.append({"role": "assistant", "content": message_content})
-
-            # Handle tool calls if any
-            if tool_calls:
-                for tool_call in tool_calls:
-                    tool_name = tool_call["name"]
-                    tool_params = tool_call["parameters"]
-
-                    print(f"🔧 Claude is using the '{tool_name}' tool")
-
-                    # Ensure index parameter is set for search queries
-                    if "index" not in tool_params:
-                        tool_params["index"] = INDEX_NAME
-
-                    # Call the MCP tool
-                    tool_result = client.call_tool(tool_name, tool_params)
-
-                    # Add tool response to conversation
-                    messages.append(
-                        {"role": "user", "content": f"Tool result: {tool_result}"}
-                    )
-
-                    # Ask Claude to process the tool result
-                    final_response = claude_client.messages.create(
-                        model="claude-3-opus-20240229",
-                        max_tokens=2048,
-                        system=system_prompt,  # Use system as a top-level parameter
-                        messages=messages,
-                    )
-
-                    # Get the final response and safely extract text
-                    final_message = ""
-                    for content in final_response.content:
-                        if hasattr(content, "text"):
-                            final_message += content.text
-
-                    messages.append({"role": "assistant", "content": final_message})
-
-                    # Display the formatted response
-                    print(f"\n🤖 Claude: {final_message}")
+                history.add({"role": "assistant", "content": blocks})
+                tool_uses = [block for block in blocks if block["type"] == "tool_use"]
+                if not tool_uses:
+                    break
+
+                tool_results, tool_seconds_saved = finish_tool_uses(
+                    client, tool_uses, pending
+                )
+                history.add_tool_result(
+                    {"role": "user", "content": tool_results},
+                    ", ".join(block["name"] for block in tool_uses),
+                )
+                saved += tool_seconds_saved
+                sequential_requests = len(tool_uses) - 1
+
+            if saved:
+                savings.append(saved)
+                print(f"⚡ Parallel tool use saved ~{saved:.2f}s on this turn")
 
         except Exception as e:
             print(f"❌ Error: {str(e)}")
             print("🤖 Claude: I'm having some technical difficulties. Let's try again.")
 
 
+def stream_claude_response(request, on_tool_use):
+    """
+    Stream a Claude response, printing its text as it arrives.
+
+    Each tool_use block is handed to `on_tool_use` as soon as its input has
+    streamed in, so the tool can start while Claude is still writing.
+
+    Args:
+        request: The arguments for messages.create
+        on_tool_use: Called with each complete tool_use block and, if its
+            input didn't parse, the error (otherwise None)
+
+    Returns:
+        The response's text and tool_use blocks as message content, the
+        seconds to the first token (None if nothing was streamed), and the
+        seconds the whole response took
+    """
+    started = time.perf_counter()
+    first_token = None
+    blocks = {}
+    tool_inputs = {}
+    printing = False
+    for event in claude_client.messages.create(**request, stream=True):
+        if event.type == "content_block_start":
+            block = event.content_block
+            if block.type == "text":
+                blocks[event.index] = {"type": "text", "text": ""}
+            elif block.type == "tool_use":
+                blocks[event.index] = {
+                    "type": "tool_use",
+                    "id": block.id,
+                    "name": block.name,
+                    "input": {},
+                }
+                tool_inputs[event.index] = ""
+        elif event.type == "content_block_delta":
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            if event.delta.type == "text_delta":
+                if not printing:
+                    print("\n🤖 Claude: ", end="")
+                    printing = True
+                print(event.delta.text, end="", flush=True)
+                blocks[event.index]["text"] += event.delta.text
+            elif event.delta.type == "input_json_delta":
+                tool_inputs[event.index] += event.delta.partial_json
+        elif event.type == "content_block_stop" and event.index in tool_inputs:
+            block = blocks[event.index]
+            error = None
+            try:
+                block["input"] = json.loads(tool_inputs[event.index] or "{}")
+            except json.JSONDecodeError as e:
+                # Cut off or malformed; the call fails and Claude is told why
+                error = ValueError(f"Invalid tool input: {e}")
+            if printing:
+                # End the streamed text before the tool reports itself
+                print()
+                printing = False
+            on_tool_use(block, error)
+    if printing:
+        print()
+    content = [blocks[index] for index in sorted(blocks)]
+    return content, first_token, time.perf_counter() - started
+
+
+def start_tool_use(client, tool_use, error=None):
+    """
+    Start the MCP call for a tool_use block; returns the pending call.
+
+    With an error (its input didn't parse), the call fails with it instead
+    of being sent, so it reaches Claude as an error tool_result.
+    """
+    print(f"🔧 Claude is using the '{tool_use['name']}' tool")
+    params = dict(tool_use["input"])
+    # Ensure index parameter is set for search queries
+    if "index" not in params:
+        params["index"] = INDEX_NAME
+    return client.start_tool(tool_use["name"], params, error)
+
+
+def finish_tool_uses(client, tool_uses, pending):
+    """
+    Wait for the tool calls of one Claude response.
+
+    Args:
+        client: The MCP client
+        tool_uses: The response's tool_use blocks
+        pending: Their pending MCP calls, from start_tool_use
+
+    Returns:
+        The tool_result blocks answering them, and the seconds saved compared
+        to running the calls one after another once the response was done
+    """
+    started = time.perf_counter()
+    results = client.finish_tools(pending)
+    waited = time.perf_counter() - started
+    sequential = sum(seconds for _, seconds in results)
+    if len(tool_uses) > 1:
+        print(
+            f"⏱️ Ran {len(tool_uses)} tools, waiting {waited:.2f}s after the "
+            f"response ({sequential:.2f}s one after another)"
+        )
+
+    tool_results = []
+    for tool_use, (result, _) in zip(tool_uses, results):
+        block = {
+            "type": "tool_result",
+            "tool_use_id": tool_use["id"],
+            "content": result,
+        }
+        if result.startswith("Error:") or result == "No response received":
+            block["is_error"] = True
+        tool_results.append(block)
+    return tool_results, max(0.0, sequential - waited)
+
+
 def main():
     """Run the Claude Search MCP Integration demo."""
     print("=== Claude Search MCP Integration Demo ===")
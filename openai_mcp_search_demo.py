@@ -14,18 +14,22 @@ This script demonstrates all steps of the process:
 import os
 import sys
 import json
-import time
 import subprocess
 import threading
-import select
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
-import re
 from openai import OpenAI
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 import asyncio
 from contextlib import AsyncExitStack
 
+from search_mcp_pkg import codec
+from search_mcp_pkg.connection import SERVER_ADDRESS, ServerConnection
+from search_mcp_pkg.history import ConversationHistory
+from search_mcp_pkg.reader import ResponseReader
+
 # Load environment variables
 load_dotenv()
 
@@ -39,6 +43,9 @@ if parent_dir not in sys.path:
 # Define the index name
 INDEX_NAME = "ecommerce"
 
+# Search results are requested as JSON with just the fields shown to the user
+SEARCH_FIELDS = ["product_name", "brand", "price", "rating", "description"]
+
 # Initialize the LLM client
 llm_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
@@ -49,55 +56,59 @@ class MCPClient:
     def __init__(self, server_process):
         self.server_process = server_process
         self.message_id = 0
+        self.tools = []
+        self.tools_version = None
         self.debug_mode = True  # Enable debug mode to see detailed steps
+        # Responses are read on a background thread and matched to requests by id
+        self.reader = ResponseReader(server_process, on_message=self._unexpected)
 
     def _get_next_id(self):
         """Get the next message ID."""
         self.message_id += 1
         return f"msg-{self.message_id}"
 
+    def _unexpected(self, message):
+        """Report a message no request is waiting for (e.g. a late response)."""
+        if self.debug_mode:
+            print(f"📥 Unmatched message: {codec.dumps(message)}")
+
+    def cancel(self, message_id):
+        """Cancel a request the server is still working on."""
+        if self.debug_mode:
+            print(f"📤 Cancelling request {message_id}")
+        try:
+            self.reader.send({"type": "cancel", "request_id": message_id})
+        except Exception as e:
+            print(f"Error cancelling request: {e}")
+
     def list_tools(self):
         """List all available tools from the MCP server."""
         message_id = self._get_next_id()
-        message = json.dumps({"id": message_id, "type": "list_tools"}) + "\n"
+        request = {"id": message_id, "type": "list_tools"}
+        if self.tools_version:
+            # Only ask for the manifest again if it changed
+            request["if_none_match"] = self.tools_version
 
         if self.debug_mode:
             print("\n🔄 STEP: Sending list_tools request to MCP server")
-            print(f"📤 Outgoing message: {message.strip()}")
+            print(f"📤 Outgoing message: {codec.dumps(request)}")
 
         try:
-            self.server_process.stdin.write(message)
-            self.server_process.stdin.flush()
-
-            # Wait for response with timeout
-            start_time = time.time()
-            timeout = 10  # seconds
-
-            while time.time() - start_time < timeout:
-                readable, _, _ = select.select(
-                    [self.server_process.stdout], [], [], 0.1
-                )
-                if readable:
-                    line = self.server_process.stdout.readline().strip()
-                    if line:
-                        if self.debug_mode:
-                            print(f"📥 Incoming response: {line}")
-
-                        try:
-                            response = json.loads(line)
-                            if (
-                                response.get("id") == message_id
-                                and response.get("type") == "list_tools_response"
-                            ):
-                                if self.debug_mode:
-                                    print(
-                                        "✅ Successfully received and parsed tools list"
-                                    )
-                                return response.get("tools", [])
-                        except json.JSONDecodeError:
-                            print(f"Error parsing response: {line}")
-                time.sleep(0.1)
-
+            response = self.reader.request(request, timeout=10)
+            if self.debug_mode:
+                print(f"📥 Incoming response: {codec.dumps(response)}")
+
+            if response.get("type") == "list_tools_response":
+                if self.debug_mode:
+                    print("✅ Successfully received and parsed tools list")
+                if not response.get("not_modified"):
+                    self.tools = response.get("tools", [])
+                    self.tools_version = response.get("version")
+                return self.tools
+
+            print(f"Error listing tools: {response.get('error')}")
+            return []
+        except TimeoutError:
             print("No response received within timeout")
             return []
         except Exception as e:
@@ -107,12 +118,12 @@ class MCPClient:
     def call_tool(self, tool_name, args):
         """Call a tool on the MCP server with detailed step logging."""
         message_id = self._get_next_id()
-        message = (
-            json.dumps(
-                {"id": message_id, "type": "tool_call", "tool": tool_name, "args": args}
-            )
-            + "\n"
-        )
+        request = {
+            "id": message_id,
+            "type": "tool_call",
+            "tool": tool_name,
+            "args": args,
+        }
 
         # Always print steps 1-3 for clarity
         print(f"\n🔄 STEP 1: LLM decides to use the '{tool_name}' tool")
@@ -122,152 +133,101 @@ class MCPClient:
         print(f"🔄 STEP 3: Sending message to MCP server")
 
         if self.debug_mode:
-            print(f"📤 Outgoing message: {message.strip()}")
+            print(f"📤 Outgoing message: {codec.dumps(request)}")
 
         try:
-            self.server_process.stdin.write(message)
-            self.server_process.stdin.flush()
-
-            # Wait for response with timeout
-            start_time = time.time()
-            timeout = 15  # seconds
-
-            while time.time() - start_time < timeout:
-                readable, _, _ = select.select(
-                    [self.server_process.stdout], [], [], 0.1
-                )
-                if readable:
-                    line = self.server_process.stdout.readline().strip()
-                    if line:
-                        # Always print step 6
-                        print(f"🔄 STEP 6: Receiving response from MCP server")
-
-                        if self.debug_mode:
-                            print(f"📥 Incoming response: {line}")
-
-                        try:
-                            response = json.loads(line)
-                            if (
-                                response.get("id") == message_id
-                                and response.get("type") == "tool_call_response"
-                            ):
-                                result = response.get("result", "")
-
-                                # Extract and display the query plan
-                                if tool_name == "search" and "Query plan:" in result:
-                                    # Always print step 4
-                                    print("\n🔄 STEP 4: OpenAI generated a query plan")
-
-                                    # Combined approach to extract query plan - handle both formats
-                                    plan_found = False
-
-                                    # Try the format with newlines first (most common case)
-                                    match = re.search(
-                                        r"Query plan:\s*\n([\s\S]*?)(?=\n\nResults:|\Z)",
-                                        result,
-                                        re.DOTALL,
-                                    )
-                                    if match:
-                                        try:
-                                            plan_text = match.group(1).strip()
-                                            print(f"📋 Query Plan: {plan_text}")
-                                            print(
-                                                "\n🔄 STEP 5: Elasticsearch executed the search based on the query plan"
-                                            )
-                                            plan_found = True
-                                        except Exception as e:
-                                            print(
-                                                f"Error displaying query plan: {str(e)}"
-                                            )
-
-                                    # If we still didn't find it, try the inline format
-                                    if not plan_found:
-                                        match = re.search(
-                                            r"Query plan: (\{.*\})", result, re.DOTALL
-                                        )
-                                        if match:
-                                            try:
-                                                query_plan = json.loads(match.group(1))
-                                                print(
-                                                    f"📋 Query Plan: {json.dumps(query_plan, indent=2)}"
-                                                )
-                                                print(
-                                                    "\n🔄 STEP 5: Elasticsearch executed the search based on the query plan"
-                                                )
-                                                plan_found = True
-                                            except json.JSONDecodeError:
-                                                print(
-                                                    f"Could not parse query plan: {match.group(1)}"
-                                                )
-
-                                    # If we still couldn't find a plan, print step 5 anyway
-                                    if not plan_found:
-                                        print(
-                                            "\n🔄 STEP 5: Elasticsearch executed the search (query plan not displayed)"
-                                        )
-
-                                # Always print step 7
-                                print(
-                                    "🔄 STEP 7: Client parses the response and returns it to the LLM"
-                                )
-
-                                return result
-                            elif (
-                                response.get("id") == message_id
-                                and response.get("type") == "error"
-                            ):
-                                if self.debug_mode:
-                                    print(
-                                        f"❌ Error from server: {response.get('error')}"
-                                    )
-                                return f"Error: {response.get('error')}"
-                        except json.JSONDecodeError:
-                            print(f"Error parsing response: {line}")
-                time.sleep(0.1)
-
+            response = self.reader.request(request, timeout=15)
+        except TimeoutError:
             print("No response received within timeout")
+            # Stop the server working on a response nobody will read
+            self.cancel(message_id)
             return "No response received"
         except Exception as e:
             print(f"Error calling tool: {e}")
             return f"Error: {str(e)}"
 
+        # Always print step 6
+        print(f"🔄 STEP 6: Receiving response from MCP server")
+
+        if self.debug_mode:
+            print(f"📥 Incoming response: {codec.dumps(response)}")
+
+        if response.get("type") == "error":
+            if self.debug_mode:
+                print(f"❌ Error from server: {response.get('error')}")
+            return f"Error: {response.get('error')}"
+
+        result = response.get("result", "")
+
+        # Search results requested as JSON carry the query plan as a field
+        if tool_name == "search" and args.get("output_format") == "json":
+            try:
+                plan = json.loads(result).get("plan")
+            except (json.JSONDecodeError, AttributeError):
+                plan = None
+            if plan:
+                # Always print step 4
+                print("\n🔄 STEP 4: OpenAI generated a query plan")
+                print(f"📋 Query Plan: {json.dumps(plan, indent=2)}")
+                print(
+                    "\n🔄 STEP 5: Elasticsearch executed the search based on the query plan"
+                )
+            else:
+                print(
+                    "\n🔄 STEP 5: Elasticsearch executed the search (query plan not displayed)"
+                )
+
+        # Always print step 7
+        print("🔄 STEP 7: Client parses the response and returns it to the LLM")
+
+        return result
+
 
 def start_mcp_server():
-    """Start the MCP server in a separate process."""
+    """Start the MCP server in a separate process, or connect to a shared one."""
     print("\n=== Starting MCP Server ===")
 
-    # Start the server process
-    process = subprocess.Popen(
-        ["poetry", "run", "python", "run_server.py"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1,
-    )
+    if SERVER_ADDRESS:
+        # Connect to a shared server (run_server.py --listen) instead of starting one
+        print(f"Connecting to MCP server at {SERVER_ADDRESS}...")
+        try:
+            process = ServerConnection(SERVER_ADDRESS)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not connect to MCP server: {e}")
+            return None
+    else:
+        # Start the server process
+        process = subprocess.Popen(
+            ["poetry", "run", "python", "run_server.py"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
 
-    # Monitor stderr in a separate thread
-    def capture_stderr():
-        for line in iter(process.stderr.readline, ""):
-            # Only print server logs if they contain interesting information
-            if (
-                "OpenAI" in line
-                or "Elasticsearch" in line
-                or "query plan" in line
-                or "ERROR" in line
-            ):
-                print(f"🖥️ SERVER: {line.strip()}")
-
-    stderr_thread = threading.Thread(target=capture_stderr)
-    stderr_thread.daemon = True
-    stderr_thread.start()
+        # Monitor stderr in a separate thread
+        def capture_stderr():
+            for line in iter(process.stderr.readline, ""):
+                # Only print server logs if they contain interesting information
+                if (
+                    "OpenAI" in line
+                    or "Elasticsearch" in line
+                    or "query plan" in line
+                    or "ERROR" in line
+                ):
+                    print(f"🖥️ SERVER: {line.strip()}")
+
+        stderr_thread = threading.Thread(target=capture_stderr)
+        stderr_thread.daemon = True
+        stderr_thread.start()
 
     # Wait for the ready message
     print("Waiting for server to start...")
     ready_line = process.stdout.readline().strip()
 
     try:
-        ready_json = json.loads(ready_line)
+        ready_json = codec.loads(ready_line)
         if ready_json.get("type") == "ready":
             print(f"✅ MCP server started successfully: {ready_json.get('message')}")
             return process
@@ -292,39 +252,16 @@ def format_search_results(query, result):
     """
     print("\n🔄 STEP 8: LLM formats and presents the results to the user")
 
-    # Extract full query plan if available
-    query_plan_explanation = ""
-    full_query_plan = {}
-
-    # Always extract the query plan from the result
-    if "Query plan:" in result:
-        # Extract the full query plan JSON
-        query_plan_match = re.search(
-            r"Query plan:\s*\n(.*?)(?=\n\nResults:|\Z)", result, re.DOTALL
-        )
-
-        if query_plan_match:
-            try:
-                plan_text = query_plan_match.group(1).strip()
-                full_query_plan = json.loads(plan_text)
-            except Exception as e:
-                print(f"Error parsing full query plan: {str(e)}")
-                # Try fallback pattern
-                try:
-                    plan_text = re.sub(r"\s+", " ", plan_text)
-                    full_query_plan_str = re.search(r"\{.*\}", plan_text)
-                    if full_query_plan_str:
-                        full_query_plan = json.loads(full_query_plan_str.group(0))
-                except Exception as e2:
-                    print(f"Fallback parsing also failed: {str(e2)}")
-
-        # Get the explanation separately (as fallback)
-        expl_match = re.search(r'"explanation":\s*"([^"]*)"', result, re.DOTALL)
-        if expl_match:
-            query_plan_explanation = expl_match.group(1)
+    # The search was asked for JSON, so the plan and products are fields
+    try:
+        data = json.loads(result)
+    except json.JSONDecodeError:
+        return f"I searched for '{query}' but couldn't read the results: {result[:200]}"
+    query_plan_explanation = (data.get("plan") or {}).get("explanation", "")
+    products = data.get("hits", [])
 
     # Check if products were found
-    if "No products found" in result:
+    if not products:
         response = f"I searched for '{query}' but couldn't find any matching products. "
         if query_plan_explanation:
             response += (
@@ -332,77 +269,31 @@ def format_search_results(query, result):
             )
         return response
 
-    # Extract product information if available
-    products = []
-    product_sections = re.findall(
-        r"Product \d+:(.*?)(?=Product \d+:|$)", result, re.DOTALL
-    )
-
-    for section in product_sections:
-        product = {}
-        name_match = re.search(r"Name: (.*?)(?:\n|$)", section)
-        if name_match:
-            product["name"] = name_match.group(1).strip()
-
-        price_match = re.search(r"Price: \$([\d.]+)", section)
-        if price_match:
-            product["price"] = float(price_match.group(1))
-
-        brand_match = re.search(r"Brand: (.*?)(?:\n|$)", section)
-        if brand_match:
-            product["brand"] = brand_match.group(1).strip()
-
-        rating_match = re.search(r"Rating: ([\d.]+)/5", section)
-        if rating_match:
-            product["rating"] = float(rating_match.group(1))
-
-        description_match = re.search(r"Description: (.*?)(?:\n|$)", section)
-        if description_match:
-            product["description"] = description_match.group(1).strip()
-
-        if product:
-            products.append(product)
-
     # Format a natural language response
-    if products:
-        response = f"Based on your search for '{query}', I found {len(products)} relevant products:\n\n"
-
-        # Add separator line for clarity
+    response = f"Based on your search for '{query}', I found {len(products)} relevant products:\n\n"
+
+    # Add separator line for clarity
+    response += "-" * 60 + "\n"
+
+    for i, product in enumerate(products, 1):
+        response += f"{i}. {product.get('product_name', 'Unknown Product')}\n"
+        response += f"   Brand: {product.get('brand', 'Unknown Brand')}\n"
+        response += f"   Price: ${float(product.get('price') or 0):.2f}\n"
+        response += f"   Rating: {product.get('rating', 0)}/5\n"
+        if product.get("description"):
+            response += f"   {product['description'][:150]}\n"
         response += "-" * 60 + "\n"
 
-        for i, product in enumerate(products, 1):
-            response += f"{i}. {product.get('name', 'Unknown Product')}\n"
-            response += f"   Brand: {product.get('brand', 'Unknown Brand')}\n"
-            response += f"   Price: ${product.get('price', 0):.2f}\n"
-            response += f"   Rating: {product.get('rating', 0)}/5\n"
-            if "description" in product:
-                response += f"   {product['description']}\n"
-            response += "-" * 60 + "\n"
-
-        return response
-    else:
-        return f"I searched for '{query}' but couldn't extract product details from the results."
+    return response
 
 
 def simulate_enhanced_llm_conversation(client):
     """Simulate a conversation with an LLM using the MCP tools with detailed steps."""
     print("\n=== Enhanced LLM Conversation Simulation ===")
 
-    # First, delete the existing index if it exists
-    print("\n🤖 LLM: Let me first clean up any existing data...")
-    try:
-        # We'll use a direct Elasticsearch call through the search tool with a special command
-        result = client.call_tool(
-            "search", {"query": "DELETE_INDEX", "index": INDEX_NAME}
-        )
-        print(f"🤖 LLM: {result}")
-    except Exception as e:
-        print(
-            f"🤖 LLM: Note: Could not delete existing index. This is fine if it doesn't exist yet. Error: {e}"
-        )
-
-    # Create the ecommerce test index with fresh data
-    print("\n🤖 LLM: Now I'll create a fresh set of product data to search...")
+    # Create the ecommerce test index with fresh data. It is built into a new
+    # index generation and swapped in atomically, so the live index is never deleted
+    print("\n🤖 LLM: Let me create a fresh set of product data to search...")
     result = client.call_tool("create_ecommerce_test_index", {"index": INDEX_NAME})
     print(f"🤖 LLM: {result}")
 
@@ -436,7 +327,15 @@ def simulate_enhanced_llm_conversation(client):
         print(f"🤖 LLM: I'll search for that information for you...")
 
         # Call the search tool
-        result = client.call_tool("search", {"query": query, "index": INDEX_NAME})
+        result = client.call_tool(
+            "search",
+            {
+                "query": query,
+                "index": INDEX_NAME,
+                "output_format": "json",
+                "fields": SEARCH_FIELDS,
+            },
+        )
 
         # Format and present results like an LLM would
         formatted_response = format_search_results(query, result)
@@ -451,21 +350,9 @@ def real_llm_conversation(client):
     print("\n=== Real LLM Conversation (Hybrid Mode) ===")
     print("This demonstrates how LLMs can integrate with MCP using a hybrid approach.")
 
-    # First, delete the existing index if it exists
+    # Create the ecommerce test index with fresh data (swapped in atomically)
     print("\n[1] INITIALIZING DATA")
-    print("🤖 LLM: Let me clean up any existing data...")
-    try:
-        # Use direct search call
-        result = client.call_tool(
-            "search", {"query": "DELETE_INDEX", "index": INDEX_NAME}
-        )
-        print(f"✅ {result}")
-    except Exception as e:
-        print(f"⚠️ {e}")
-        print("Continuing with potentially existing data...")
-
-    # Create the ecommerce test index with fresh data
-    print("\n🤖 LLM: Setting up product catalog...")
+    print("🤖 LLM: Setting up product catalog...")
     result = client.call_tool("create_ecommerce_test_index", {"index": INDEX_NAME})
     print(f"✅ {result}")
 
@@ -478,42 +365,18 @@ def real_llm_conversation(client):
         print("❌ No tools available from MCP. Exiting.")
         return
 
-    # Convert MCP tools to OpenAI function format
-    openai_functions = []
-    for tool in tools:
-        # For the search tool, ensure our schema explicitly includes the index parameter
-        if tool.get("name") == "search":
-            openai_functions.append(
-                {
-                    "name": "search",
-                    "description": tool.get("description", ""),
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "query": {
-                                "type": "string",
-                                "description": "The search query (supports natural language queries like 'red shoes under $50')",
-                            },
-                            "index": {
-                                "type": "string",
-                                "description": "The Elasticsearch index to search",
-                                "default": INDEX_NAME,
-                            },
-                        },
-                        "required": ["query"],
-                    },
-                }
-            )
-        else:
-            openai_functions.append(
-                {
-                    "name": tool.get("name"),
-                    "description": tool.get("description", ""),
-                    "parameters": tool.get(
-                        "parameters", {"type": "object", "properties": {}}
-                    ),
-                }
-            )
+    # Convert MCP tools to OpenAI function format; the server's manifest
+    # already carries each tool's JSON input schema
+    openai_functions = [
+        {
+            "name": tool.get("name"),
+            "description": tool.get("description", ""),
+            "parameters": tool.get(
+                "input_schema", {"type": "object", "properties": {}}
+            ),
+        }
+        for tool in tools
+    ]
 
     print(f"✅ Discovered {len(tools)} MCP tools")
 
@@ -522,14 +385,26 @@ def real_llm_conversation(client):
     print("\n=== Interactive Mode with Real LLM ===")
     print("Type your product queries below. Type 'exit', 'quit', or 'bye' to end.")
 
-    conversation_history = []  # Keep conversation context
+    # Keep conversation context, compacted to a token budget before each request
+    history = ConversationHistory()
+
+    # Tool calls run here, so they can start while the LLM is still streaming
+    tool_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mcp-tool")
+    first_token_times = []
 
     while True:
         try:
             # Get user input
             user_query = input("\n📱 User: ")
             if user_query.lower() in ["exit", "quit", "bye"]:
+                if first_token_times:
+                    print(
+                        f"⏱️ Mean time to first token: "
+                        f"{sum(first_token_times) / len(first_token_times):.2f}s "
+                        f"over {len(first_token_times)} requests"
+                    )
                 print("🤖 LLM: Goodbye! Thanks for chatting.")
+                tool_executor.shutdown()
                 break
 
             if not user_query.strip():
@@ -539,90 +414,93 @@ def real_llm_conversation(client):
             print("🤖 LLM: Processing your request...")
 
             # Step 1: Update conversation history with user query
-            conversation_history.append({"role": "user", "content": user_query})
+            history.add_user(user_query)
 
-            # Step 2: Ask LLM to decide which function to call
+            # Step 2: Ask LLM to decide which function to call; the call
+            # starts as soon as its arguments have streamed in
             print("\n[4] LLM DECIDES ON TOOL USE")
-            llm_response = llm_client.chat.completions.create(
-                model="gpt-4",
-                messages=conversation_history,
-                functions=openai_functions,
-                function_call="auto",
-            )
+            tool_call = {}
+
+            def start_tool_call(function_name, function_args):
+                function_args = prepare_tool_args(function_name, function_args)
+                tool_call["name"] = function_name
+                tool_call["args"] = function_args
+                tool_call["future"] = tool_executor.submit(
+                    client.call_tool, function_name, function_args
+                )
 
-            # Get LLM's response
-            message = llm_response.choices[0].message
-            conversation_history.append(message)
+            message, first_token = stream_completion(
+                {
+                    "model": "gpt-4",
+                    "messages": history.prepare(),
+                    "functions": openai_functions,
+                    "function_call": "auto",
+                },
+                on_function_call=start_tool_call,
+            )
+            print(f"📏 {history.describe()}")
+            report_first_token(first_token, first_token_times)
+            history.add(message)
+
+            if "function_call" in message and not tool_call:
+                # The arguments didn't parse, so no call was started; the
+                # error goes back to the LLM as the function's result
+                tool_call["name"] = message["function_call"]["name"]
+                tool_call["args"] = {}
+                tool_call["future"] = Future()
+                tool_call["future"].set_exception(
+                    ValueError("Invalid function arguments: not complete JSON")
+                )
 
             # Print the raw OpenAI response to see what it contains
             print("\n📋 RAW OPENAI RESPONSE (DECISION MAKING)")
             print("-" * 50)
-            if hasattr(message, "content") and message.content:
-                print(f"Content: {message.content}")
-            if hasattr(message, "function_call"):
-                print(f"Function Call: {message.function_call}")
-                if hasattr(message.function_call, "name"):
-                    print(f"Tool Selected: {message.function_call.name}")
-                if hasattr(message.function_call, "arguments"):
-                    print(f"Parameters: {message.function_call.arguments}")
+            if message["content"]:
+                print(f"Content: {message['content']}")
+            if "function_call" in message:
+                print(f"Tool Selected: {message['function_call']['name']}")
+                print(f"Parameters: {message['function_call']['arguments']}")
             print("-" * 50)
 
             # Check if LLM wants to call a function
-            if hasattr(message, "function_call") and message.function_call:
-                # Extract function details
-                function_name = message.function_call.name
-                function_args = json.loads(message.function_call.arguments)
-
-                # Ensure index parameter is set for search queries
-                if function_name == "search" and "index" not in function_args:
-                    function_args["index"] = INDEX_NAME
-                    print("⚠️ Adding missing index parameter to search query")
-
+            if tool_call:
+                function_name = tool_call["name"]
+                function_args = tool_call["args"]
                 print(f"✅ LLM decided to use: {function_name}")
                 print(f"   with arguments: {json.dumps(function_args, indent=2)}")
 
-                # Step 3: Call the MCP tool using our reliable direct client
+                # Step 3: The MCP tool call was started while the LLM was streaming
                 print("\n[5] EXECUTING MCP TOOL CALL")
                 print(f"Calling MCP tool: {function_name}...")
 
                 try:
                     # Use the reliable direct client instead of async session
-                    result = client.call_tool(function_name, function_args)
-
-                    # For search specifically, extract and show query plan
-                    if function_name == "search" and "Query plan:" in result:
-                        print("\n[6] SEARCH QUERY PLANNING")
+                    result = tool_call["future"].result()
 
-                        match = re.search(
-                            r"Query plan:\s*\n([\s\S]*?)(?=\n\nResults:|\Z)",
-                            result,
-                            re.DOTALL,
-                        )
-                        if match:
-                            plan_text = match.group(1).strip()
-                            print(f"   Query Plan: {plan_text}")
+                    # For search specifically, show the query plan
+                    if function_name == "search" and result.startswith("{"):
+                        plan = json.loads(result).get("plan")
+                        if plan:
+                            print("\n[6] SEARCH QUERY PLANNING")
+                            print(f"   Query Plan: {json.dumps(plan)}")
 
                     print("\n[7] PROCESSING MCP RESPONSE")
                     print("✅ MCP tool execution complete")
 
                     # Step 4: Add tool response to conversation history
-                    conversation_history.append(
-                        {"role": "function", "name": function_name, "content": result}
+                    history.add_tool_result(
+                        {"role": "function", "name": function_name, "content": result},
+                        function_name,
                     )
 
-                    # Step 5: Ask LLM to generate a final response
+                    # Step 5: Ask LLM to generate a final response, streamed
                     print("\n[8] LLM GENERATES FINAL RESPONSE")
-                    final_response = llm_client.chat.completions.create(
-                        model="gpt-4",
-                        messages=conversation_history,
+                    final_message, first_token = stream_completion(
+                        {"model": "gpt-4", "messages": history.prepare()}
                     )
-
-                    # Get the final response
-                    final_message = final_response.choices[0].message
-                    conversation_history.append(final_message)
-
-                    # Display the final response
-                    print(f"\n🤖 LLM: {final_message.content}")
+                    print(f"📏 {history.describe()}")
+                    report_first_token(first_token, first_token_times)
+                    history.add(final_message)
 
                 except Exception as e:
                     print(f"❌ Error calling MCP tool: {str(e)}")
@@ -631,7 +509,7 @@ def real_llm_conversation(client):
                     )
 
                     # Add error to conversation for LLM context
-                    conversation_history.append(
+                    history.add(
                         {
                             "role": "function",
                             "name": function_name,
@@ -640,24 +518,104 @@ def real_llm_conversation(client):
                     )
 
                     # Let LLM generate a response despite the error
-                    error_response = llm_client.chat.completions.create(
-                        model="gpt-4",
-                        messages=conversation_history,
+                    error_message, first_token = stream_completion(
+                        {"model": "gpt-4", "messages": history.prepare()}
                     )
-
-                    error_message = error_response.choices[0].message
-                    conversation_history.append(error_message)
-                    print(f"\n🤖 LLM: {error_message.content}")
+                    report_first_token(first_token, first_token_times)
+                    history.add(error_message)
             else:
-                # LLM chose to answer directly
+                # LLM chose to answer directly (its answer was streamed above)
                 print("✅ LLM decided to answer directly without using a tool")
-                print(f"\n🤖 LLM: {message.content}")
 
         except Exception as e:
             print(f"❌ Error in conversation loop: {str(e)}")
             print("🤖 LLM: I'm having some technical difficulties. Let's try again.")
 
 
+def stream_completion(request, on_function_call=None):
+    """
+    Stream a chat completion, printing its text as it arrives.
+
+    If the model calls a function, `on_function_call` is called with the
+    function's name and arguments as soon as the arguments form a complete
+    JSON object, so the call can start before the stream ends. It isn't
+    called for arguments that never parse (e.g. a cut-off response).
+
+    Args:
+        request: The arguments for chat.completions.create
+        on_function_call: Called with the function name and parsed arguments
+
+    Returns:
+        The assistant message as a dict, and the seconds to the first token
+        (None if nothing was streamed)
+    """
+    started = time.perf_counter()
+    first_token = None
+    content = ""
+    name = ""
+    arguments = ""
+    called = False
+    for chunk in llm_client.chat.completions.create(**request, stream=True):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if first_token is None and (delta.content or delta.function_call):
+            first_token = time.perf_counter() - started
+        if delta.content:
+            if not content:
+                print("\n🤖 LLM: ", end="")
+            print(delta.content, end="", flush=True)
+            content += delta.content
+        if delta.function_call:
+            name += delta.function_call.name or ""
+            arguments += delta.function_call.arguments or ""
+            # A top-level JSON object is complete once it parses
+            if on_function_call and not called and arguments.rstrip().endswith("}"):
+                try:
+                    parsed = json.loads(arguments)
+                except json.JSONDecodeError:
+                    continue
+                called = True
+                on_function_call(name, parsed)
+    if content:
+        print()
+    if name and on_function_call and not called:
+        try:
+            parsed = json.loads(arguments or "{}")
+        except json.JSONDecodeError as e:
+            # Cut off or malformed; the message's function_call shows it
+            print(f"⚠️ Could not parse the {name} arguments: {e}")
+        else:
+            on_function_call(name, parsed)
+
+    message = {"role": "assistant", "content": content or None}
+    if name:
+        message["function_call"] = {"name": name, "arguments": arguments}
+    return message, first_token
+
+
+def report_first_token(first_token, first_token_times):
+    """Print and record a request's time to first token."""
+    if first_token is not None:
+        first_token_times.append(first_token)
+        print(f"⏱️ First token after {first_token:.2f}s")
+
+
+def prepare_tool_args(function_name, function_args):
+    """Fill in the arguments the demo always wants for a tool call."""
+    function_args = dict(function_args)
+
+    # Ensure index parameter is set for search queries
+    if function_name == "search" and "index" not in function_args:
+        function_args["index"] = INDEX_NAME
+        print("⚠️ Adding missing index parameter to search query")
+
+    # Have search tools answer with compact JSON instead of prose
+    if function_name.startswith("search"):
+        function_args.setdefault("output_format", "json")
+    return function_args
+
+
 def main():
     """Run the enhanced LLM integration demo."""
     print("=== Enhanced Search MCP LLM Integration Demo ===")
@@ -9,9 +9,16 @@ This version fixes all the identified issues:
 
 import os
 import sys
+import argparse
 import traceback
 import asyncio
+import functools
+import hashlib
 import json
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Redirect stdout to stderr temporarily to avoid polluting the JSON communication
 original_stdout = sys.stdout
@@ -24,220 +31,1254 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
     print(f"Added {parent_dir} to Python path")
 
-# Set up logging to stderr
 import logging
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
 logger = logging.getLogger("mcp_server_final")
 
-logger.info("Starting final fixed MCP server script")
+# Size of the chunks read from stdin
+STDIN_CHUNK_SIZE = 64 * 1024
+
+# Longest accepted message (line or frame payload), in bytes
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+# Most tool calls accepted in one batch message, and the batch response modes
+MAX_BATCH_CALLS = int(os.getenv("MCP_MAX_BATCH_CALLS", "100"))
+BATCH_MODES = ("batched", "stream")
+
+# Message types a client can send (others are answered with an error)
+MESSAGE_TYPES = frozenset(
+    {"hello", "list_tools", "tool_call", "batch", "cancel", "stats"}
+)
+
+# Socket to serve on instead of stdio (see --listen)
+LISTEN_ADDRESS = os.getenv("MCP_LISTEN_ADDRESS", "")
+
+# Seconds in-flight requests get to finish after SIGTERM, and the extra
+# seconds cancelled requests get to stop before the server exits anyway
+# (without waiting for the worker threads of tools that didn't stop)
+SHUTDOWN_TIMEOUT = float(os.getenv("MCP_SHUTDOWN_TIMEOUT", "30"))
+SHUTDOWN_GRACE = 5.0
 
 try:
-    logger.info("Importing mcp from search_mcp_pkg.core...")
-    from search_mcp_pkg.core import (
-        mcp,
-        search,
-        create_ecommerce_test_index,
-        index_product,
-        search_products_by_category,
-        search_products_by_brand,
-        create_test_index,
+    # Set up structured logging to stderr through a background writer thread.
+    # Only lightweight modules are imported here; the tools (and with them
+    # Elasticsearch, OpenAI and FastMCP) are loaded after the ready message.
+    from search_mcp_pkg import codec, metrics
+    from search_mcp_pkg.admission import AdmissionController, Overloaded
+    from search_mcp_pkg.cancellation import CancelToken, RequestCancelled, cancel_scope
+    from search_mcp_pkg.connection import ServerConnection, parse_address
+    from search_mcp_pkg.framing import (
+        COMPRESSIONS,
+        FRAMINGS,
+        HEADER as FRAME_HEADER,
+        FrameError,
+        decode_payload,
+        encode_frame,
+        fit_json_response,
+        fit_response,
+        parse_header,
+        response_limit_scope,
+    )
+    from search_mcp_pkg.logging_utils import (
+        configure_logging,
+        dropped_records,
+        shutdown_logging,
+        truncate,
     )
 
-    logger.info(f"Successfully imported mcp, name: {mcp.name}")
+    configure_logging()
+    logger.info("Starting final fixed MCP server script")
 except ImportError as e:
-    logger.error(f"Import error: {e}")
-    logger.error(f"Python path: {sys.path}")
+    logger.error("Import error: %s", e)
+    logger.error("Python path: %s", sys.path)
     traceback.print_exc()
     sys.exit(1)
 
 # Restore stdout for JSON communication
 sys.stdout = original_stdout
 
+# The framings and compressions offered here can be chosen with a hello message
+READY_MESSAGE = {
+    "type": "ready",
+    "message": "MCP server is ready",
+    "framing": list(FRAMINGS),
+    "compression": list(COMPRESSIONS),
+}
+
+# Marker returned by read_message when the input stream is closed
+EOF = object()
+
+
+class LineTransport:
+    """
+    JSON messages over an asyncio stream.
+
+    Messages are newline-delimited until the client switches the connection
+    to length-prefixed frames with a hello message (see framing.py).
+    """
 
-# Custom stdio transport with proper ordering
-class FixedStdioTransport:
     def __init__(self):
         self.logger = logging.getLogger("mcp_transport")
-        self.logger.info("Initializing fixed stdio transport")
+        self.reader = None
+        self.write_lock = asyncio.Lock()
+        # Set when the client went away, rather than just closing its input
+        self.lost = False
+        self.framing = "line"
+        self.compression = None
 
     async def read_message(self):
-        """Read a message from stdin."""
-        self.logger.info("Waiting for input on stdin...")
+        """
+        Read a message from the input stream.
+
+        Returns:
+            The parsed message, None for a blank or malformed line, or EOF at
+            end of input
+        """
+        if self.framing == "length":
+            return await self.read_frame()
         try:
-            line = sys.stdin.readline().strip()
+            line = await self.reader.readline()
+            if not line:
+                self.logger.info("Input closed")
+                return EOF
+
+            line = line.strip()
             if not line:
-                self.logger.warning("Empty line received on stdin")
+                self.logger.warning("Empty line received")
                 return None
 
-            self.logger.info(f"Received input: {line}")
+            self.logger.debug("Received input: %s", truncate(line))
             try:
-                message = json.loads(line)
-                self.logger.info(f"Parsed message: {message}")
-                return message
+                return codec.loads(line)
             except json.JSONDecodeError as e:
-                self.logger.error(f"Failed to parse JSON: {e}")
+                metrics.inc("errors_total", kind="malformed_message")
+                self.logger.error("Failed to parse JSON: %s", e)
                 return None
+        except ConnectionError as e:
+            self.logger.info("Connection lost: %s", e)
+            self.lost = True
+            return EOF
         except Exception as e:
-            self.logger.error(f"Error reading from stdin: {e}")
+            self.logger.error("Error reading input: %s", e)
             return None
 
+    async def read_frame(self):
+        """
+        Read a length-prefixed message from the input stream.
+
+        A frame that can't be read leaves the stream out of step, so it ends
+        the input rather than being skipped.
+        """
+        try:
+            length, flags = parse_header(
+                await self.reader.readexactly(FRAME_HEADER.size), MAX_LINE_BYTES
+            )
+            payload = decode_payload(
+                await self.reader.readexactly(length), flags, MAX_LINE_BYTES
+            )
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                self.logger.error("Input closed in the middle of a frame")
+            else:
+                self.logger.info("Input closed")
+            return EOF
+        except FrameError as e:
+            metrics.inc("errors_total", kind="malformed_message")
+            self.logger.error("Unreadable frame, closing input: %s", e)
+            return EOF
+        except ConnectionError as e:
+            self.logger.info("Connection lost: %s", e)
+            self.lost = True
+            return EOF
+
+        self.logger.debug("Received input: %s", truncate(payload))
+        try:
+            return codec.loads(payload)
+        except json.JSONDecodeError as e:
+            metrics.inc("errors_total", kind="malformed_message")
+            self.logger.error("Failed to parse JSON: %s", e)
+            return None
+
+    async def negotiate(self, message):
+        """
+        Handle a hello message, switching the connection's framing.
+
+        The hello_response is the last message sent with the old framing;
+        every message after it, in both directions, uses the new one.
+        """
+        framing = message.get("framing", "line")
+        compression = message.get("compression")
+        error = None
+        if framing not in FRAMINGS:
+            error = f"Unknown framing: {framing}"
+        elif compression is not None and compression not in COMPRESSIONS:
+            error = f"Unknown compression: {compression}"
+        if error:
+            await self.write_message(
+                {"id": message.get("id", "unknown"), "type": "error", "error": error}
+            )
+            return
+
+        response = {
+            "id": message.get("id", "unknown"),
+            "type": "hello_response",
+            "framing": framing,
+            "compression": compression,
+        }
+        # Hold the write lock so no response slips in between the two framings
+        async with self.write_lock:
+            await self.send(self.frame(codec.dumps_bytes(response)))
+            self.framing = framing
+            self.compression = compression if framing == "length" else None
+        self.logger.info(
+            "Negotiated framing",
+            extra={"framing": framing, "compression": self.compression},
+        )
+
+    def frame(self, payload):
+        """Frame a serialized message for the output stream."""
+        if self.framing == "length":
+            return encode_frame(payload, self.compression)
+        return payload + b"\n"
+
     async def write_message(self, message):
-        """Write a message to stdout."""
+        """Write a message to the output stream."""
+        try:
+            return await self.write_raw(codec.dumps_bytes(message))
+        except Exception as e:
+            self.logger.error("Error encoding message: %s", e)
+            return False
+
+    async def write_raw(self, json_message):
+        """Write an already serialized message to the output stream."""
         try:
-            json_message = json.dumps(message)
-            self.logger.info(f"Sending message: {json_message}")
-            print(json_message, flush=True)
-            self.logger.info("Message sent and flushed")
+            self.logger.debug("Sending message: %s", truncate(json_message))
+            # Responses finish out of order; keep each one in its own frame
+            async with self.write_lock:
+                data = self.frame(json_message)
+                await self.send(data)
+            metrics.inc("bytes_sent_total", len(data))
             return True
+        except ConnectionError as e:
+            self.logger.warning("Client went away before its response: %s", e)
+            return False
         except Exception as e:
-            self.logger.error(f"Error writing to stdout: {e}")
+            self.logger.error("Error writing message: %s", e)
             return False
 
+    async def send(self, data):
+        """Write raw bytes to the output stream."""
+        raise NotImplementedError
 
-# Map of tool names to actual functions
-tool_functions = {
-    "search": search,
-    "create_ecommerce_test_index": create_ecommerce_test_index,
-    "index_product": index_product,
-    "search_products_by_category": search_products_by_category,
-    "search_products_by_brand": search_products_by_brand,
-    "create_test_index": create_test_index,
-}
+    def close(self):
+        """Close the connection; the serving loop reads EOF next."""
+        if self.reader is not None:
+            self.reader.feed_eof()
+
+
+# Custom stdio transport with proper ordering
+class FixedStdioTransport(LineTransport):
+    def __init__(self):
+        super().__init__()
+        self.logger.info("Initializing fixed stdio transport")
+
+    def start(self):
+        """
+        Start feeding stdin into an asyncio stream.
+
+        stdin is read by a daemon thread so that waiting for input never blocks
+        the event loop, whatever kind of file stdin is (pipe, tty or file).
+        """
+        loop = asyncio.get_running_loop()
+        self.reader = asyncio.StreamReader(limit=MAX_LINE_BYTES)
+
+        def pump_stdin():
+            fd = sys.stdin.fileno()
+            while True:
+                try:
+                    chunk = os.read(fd, STDIN_CHUNK_SIZE)
+                except OSError as e:
+                    self.logger.error("Error reading from stdin: %s", e)
+                    chunk = b""
+                if not chunk:
+                    loop.call_soon_threadsafe(self.reader.feed_eof)
+                    return
+                loop.call_soon_threadsafe(self.reader.feed_data, chunk)
+
+        threading.Thread(target=pump_stdin, name="mcp-stdin", daemon=True).start()
+
+    async def send(self, data):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
 
 
-async def run_server():
-    """Run the MCP server with the fixed transport."""
-    logger.info("Setting up fixed transport")
-    transport = FixedStdioTransport()
+class SocketTransport(LineTransport):
+    """A client connection to the socket listener."""
 
-    # First, send a ready message and ensure it's flushed
-    logger.info("Sending ready message")
-    await transport.write_message({"type": "ready", "message": "MCP server is ready"})
+    def __init__(self, reader, writer):
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+        self.peer = writer.get_extra_info("peername") or "unix socket"
+
+    async def send(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+        super().close()
+
+
+def call_with_token(token, fn, args, max_response_bytes=None):
+    """
+    Run a tool function on a worker thread with its request's cancel token
+    and response size limit bound.
+    """
+    # The request may have been cancelled while waiting for a worker
+    token.raise_if_cancelled()
+    with cancel_scope(token), response_limit_scope(max_response_bytes):
+        return fn(**args)
+
+
+def cancel_searches(opaque_ids):
+    """Cancel the Elasticsearch searches of cancelled requests."""
+    from search_mcp_pkg.core import cancel_search_tasks
 
-    # Then enter the main loop
-    logger.info("Starting MCP server loop")
     try:
-        while True:
-            logger.info("Waiting for next message...")
-            message = await transport.read_message()
+        cancelled = cancel_search_tasks(opaque_ids)
+        if cancelled:
+            logger.info("Cancelled %d Elasticsearch searches", cancelled)
+    except Exception:
+        logger.warning("Could not cancel Elasticsearch searches", exc_info=True)
 
-            if message is None:
-                logger.warning("Received None message, continuing...")
+
+def load_tool_functions():
+    """
+    Import the tools module and map tool names to their functions.
+
+    This is the expensive part of startup, so it runs after the ready message
+    has been sent.
+    """
+    logger.info("Importing tools from search_mcp_pkg.core...")
+    from search_mcp_pkg.core import (
+        search,
+        create_ecommerce_test_index,
+        index_product,
+        sync_products,
+        search_products_by_category,
+        search_products_by_brand,
+        create_test_index,
+        migrate_index,
+        server_stats,
+    )
+
+    # Map of tool names to actual functions
+    return {
+        "search": search,
+        "create_ecommerce_test_index": create_ecommerce_test_index,
+        "index_product": index_product,
+        "sync_products": sync_products,
+        "search_products_by_category": search_products_by_category,
+        "search_products_by_brand": search_products_by_brand,
+        "create_test_index": create_test_index,
+        "migrate_index": migrate_index,
+        "server_stats": server_stats,
+    }
+
+
+class ToolManifest:
+    """
+    The tool list served by list_tools, computed once at startup.
+
+    Each entry carries the tool's name, description and JSON input schema.
+    The list is serialized once and tagged with a version (a hash of its
+    content) that clients can send back as `if_none_match` to skip
+    re-downloading an unchanged manifest.
+    """
+
+    def __init__(self, tools):
+        self.tools = tools
+        self.tools_json = codec.dumps_bytes(tools)
+        self.version = hashlib.sha256(self.tools_json).hexdigest()[:16]
+        self.header = b'"type":"list_tools_response","version":' + codec.dumps_bytes(
+            self.version
+        )
+
+    @classmethod
+    async def build(cls, mcp, tool_functions):
+        """
+        Build the manifest from the tools registered with FastMCP.
+
+        Args:
+            mcp: The FastMCP server
+            tool_functions: The tools the server can call, by name
+        """
+        tool_list = []
+        for tool in await mcp.list_tools():
+            if tool.name not in tool_functions:
+                logger.warning("Tool %s has no server function, skipping", tool.name)
                 continue
+            tool_list.append(
+                {
+                    "name": tool.name,
+                    "description": tool.description or "No description",
+                    "input_schema": tool.inputSchema,
+                }
+            )
+        return cls(tool_list)
 
-            logger.info(f"Processing message: {message}")
+    def response(self, request_id, if_none_match=None):
+        """
+        Get the serialized list_tools response for a request.
 
-            # Handle different message types
-            if message.get("type") == "list_tools":
-                logger.info("Handling list_tools request")
-                try:
-                    tools = await mcp.list_tools()
-                    logger.info(f"Found {len(tools)} tools")
-
-                    # Convert tools to a serializable format
-                    tool_list = []
-                    for tool in tools:
-                        try:
-                            tool_dict = {
-                                "name": (
-                                    tool.name if hasattr(tool, "name") else str(tool)
-                                ),
-                                "description": (
-                                    tool.description
-                                    if hasattr(tool, "description")
-                                    else "No description"
-                                ),
-                            }
-                            tool_list.append(tool_dict)
-                        except Exception as e:
-                            logger.error(f"Error converting tool to dict: {e}")
-
-                    response = {
-                        "id": message.get("id", "unknown"),
-                        "type": "list_tools_response",
-                        "tools": tool_list,
-                    }
-                    await transport.write_message(response)
-                except Exception as e:
-                    logger.error(f"Error listing tools: {e}")
-                    await transport.write_message(
-                        {
-                            "id": message.get("id", "unknown"),
-                            "type": "error",
-                            "error": str(e),
-                        }
-                    )
+        Args:
+            request_id: The id of the list_tools request
+            if_none_match: The manifest version the client already has
 
-            elif message.get("type") == "tool_call":
-                logger.info(f"Handling tool call for: {message.get('tool')}")
-                try:
-                    # Get the tool name and args
-                    tool_name = message.get("tool")
-                    args = message.get("args", {})
-
-                    # Find the tool function
-                    if tool_name in tool_functions:
-                        logger.info(f"Found tool function: {tool_name}")
-
-                        # Call the tool function directly
-                        logger.info(f"Calling tool function with args: {args}")
-                        result = tool_functions[tool_name](**args)
-                        logger.info(f"Tool result: {result}")
-
-                        # Send the response
-                        response = {
-                            "id": message.get("id", "unknown"),
-                            "type": "tool_call_response",
-                            "result": result,
-                        }
+        Returns:
+            The response frame, without tools if the client's copy is current
+        """
+        frame = b'{"id":' + codec.dumps_bytes(request_id) + b"," + self.header
+        if if_none_match == self.version:
+            return frame + b',"not_modified":true}'
+        return frame + b',"tools":' + self.tools_json + b"}"
+
+
+class RequestDispatcher:
+    """
+    Dispatches protocol messages to their handlers.
+
+    Tool calls run on a bounded worker pool so that a slow search doesn't hold
+    up other requests, once admission control has given them a slot. Each
+    response is written as soon as it is ready, tagged with the id of its
+    request, so responses may arrive out of order.
+    """
+
+    def __init__(self, admission=None):
+        self.admission = admission or AdmissionController()
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.admission.max_workers, thread_name_prefix="mcp-tool"
+        )
+        self.in_flight = set()
+        # Cancel tokens of running tool calls and batches, by (transport, id)
+        self.requests = {}
+        self.batches = {}
+        # Admission waits of the tool calls queued for a slot, by (transport, id)
+        self.queued = {}
+        self.tool_functions = {}
+        self.manifest = None
+        self.startup = None
+        # Tasks serving each open connection, closed once a shutdown has drained them
+        self.connections = {}
+        # Set once a shutdown has begun, once it has given up waiting, and if
+        # it left tool calls running on worker threads that can't be stopped
+        self.draining = False
+        self.aborted = False
+        self.abandoned = False
+        self.register_gauges()
+
+    def register_gauges(self):
+        """Report queue depth and requests in flight with the other metrics."""
+
+        def lane_gauge(field):
+            return lambda: {
+                (("lane", name),): lane[field]
+                for name, lane in self.admission.snapshot().items()
+            }
+
+        metrics.gauge("lane_active", lane_gauge("active"))
+        metrics.gauge("lane_waiting", lane_gauge("waiting"))
+        metrics.gauge("lane_rejected", lane_gauge("rejected"))
+        metrics.gauge("requests_in_flight", lambda: len(self.requests))
+        metrics.gauge("log_records_dropped", dropped_records)
+
+    def start(self):
+        """Load the tools in the background; requests wait until they're loaded."""
+        self.startup = asyncio.create_task(self.load())
+        self.startup.add_done_callback(self.log_startup_failure)
+
+    @staticmethod
+    def log_startup_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Failed to load the tools", exc_info=task.exception())
+
+    async def load(self):
+        """Import the tools and build the tool manifest."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        self.tool_functions = await loop.run_in_executor(
+            self.executor, load_tool_functions
+        )
+
+        from search_mcp_pkg.core import get_mcp
+
+        mcp = await loop.run_in_executor(self.executor, get_mcp)
+        self.manifest = await ToolManifest.build(mcp, self.tool_functions)
+        logger.info(
+            "Tools loaded in %.0f ms; manifest version %s (%d tools)",
+            (time.perf_counter() - started) * 1000,
+            self.manifest.version,
+            len(self.manifest.tools),
+        )
+
+        # Clients are created on first use; create them now, off the request path
+        loop.run_in_executor(self.executor, self.warm_up)
+        loop.run_in_executor(self.executor, self.restore_caches)
+
+    @staticmethod
+    def warm_up():
+        """Create the Elasticsearch and OpenAI clients ahead of the first request."""
+        from search_mcp_pkg.core import warm_up
+
+        try:
+            warm_up()
+        except Exception:
+            # The tool that needs the client will report the problem
+            logger.warning("Could not create clients at startup", exc_info=True)
+
+    @staticmethod
+    def restore_caches():
+        """Restore the planner cache saved by the previous server, if any."""
+        from search_mcp_pkg.core import PLANNER_CACHE_SNAPSHOT, load_planner_cache
+
+        if not PLANNER_CACHE_SNAPSHOT or not os.path.exists(PLANNER_CACHE_SNAPSHOT):
+            return
+        try:
+            restored = load_planner_cache(PLANNER_CACHE_SNAPSHOT)
+            logger.info("Restored %d planner cache entries", restored)
+        except Exception:
+            logger.warning("Could not restore the planner cache", exc_info=True)
+
+    def dispatch(self, message, transport):
+        """
+        Start handling a message without waiting for it to finish.
+
+        Returns:
+            The task handling the message
+        """
+        task = asyncio.create_task(self.handle(message, transport))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+        return task
+
+    async def handle(self, message, transport):
+        """Handle a single message and write its response."""
+        logger.debug("Processing message: %s", truncate(message))
+        message_type = message.get("type")
+        metrics.inc(
+            "messages_total",
+            type=message_type if message_type in MESSAGE_TYPES else "unknown",
+        )
+
+        # Stats are served even while the tools are loading
+        if message.get("type") == "stats":
+            await self.handle_stats(message, transport)
+            return
+
+        # Once a shutdown has begun, only requests that start no new work are served
+        if self.draining and message_type in ("tool_call", "batch"):
+            await transport.write_message(
+                {
+                    "id": message.get("id", "unknown"),
+                    "type": "error",
+                    "error": "Server is shutting down",
+                    "code": "shutting_down",
+                }
+            )
+            return
+
+        # Messages can arrive before the tools have finished loading
+        try:
+            await asyncio.shield(self.startup)
+        except Exception as e:
+            await transport.write_message(
+                {
+                    "id": message.get("id", "unknown"),
+                    "type": "error",
+                    "error": f"Server failed to start: {e}",
+                }
+            )
+            return
+
+        # Handle different message types
+        if message.get("type") == "list_tools":
+            await self.handle_list_tools(message, transport)
+        elif message.get("type") == "tool_call":
+            await self.handle_tool_call(message, transport)
+        elif message.get("type") == "batch":
+            await self.handle_batch(message, transport)
+        elif message.get("type") == "cancel":
+            await self.handle_cancel(message, transport)
+        else:
+            logger.warning("Unknown message type: %s", message.get("type"))
+            await transport.write_message(
+                {
+                    "id": message.get("id", "unknown"),
+                    "type": "error",
+                    "error": f"Unknown message type: {message.get('type')}",
+                }
+            )
+
+    async def handle_stats(self, message, transport):
+        """
+        Handle a stats request.
+
+        The response carries every metric as JSON, or as Prometheus text if
+        the request asks for `"format": "prometheus"`.
+        """
+        response = {"id": message.get("id", "unknown"), "type": "stats_response"}
+        if message.get("format") == "prometheus":
+            response["prometheus"] = metrics.registry.prometheus()
+        else:
+            response["stats"] = metrics.stats()
+        await transport.write_message(response)
+
+    async def handle_list_tools(self, message, transport):
+        """Handle a list_tools request from the precomputed manifest."""
+        await transport.write_raw(
+            self.manifest.response(
+                message.get("id", "unknown"), message.get("if_none_match")
+            )
+        )
+
+    async def handle_tool_call(self, message, transport):
+        """Handle a tool_call request on the worker pool."""
+        response = await self.run_tool_call(message, transport)
+        if response is not None:
+            await transport.write_message(response)
+
+    async def run_tool_call(self, message, transport, batch_token=None):
+        """
+        Run a tool call on the worker pool.
+
+        The call can be cancelled with a cancel message carrying its id until
+        it finishes.
+
+        Args:
+            message: The call, with its id, tool name and args
+            transport: The connection the call came from
+            batch_token: The cancel token of the batch the call is part of
+
+        Returns:
+            The tool_call_response, an error response if the call failed, or
+            None if it was cancelled
+        """
+        started = time.perf_counter()
+        key = (transport, message.get("id"))
+        token = CancelToken(message.get("id"))
+        self.requests[key] = token
+        if batch_token is not None and batch_token.cancelled:
+            token.cancel()
+        try:
+            # Get the tool name, args and response size limit
+            tool_name = message.get("tool")
+            args = message.get("args", {})
+            max_response_bytes = message.get("max_response_bytes")
+
+            # Find the tool function
+            if tool_name not in self.tool_functions:
+                metrics.inc("errors_total", kind="unknown_tool")
+                logger.error("Tool not found: %s", tool_name)
+                return {
+                    "id": message.get("id", "unknown"),
+                    "type": "error",
+                    "error": f"Tool not found: {tool_name}",
+                }
+            if max_response_bytes is not None and (
+                type(max_response_bytes) is not int or max_response_bytes <= 0
+            ):
+                return {
+                    "id": message.get("id", "unknown"),
+                    "type": "error",
+                    "error": "max_response_bytes must be a positive integer",
+                }
+
+            # Run the tool function on the worker pool once it's admitted
+            logger.debug("Calling tool %s with args: %s", tool_name, truncate(args))
+            slots = await self.wait_for_slots(key, tool_name)
+            if slots is None:
+                return self.cancelled_while_queued(message, started, batch_token)
+            lanes, queue_time = slots
+            loop = asyncio.get_running_loop()
+            running = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(
+                    self.executor,
+                    functools.partial(
+                        call_with_token,
+                        token,
+                        self.tool_functions[tool_name],
+                        args,
+                        max_response_bytes,
+                    ),
+                )
+            finally:
+                self.admission.release(lanes, time.perf_counter() - running)
+            if token.cancelled:
+                raise RequestCancelled(f"Request {token.request_id} was cancelled")
+            self.record_call(tool_name, "ok", started, queue_time)
+
+            # Tools that don't size their output to the limit are cut short;
+            # JSON results are replaced whole so they stay parseable
+            truncated = False
+            if isinstance(result, str) and args.get("output_format") == "json":
+                result, truncated = fit_json_response(result, max_response_bytes)
+            elif isinstance(result, str):
+                result, truncated = fit_response(result, max_response_bytes)
+            if truncated:
+                metrics.inc("responses_truncated_total", tool=tool_name)
+            logger.debug("Tool result: %s", truncate(result))
+            logger.info(
+                "tool_call completed",
+                extra={
+                    "sampled": True,
+                    "request_id": message.get("id"),
+                    "tool": tool_name,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "queue_ms": round(queue_time * 1000, 1),
+                    "result_chars": len(result) if isinstance(result, str) else None,
+                },
+            )
+            response = {
+                "id": message.get("id", "unknown"),
+                "type": "tool_call_response",
+                "result": result,
+            }
+            if truncated:
+                response["truncated"] = True
+            return response
+
+        except Overloaded as e:
+            self.record_call(message.get("tool"), "rejected", started)
+            logger.warning(
+                "tool_call rejected",
+                extra={
+                    "sampled": True,
+                    "request_id": message.get("id"),
+                    "tool": message.get("tool"),
+                    "lane": e.lane,
+                    "retry_after": e.retry_after,
+                },
+            )
+            return {
+                "id": message.get("id", "unknown"),
+                "type": "error",
+                "error": str(e),
+                "code": "overloaded",
+                "retry_after": e.retry_after,
+            }
+
+        except RequestCancelled:
+            self.record_call(message.get("tool"), "cancelled", started)
+            logger.info(
+                "tool_call cancelled",
+                extra={
+                    "request_id": message.get("id"),
+                    "tool": message.get("tool"),
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                },
+            )
+            if self.aborted:
+                # Cancelled by the shutdown, not the client; tell it to retry
+                return {
+                    "id": message.get("id", "unknown"),
+                    "type": "error",
+                    "error": "Server shut down before the call finished",
+                    "code": "shutting_down",
+                }
+            return None
+
+        except Exception as e:
+            self.record_call(message.get("tool"), "error", started)
+            logger.exception(
+                "Error calling tool",
+                extra={"request_id": message.get("id"), "tool": message.get("tool")},
+            )
+            return {
+                "id": message.get("id", "unknown"),
+                "type": "error",
+                "error": str(e),
+            }
+
+        finally:
+            if self.requests.get(key) is token:
+                del self.requests[key]
+
+    async def wait_for_slots(self, key, tool_name):
+        """
+        Wait for a tool call's admission slots.
+
+        The wait is registered under the call's key, so that cancelling the
+        call takes it out of its lanes' queues (see cancel_queued).
+
+        Returns:
+            The lanes the call holds a slot in and how long it waited, or
+            None if it was cancelled while queued
+
+        Raises:
+            Overloaded: If the call is rejected
+        """
+        waiting = asyncio.ensure_future(self.admission.acquire(tool_name))
+        self.queued[key] = waiting
+        try:
+            # Unlike awaiting it, this leaves the wait running if the task
+            # handling the call is cancelled, so its slots can be returned
+            await asyncio.wait({waiting})
+        except asyncio.CancelledError:
+            waiting.cancel()
+            waiting.add_done_callback(self.release_slots)
+            raise
+        finally:
+            if self.queued.get(key) is waiting:
+                del self.queued[key]
+        if waiting.cancelled():
+            return None
+        return waiting.result()
+
+    def release_slots(self, waiting):
+        """Return the slots of a wait that completed after its call was abandoned."""
+        if not waiting.cancelled() and waiting.exception() is None:
+            self.admission.release(waiting.result()[0])
+
+    def cancel_queued(self, keys):
+        """Take cancelled tool calls that are still waiting for a slot out of the queue."""
+        for key in keys:
+            waiting = self.queued.pop(key, None)
+            if waiting is not None:
+                waiting.cancel()
+
+    def cancelled_while_queued(self, message, started, batch_token=None):
+        """
+        Answer a tool call cancelled before it got a slot.
+
+        It is answered right away with a cancelled error, unless its whole
+        batch was cancelled (which drops the batch's responses) or the server
+        is shutting down.
+        """
+        self.record_call(message.get("tool"), "cancelled", started)
+        logger.info(
+            "tool_call cancelled while queued",
+            extra={"request_id": message.get("id"), "tool": message.get("tool")},
+        )
+        if self.aborted:
+            return {
+                "id": message.get("id", "unknown"),
+                "type": "error",
+                "error": "Server shut down before the call finished",
+                "code": "shutting_down",
+            }
+        if batch_token is not None and batch_token.cancelled:
+            return None
+        return {
+            "id": message.get("id", "unknown"),
+            "type": "error",
+            "error": f"Request {message.get('id')} was cancelled",
+            "code": "cancelled",
+        }
+
+    @staticmethod
+    def record_call(tool, outcome, started, queue_time=None):
+        """Count a finished tool call and record how long it took."""
+        tool = str(tool)
+        metrics.inc("tool_calls_total", tool=tool, outcome=outcome)
+        metrics.observe("tool_latency", time.perf_counter() - started, tool=tool)
+        if queue_time is not None:
+            metrics.observe("queue_time", queue_time, tool=tool)
+
+    async def handle_batch(self, message, transport):
+        """
+        Handle a batch of tool calls, run concurrently on the worker pool.
+
+        In "batched" mode (the default) a single batch_response carries every
+        call's response, in call order. In "stream" mode each call's response
+        is written as soon as it is ready, followed by a batch_complete
+        message once all calls have finished.
+        """
+        batch_id = message.get("id", "unknown")
+        calls = message.get("calls")
+        mode = message.get("mode", "batched")
+
+        error = None
+        if not isinstance(calls, list) or not all(isinstance(c, dict) for c in calls):
+            error = "A batch needs a list of calls"
+        elif len(calls) > MAX_BATCH_CALLS:
+            error = f"Too many calls in batch: {len(calls)} (max {MAX_BATCH_CALLS})"
+        elif mode not in BATCH_MODES:
+            error = f"Unknown batch mode: {mode}"
+        if error:
+            await transport.write_message(
+                {"id": batch_id, "type": "error", "error": error}
+            )
+            return
+
+        # Calls without an id are identified by their position in the batch, and
+        # the batch's max_response_bytes applies to calls that don't set their own
+        defaults = {}
+        if "max_response_bytes" in message:
+            defaults["max_response_bytes"] = message["max_response_bytes"]
+        calls = [
+            {**defaults, **call, "id": call.get("id", f"{batch_id}:{index}")}
+            for index, call in enumerate(calls)
+        ]
+
+        # Cancelling the batch cancels all of its calls and drops its responses
+        key = (transport, batch_id)
+        batch_token = CancelToken(batch_id)
+        self.batches[key] = (batch_token, [call["id"] for call in calls])
+        try:
+            if mode == "stream":
+
+                async def run_and_write(call):
+                    response = await self.run_tool_call(call, transport, batch_token)
+                    if response is not None:
                         await transport.write_message(response)
-                    else:
-                        logger.error(f"Tool not found: {tool_name}")
-                        await transport.write_message(
-                            {
-                                "id": message.get("id", "unknown"),
-                                "type": "error",
-                                "error": f"Tool not found: {tool_name}",
-                            }
-                        )
-
-                except Exception as e:
-                    logger.error(f"Error calling tool: {e}")
-                    traceback.print_exc()
+
+                await asyncio.gather(*(run_and_write(call) for call in calls))
+                if not batch_token.cancelled:
                     await transport.write_message(
-                        {
-                            "id": message.get("id", "unknown"),
-                            "type": "error",
-                            "error": str(e),
-                        }
+                        {"id": batch_id, "type": "batch_complete", "count": len(calls)}
                     )
-
             else:
-                logger.warning(f"Unknown message type: {message.get('type')}")
-                await transport.write_message(
-                    {
-                        "id": message.get("id", "unknown"),
-                        "type": "error",
-                        "error": f"Unknown message type: {message.get('type')}",
-                    }
+                results = await asyncio.gather(
+                    *(
+                        self.run_tool_call(call, transport, batch_token)
+                        for call in calls
+                    )
                 )
+                if not batch_token.cancelled:
+                    # Calls cancelled on their own keep their place in the results
+                    results = [
+                        result or {"id": call["id"], "type": "cancelled"}
+                        for call, result in zip(calls, results)
+                    ]
+                    await transport.write_message(
+                        {"id": batch_id, "type": "batch_response", "results": results}
+                    )
+        finally:
+            if self.batches.get(key, (None,))[0] is batch_token:
+                del self.batches[key]
+
+    async def handle_cancel(self, message, transport):
+        """
+        Handle a cancel message for a running tool call or batch.
+
+        A call still queued for a slot leaves the queue at once and is
+        answered with a cancelled error. A running call's response is
+        dropped, its tool stops at its next cancellation check (freeing its
+        worker) and its running Elasticsearch searches are cancelled.
+        Cancelling a finished request does nothing.
+        """
+        request_id = message.get("request_id")
+        key = (transport, request_id)
+        if key in self.batches:
+            batch_token, call_ids = self.batches[key]
+            keys = [(transport, call_id) for call_id in call_ids]
+            tokens = [batch_token] + [
+                self.requests[call_key]
+                for call_key in keys
+                if call_key in self.requests
+            ]
+        elif key in self.requests:
+            keys = [key]
+            tokens = [self.requests[key]]
+        else:
+            logger.debug("Nothing to cancel for request %s", request_id)
+            return
+
+        logger.info("Cancelling request", extra={"request_id": request_id})
+        await self.cancel(tokens, keys)
+
+    async def cancel_all(self, transport):
+        """Cancel every request still running for a connection that was lost."""
+        keys = [key for key in self.requests if key[0] is transport]
+        tokens = [self.requests[key] for key in keys] + [
+            batch_token
+            for (owner, _), (batch_token, _) in self.batches.items()
+            if owner is transport
+        ]
+        if tokens:
+            logger.info("Cancelling %d requests of a lost connection", len(tokens))
+            await self.cancel(tokens, keys)
+
+    async def cancel(self, tokens, keys=()):
+        """
+        Cancel requests and the Elasticsearch searches they're running.
+
+        Args:
+            tokens: The cancel tokens of the requests
+            keys: The (transport, id) keys of the tool calls among them, so
+                that calls still queued for a slot leave the queue
+        """
+        for token in tokens:
+            token.cancel()
+        self.cancel_queued(keys)
+        # Finding and cancelling the searches blocks; keep it off the tool pool,
+        # which may be full of the very calls being cancelled
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, cancel_searches, [token.opaque_id for token in tokens]
+        )
+
+    async def drain(self, timeout):
+        """
+        Stop accepting work and wait for the requests in flight.
+
+        Requests still running after `timeout` seconds are cancelled, and
+        answered with a shutting_down error so their clients can retry them
+        elsewhere. Requests that haven't stopped SHUTDOWN_GRACE seconds later
+        (e.g. stuck in an Elasticsearch call) are abandoned; see `abandoned`.
+        """
+        self.draining = True
+        pending = set(self.in_flight)
+        if pending:
+            logger.info("Draining %d requests (up to %gs)", len(pending), timeout)
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+        if not pending:
+            return
+
+        logger.warning("Cancelling %d requests that did not finish", len(pending))
+        self.aborted = True
+        await self.cancel(
+            list(self.requests.values())
+            + [batch_token for batch_token, _ in self.batches.values()],
+            list(self.requests),
+        )
+        _, pending = await asyncio.wait(pending, timeout=SHUTDOWN_GRACE)
+        if pending:
+            logger.warning("Abandoning %d requests that did not stop", len(pending))
+            self.abandoned = True
+        for task in pending:
+            task.cancel()
+
+    def flush(self):
+        """Save state worth keeping across a restart (run after draining)."""
+        if self.tool_functions:
+            from search_mcp_pkg.core import PLANNER_CACHE_SNAPSHOT, save_planner_cache
+
+            if PLANNER_CACHE_SNAPSHOT:
+                try:
+                    saved = save_planner_cache(PLANNER_CACHE_SNAPSHOT)
+                    logger.info("Saved %d planner cache entries", saved)
+                except Exception:
+                    logger.warning("Could not save the planner cache", exc_info=True)
+        if metrics.METRICS_FILE:
+            try:
+                metrics.write_prometheus_file(metrics.METRICS_FILE)
+            except OSError:
+                logger.warning("Could not write the final metrics", exc_info=True)
+
+    async def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """Drain the requests in flight, save state and close every connection."""
+        started = time.perf_counter()
+        await self.drain(timeout)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.flush)
+        for transport in list(self.connections):
+            transport.close()
+        if self.connections:
+            await asyncio.wait(list(self.connections.values()), timeout=SHUTDOWN_GRACE)
+        logger.info("Shut down in %.1f s", time.perf_counter() - started)
+
+    def close(self):
+        """Shut down the worker pool, dropping queued work and not waiting for running work."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve(transport, dispatcher):
+    """
+    Serve one client until its input is closed.
+
+    Sends the ready message, dispatches each request, and once the input is
+    closed waits for the requests already accepted from this client.
+    """
+    await transport.write_message(READY_MESSAGE)
+    dispatcher.connections[transport] = asyncio.current_task()
+    try:
+        pending = set()
+        while True:
+            message = await transport.read_message()
+
+            if message is EOF:
+                break
+
+            if message is None:
+                continue
+
+            # The framing switch has to happen before the next message is read
+            if message.get("type") == "hello":
+                await transport.negotiate(message)
+                continue
+
+            task = dispatcher.dispatch(message, transport)
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        # The client is gone, so nobody will read the responses
+        if transport.lost:
+            await dispatcher.cancel_all(transport)
+
+        # Input is closed; finish what was already accepted before returning
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        dispatcher.connections.pop(transport, None)
+
+
+async def serve_connection(dispatcher, reader, writer):
+    """Serve a client connected to the socket listener."""
+    transport = SocketTransport(reader, writer)
+    logger.info("Client connected", extra={"peer": transport.peer})
+    try:
+        await serve(transport, dispatcher)
+    except Exception:
+        logger.exception("Unhandled exception serving client")
+    finally:
+        transport.close()
+        logger.info("Client disconnected", extra={"peer": transport.peer})
+
+
+async def start_listener(address, dispatcher):
+    """
+    Start accepting clients on a Unix domain socket or TCP port.
+
+    Args:
+        address: "unix:/path", "tcp:host:port" or "host:port"
+        dispatcher: The dispatcher shared by every connection
+
+    Returns:
+        The asyncio server
+    """
+    family, target = parse_address(address)
+    handler = functools.partial(serve_connection, dispatcher)
+    if family == "unix":
+        if os.path.exists(target):
+            # Replace a socket left behind by a server that is no longer running
+            try:
+                ServerConnection(address, timeout=1).terminate()
+            except OSError:
+                os.unlink(target)
+            else:
+                raise RuntimeError(f"A server is already listening on {address}")
+        return await asyncio.start_unix_server(
+            handler, path=target, limit=MAX_LINE_BYTES
+        )
+    host, port = target
+    return await asyncio.start_server(handler, host, port, limit=MAX_LINE_BYTES)
+
+
+async def run_server(listen=LISTEN_ADDRESS):
+    """
+    Run the MCP server with the fixed transport.
+
+    Args:
+        listen: Socket address to serve many clients on; stdio when empty
+
+    Returns:
+        Whether the shutdown abandoned tool calls still running on worker
+        threads, which a normal interpreter exit would wait for
+    """
+    dispatcher = RequestDispatcher()
+    try:
+        # Failing to bind the listener is fatal
+        server = await start_listener(listen, dispatcher) if listen else None
+        metrics.start_exporters()
+    except Exception:
+        dispatcher.close()
+        raise
+
+    # SIGTERM starts a graceful shutdown instead of killing the process
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+    except (NotImplementedError, RuntimeError):
+        logger.warning("Graceful shutdown on SIGTERM is not supported here")
+
+    try:
+        if server is not None:
+            # The tools load in the background; clients can connect meanwhile
+            dispatcher.start()
+            logger.info(
+                "Listening on %s (lanes %s, JSON codec %s)",
+                listen,
+                dispatcher.admission.describe(),
+                codec.BACKEND,
+            )
+            serving = asyncio.create_task(server.serve_forever())
+        else:
+            logger.info("Setting up fixed transport")
+            transport = FixedStdioTransport()
+            transport.start()
+
+            # The ready message goes out first; the tools load in the background
+            dispatcher.start()
+            logger.info(
+                "Starting MCP server loop (lanes %s, JSON codec %s)",
+                dispatcher.admission.describe(),
+                codec.BACKEND,
+            )
+            serving = asyncio.create_task(serve(transport, dispatcher))
+
+        stopping = asyncio.create_task(stop.wait())
+        await asyncio.wait({serving, stopping}, return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+
+        if stop.is_set():
+            logger.info("Received SIGTERM, shutting down")
+            if server is not None:
+                # Stop accepting connections; connected clients are drained
+                server.close()
+            await dispatcher.shutdown()
+        serving.cancel()
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
 
     except KeyboardInterrupt:
         logger.info("Server interrupted by user")
-    except Exception as e:
-        logger.error(f"Unhandled exception in server loop: {e}")
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Unhandled exception in server loop")
+    finally:
+        if server is not None:
+            server.close()
+            family, target = parse_address(listen)
+            if family == "unix" and os.path.exists(target):
+                os.unlink(target)
+        dispatcher.close()
+    return dispatcher.abandoned
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Search MCP server.")
+    parser.add_argument(
+        "--listen",
+        metavar="ADDRESS",
+        default=LISTEN_ADDRESS,
+        help=(
+            "serve many clients on a socket instead of stdio: unix:/path or "
+            "tcp:HOST:PORT (default: $MCP_LISTEN_ADDRESS)"
+        ),
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
     logger.info("Starting final fixed Search MCP server...")
     try:
-        asyncio.run(run_server())
+        abandoned = asyncio.run(run_server(args.listen))
         logger.info("MCP server finished")
-    except Exception as e:
-        logger.error(f"Error running MCP server: {e}")
-        traceback.print_exc()
+        if abandoned:
+            # Worker threads can't be interrupted, and exiting normally joins
+            # them; exit now rather than wait on a stuck tool past the grace
+            logger.warning("Exiting without waiting for stuck tool calls")
+            shutdown_logging()
+            sys.stdout.flush()
+            os._exit(0)
+    except KeyboardInterrupt:
+        logger.info("MCP server stopped")
+    except Exception:
+        logger.exception("Error running MCP server")
         sys.exit(1)
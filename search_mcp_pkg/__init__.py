@@ -1,17 +1,39 @@
 # search_mcp_pkg/__init__.py
-from .core import (
-    search,
-    search_products_by_category,
-    search_products_by_brand,
-    index_product,
-    create_ecommerce_test_index,
-    create_test_index,
-    DEFAULT_INDEX,
-    es,
-    mcp,
+#
+# The tools and clients live in .core, which is only imported when one of
+# them is first accessed, so that lightweight modules such as .codec and
+# .logging_utils can be imported without loading Elasticsearch, OpenAI or
+# FastMCP.
+import importlib
+
+_CORE_EXPORTS = (
+    "search",
+    "search_products_by_category",
+    "search_products_by_brand",
+    "index_product",
+    "sync_products",
+    "create_ecommerce_test_index",
+    "create_test_index",
+    "migrate_index",
+    "server_stats",
+    "DEFAULT_INDEX",
+    "es",
+    "mcp",
 )
 
+__all__ = list(_CORE_EXPORTS)
+
 # Package metadata
 __version__ = "0.1.0"
 __author__ = "Your Name"
 __description__ = "E-commerce search with Elasticsearch and LLM query planning"
+
+
+def __getattr__(name):
+    if name in _CORE_EXPORTS:
+        return getattr(importlib.import_module(".core", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Admission control for Search MCP tool calls.
+
+Every tool call has to get a slot in a lane before it runs. A lane allows a
+fixed number of concurrent calls and a bounded number of calls waiting for
+a slot. LLM-backed tools (search) and the cheap structured tools have
+separate lanes, so a burst of slow searches can't starve category and brand
+lookups. Individual tools can get a lane of their own on top of that.
+
+A call is rejected right away, with an estimate of when to retry, if its
+lane's queue is full. It is also rejected if it waits longer than
+MCP_MAX_QUEUE_WAIT for a slot.
+"""
+
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+# Tools whose calls wait on the LLM
+LLM_TOOLS = frozenset({"search"})
+
+# Concurrent calls and waiting calls allowed for LLM-backed tools
+LLM_CONCURRENCY = int(os.getenv("MCP_LLM_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("MCP_LLM_MAX_QUEUE", "16"))
+
+# Concurrent calls and waiting calls allowed for all other tools
+TOOL_CONCURRENCY = int(os.getenv("MCP_MAX_CONCURRENCY", "8"))
+TOOL_MAX_QUEUE = int(os.getenv("MCP_MAX_QUEUE", "64"))
+
+# Longest a call may wait for a slot, in seconds
+MAX_QUEUE_WAIT = float(os.getenv("MCP_MAX_QUEUE_WAIT", "10"))
+
+# Extra per-tool concurrency limits, e.g. "migrate_index=1,create_test_index=1"
+TOOL_LIMITS = os.getenv("MCP_TOOL_LIMITS", "")
+
+# Bounds of the retry_after hint, in seconds
+MIN_RETRY_AFTER = 0.1
+MAX_RETRY_AFTER = 30.0
+
+
+class Overloaded(Exception):
+    """Raised when a call can't be admitted; carries a retry_after hint."""
+
+    def __init__(self, lane: str, retry_after: float, reason: str):
+        super().__init__(f"Server busy ({lane}): {reason}")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class Lane:
+    """
+    A concurrency limit with a bounded queue of waiting calls.
+
+    The lane also keeps a moving average of how long its calls run, which
+    is used to estimate when a rejected call is worth retrying.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.service_time = 1.0
+
+    def retry_after(self) -> float:
+        """Estimate how long until a new call would get a slot, in seconds."""
+        backlog = (self.waiting + 1) / self.concurrency
+        estimate = backlog * self.service_time
+        return round(min(max(estimate, MIN_RETRY_AFTER), MAX_RETRY_AFTER), 1)
+
+    def reject(self, reason: str) -> Overloaded:
+        self.rejected += 1
+        return Overloaded(self.name, self.retry_after(), reason)
+
+    async def acquire(self, timeout: float) -> None:
+        """
+        Wait for a slot.
+
+        Raises:
+            Overloaded: If the queue is full or no slot frees up in time
+        """
+        if not self.semaphore.locked():
+            await self.semaphore.acquire()
+            self.active += 1
+            return
+        if self.waiting >= self.max_queue:
+            raise self.reject(f"{self.waiting} calls already queued")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise self.reject(f"no slot within {timeout:g}s") from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self, service_time: float) -> None:
+        """Free a slot, recording how long the call held it."""
+        self.active -= 1
+        self.semaphore.release()
+        self.service_time = 0.8 * self.service_time + 0.2 * service_time
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "service_time": round(self.service_time, 3),
+        }
+
+
+def parse_tool_limits(spec: str) -> Dict[str, int]:
+    """
+    Parse per-tool limits written as "tool=limit,tool=limit".
+
+    Raises:
+        ValueError: If an entry is malformed
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        tool, sep, limit = entry.partition("=")
+        if not sep or not limit.strip().isdigit():
+            raise ValueError(f"Invalid tool limit: {entry!r}")
+        limits[tool.strip()] = int(limit)
+    return limits
+
+
+class AdmissionController:
+    """Assigns tool calls to lanes and admits them when a slot is free."""
+
+    def __init__(
+        self,
+        llm_concurrency: int = LLM_CONCURRENCY,
+        llm_max_queue: int = LLM_MAX_QUEUE,
+        tool_concurrency: int = TOOL_CONCURRENCY,
+        tool_max_queue: int = TOOL_MAX_QUEUE,
+        max_queue_wait: float = MAX_QUEUE_WAIT,
+        tool_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.llm = Lane("llm", llm_concurrency, llm_max_queue)
+        self.tools = Lane("tools", tool_concurrency, tool_max_queue)
+        self.max_queue_wait = max_queue_wait
+        if tool_limits is None:
+            tool_limits = parse_tool_limits(TOOL_LIMITS)
+        # Per-tool lanes queue as deep as the lane of their class
+        self.tool_lanes = {
+            tool: Lane(
+                tool,
+                limit,
+                (self.llm if tool in LLM_TOOLS else self.tools).max_queue,
+            )
+            for tool, limit in tool_limits.items()
+        }
+
+    @property
+    def max_workers(self) -> int:
+        """Worker threads needed to run every admitted call at once."""
+        return self.llm.concurrency + self.tools.concurrency
+
+    def lanes_for(self, tool: str) -> List[Lane]:
+        """Get the lanes a call to a tool needs a slot in, in acquisition order."""
+        lanes = [self.llm if tool in LLM_TOOLS else self.tools]
+        if tool in self.tool_lanes:
+            lanes.insert(0, self.tool_lanes[tool])
+        return lanes
+
+    async def acquire(self, tool: str) -> Tuple[List[Lane], float]:
+        """
+        Wait for the slots a call needs.
+
+        Cancelling the wait takes the call out of its lanes' queues, keeping
+        no slot.
+
+        Args:
+            tool: The name of the tool being called
+
+        Returns:
+            The lanes the call holds a slot in, to pass to release(), and how
+            long it waited for them, in seconds
+
+        Raises:
+            Overloaded: If the call is rejected
+        """
+        queued = time.perf_counter()
+        deadline = queued + self.max_queue_wait
+        acquired = []
+        try:
+            for lane in self.lanes_for(tool):
+                await lane.acquire(max(0.0, deadline - time.perf_counter()))
+                acquired.append(lane)
+        except BaseException:
+            self.release(acquired)
+            raise
+        return acquired, time.perf_counter() - queued
+
+    def release(self, lanes: List[Lane], service_time: Optional[float] = None) -> None:
+        """
+        Free the slots of a call.
+
+        Args:
+            lanes: The lanes returned by acquire()
+            service_time: How long the call held the slots, in seconds, if it
+                ran (a call that didn't run leaves the lanes' estimates alone)
+        """
+        for lane in lanes:
+            lane.release(lane.service_time if service_time is None else service_time)
+
+    @asynccontextmanager
+    async def admit(self, tool: str) -> AsyncIterator[float]:
+        """
+        Hold slots for a call while it runs.
+
+        Args:
+            tool: The name of the tool being called
+
+        Yields:
+            How long the call waited for its slots, in seconds
+
+        Raises:
+            Overloaded: If the call is rejected
+        """
+        lanes, queue_time = await self.acquire(tool)
+        started = time.perf_counter()
+        try:
+            yield queue_time
+        finally:
+            self.release(lanes, time.perf_counter() - started)
+
+    def describe(self) -> str:
+        """Describe the configured limits, e.g. for a startup log line."""
+        lanes = [self.llm, self.tools, *self.tool_lanes.values()]
+        return ", ".join(
+            f"{lane.name} {lane.concurrency}+{lane.max_queue} queued" for lane in lanes
+        )
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Get the current state of every lane."""
+        lanes = [self.llm, self.tools, *self.tool_lanes.values()]
+        return {lane.name: lane.snapshot() for lane in lanes}
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Cooperative cancellation of tool calls.
+
+The server runs each tool call on a worker thread with a CancelToken bound
+to it. Worker threads can't be interrupted, so tools check the token
+between stages (and while streaming the LLM response) and raise
+RequestCancelled once the client has cancelled the request. That returns
+the worker thread to the pool early.
+"""
+
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class RequestCancelled(Exception):
+    """Raised inside a tool call whose request has been cancelled."""
+
+
+class CancelToken:
+    """
+    Cancellation state of one request.
+
+    Attributes:
+        request_id: The id of the cancelled request, as sent by the client
+        opaque_id: A unique tag attached to the Elasticsearch requests made on
+            behalf of the request, so they can be found and cancelled
+    """
+
+    __slots__ = ("request_id", "opaque_id", "_event")
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id
+        self.opaque_id = f"search-mcp-{uuid.uuid4().hex}"
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """Mark the request as cancelled; safe to call from any thread."""
+        self._event.set()
+
+    def raise_if_cancelled(self) -> None:
+        """Raise RequestCancelled if the request has been cancelled."""
+        if self._event.is_set():
+            raise RequestCancelled(f"Request {self.request_id} was cancelled")
+
+
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar(
+    "cancel_token", default=None
+)
+
+
+def current_token() -> Optional[CancelToken]:
+    """Get the token of the request being handled, if any."""
+    return _current_token.get()
+
+
+def check_cancelled() -> None:
+    """Raise RequestCancelled if the request being handled has been cancelled."""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+@contextmanager
+def cancel_scope(token: CancelToken) -> Iterator[CancelToken]:
+    """Bind a token to the code running in this context (e.g. a tool call)."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
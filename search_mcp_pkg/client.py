@@ -1,70 +1,652 @@
 #!/usr/bin/env python3
 """
 LLM-powered MCP client for the Search MCP server.
+
+AsyncMCPClient pipelines requests over one connection: any number of calls
+can be outstanding at once, each matched to its response by id, so calls can
+be issued together with asyncio.gather. If the server process exits or the
+connection drops, the next call restarts the server (or reconnects to it).
+MCPClient is a synchronous wrapper around it.
 """
 
 import json
+import asyncio
+import logging
 import subprocess
+import threading
+import time
 import uuid
 import os
-from typing import Dict, Any, List
+from concurrent.futures import Future
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from . import codec
+from .connection import SERVER_ADDRESS, parse_address
+from .framing import (
+    COMPRESSION,
+    FRAMING,
+    HEADER,
+    MAX_MESSAGE_BYTES,
+    decode_payload,
+    encode_frame,
+    parse_header,
+)
+from .history import ConversationHistory
+from .session_cache import SESSION_CACHE_TTL, SessionCache
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
 
-class MCPClient:
-    """Simple MCP client for interacting with the Search MCP server."""
+# Seconds to wait for the response to a call (0 waits indefinitely)
+CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "0")) or None
+
+# Times a lost server is restarted (or reconnected to) before a call fails,
+# and the delay before the first retry, doubled after each one
+RECONNECT_ATTEMPTS = int(os.getenv("MCP_RECONNECT_ATTEMPTS", "3"))
+RECONNECT_BACKOFF = 0.5
+
+# Seconds a closed server process gets to exit before it is killed
+SERVER_EXIT_TIMEOUT = 5.0
 
-    def __init__(self, server_command: List[str]):
+# Server processes MCPClient spreads its calls over (see pool.py); 0 or 1 uses
+# a single connection
+POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "0"))
+
+
+class AsyncMCPClient:
+    """Asyncio MCP client with request pipelining and automatic reconnects."""
+
+    def __init__(
+        self,
+        server_command: Optional[List[str]] = None,
+        address: Optional[str] = SERVER_ADDRESS or None,
+        framing: str = FRAMING,
+        compression: Optional[str] = COMPRESSION,
+        max_response_bytes: Optional[int] = None,
+        timeout: Optional[float] = CALL_TIMEOUT,
+        reconnect_attempts: int = RECONNECT_ATTEMPTS,
+        cache_ttl: float = SESSION_CACHE_TTL,
+    ):
         """
-        Initialize the MCP client.
+        Initialize the client; it connects on first use (or with connect()).
 
         Args:
             server_command: Command to start the MCP server
+            address: Address of a shared server to connect to instead of
+                starting one (defaults to MCP_SERVER_ADDRESS)
+            framing: "length" to switch to length-prefixed frames if the
+                server supports them (defaults to MCP_FRAMING)
+            compression: "zlib" to have large frames compressed (defaults to
+                MCP_COMPRESSION)
+            max_response_bytes: Limit on the size of each tool result
+            timeout: Default seconds to wait for each response (None waits
+                indefinitely)
+            reconnect_attempts: Times to retry starting or connecting to the
+                server before giving up
+            cache_ttl: Seconds to reuse the results of repeated read-only
+                calls (defaults to MCP_SESSION_CACHE_TTL; 0 disables the cache)
+        """
+        if not address and not server_command:
+            raise ValueError("Either a server command or an address is required")
+        self.server_command = server_command
+        self.address = address
+        self.requested_framing = framing
+        self.requested_compression = compression
+        self.max_response_bytes = max_response_bytes
+        self.timeout = timeout
+        self.reconnect_attempts = reconnect_attempts
+        self.cache = SessionCache(cache_ttl) if cache_ttl > 0 else None
+
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.framing = "line"
+        self.compression = None
+        # Futures of the requests waiting for a response, by request id
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.read_task: Optional[asyncio.Task] = None
+        self.connect_lock = asyncio.Lock()
+        self.write_lock = asyncio.Lock()
+        self.tools_info: Dict[str, Any] = {}
+        self.available_tools: Dict[str, Any] = {}
+        # Connections made so far; more than one means the server was restarted
+        self.connections = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.read_task is not None and not self.read_task.done()
+
+    async def __aenter__(self) -> "AsyncMCPClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def connect(self) -> None:
         """
-        self.process = subprocess.Popen(
-            server_command,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
+        Start (or connect to) the server unless already connected.
+
+        Raises:
+            ConnectionError: If the server can't be reached after all retries
+        """
+        async with self.connect_lock:
+            if self.connected:
+                return
+            delay = RECONNECT_BACKOFF
+            for attempt in range(self.reconnect_attempts + 1):
+                try:
+                    await self._open()
+                    break
+                except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                    await self._close_connection()
+                    if attempt == self.reconnect_attempts:
+                        raise ConnectionError(
+                            f"Could not connect to the MCP server: {e}"
+                        ) from e
+                    logger.warning(
+                        "Could not connect to the MCP server (%s); retrying in %gs",
+                        e,
+                        delay,
+                    )
+                    await asyncio.sleep(delay)
+                    delay *= 2
+            await self._refresh_tools()
+
+    async def _open(self) -> None:
+        """Open a connection, read the ready message and negotiate framing."""
+        await self._close_connection()
+        if self.address:
+            family, target = parse_address(self.address)
+            if family == "unix":
+                reader, writer = await asyncio.open_unix_connection(
+                    target, limit=MAX_MESSAGE_BYTES
+                )
+            else:
+                reader, writer = await asyncio.open_connection(
+                    *target, limit=MAX_MESSAGE_BYTES
+                )
+        else:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.server_command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                limit=MAX_MESSAGE_BYTES,
+            )
+            reader, writer = self.process.stdout, self.process.stdin
+        self.reader, self.writer = reader, writer
+        self.framing, self.compression = "line", None
+
+        ready = await self._read()
+        if not ready or ready.get("type") != "ready":
+            raise ConnectionError(f"Expected a ready message, got {ready!r}")
+        if self.requested_framing != "line" and self.requested_framing in ready.get(
+            "framing", []
+        ):
+            await self._write(
+                {
+                    "id": str(uuid.uuid4()),
+                    "type": "hello",
+                    "framing": self.requested_framing,
+                    "compression": self.requested_compression,
+                }
+            )
+            response = await self._read()
+            if response and response.get("type") == "hello_response":
+                self.framing = response["framing"]
+                self.compression = response.get("compression")
+
+        self.read_task = asyncio.create_task(self._read_loop())
+        self.connections += 1
+
+    async def _read(self) -> Optional[Dict[str, Any]]:
+        """Read one message from the server; None at end of stream."""
+        if self.framing == "length":
+            try:
+                length, flags = parse_header(
+                    await self.reader.readexactly(HEADER.size), MAX_MESSAGE_BYTES
+                )
+                payload = await self.reader.readexactly(length)
+            except asyncio.IncompleteReadError:
+                return None
+            return codec.loads(decode_payload(payload, flags, MAX_MESSAGE_BYTES))
+
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return None
+            if line.strip():
+                return codec.loads(line)
+
+    async def _write(self, message: Dict[str, Any]) -> None:
+        """Send one message to the server."""
+        payload = codec.dumps_bytes(message)
+        if self.framing == "length":
+            data = encode_frame(payload, self.compression)
+        else:
+            data = payload + b"\n"
+        async with self.write_lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def _read_loop(self) -> None:
+        """Hand each message from the server to the request waiting for it."""
+        try:
+            while True:
+                message = await self._read()
+                if message is None:
+                    break
+                future = self.pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+                else:
+                    logger.debug("Dropping unmatched message: %s", message)
+        except Exception as e:
+            logger.warning("Lost the connection to the MCP server: %s", e)
+        finally:
+            pending, self.pending = self.pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(
+                        ConnectionError("The MCP server connection was lost")
+                    )
+
+    async def _exchange(
+        self, message: Dict[str, Any], timeout: Optional[float]
+    ) -> Dict[str, Any]:
+        """
+        Send a request on the current connection and wait for its response.
+
+        Raises:
+            TimeoutError: If no response arrives in time (the server is told
+                to cancel the request)
+            ConnectionError: If the connection is lost first
+        """
+        request_id = message["id"]
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            await self._write(message)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            await self.cancel(request_id)
+            raise TimeoutError(
+                f"No response to {message['type']} {request_id} within {timeout}s"
+            ) from None
+        except asyncio.CancelledError:
+            # The caller gave up; stop the server working on it too
+            asyncio.create_task(self.cancel(request_id))
+            raise
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _request(
+        self, message: Dict[str, Any], timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Send a request, reconnecting first if the server was lost."""
+        await self.connect()
+        return await self._exchange(message, timeout or self.timeout)
+
+    async def _refresh_tools(self) -> None:
+        """Fetch the tool manifest unless the cached one is still current."""
+        message = {"id": str(uuid.uuid4()), "type": "list_tools"}
+        if self.tools_info.get("version"):
+            message["if_none_match"] = self.tools_info["version"]
+        response = await self._exchange(message, self.timeout)
+        if response.get("type") == "list_tools_response" and not response.get(
+            "not_modified"
+        ):
+            self.tools_info = response
+            self.available_tools = {
+                tool["name"]: tool for tool in response.get("tools", [])
+            }
+
+    async def list_tools(self) -> Dict[str, Any]:
+        """
+        List the available tools from the MCP server.
+
+        The manifest is cached; the server only sends it again when its
+        version differs from the cached one.
+        """
+        await self.connect()
+        await self._refresh_tools()
+        return self.tools_info
+
+    async def stats(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Get the server's metrics.
+
+        The server answers this even while its tools are loading or its
+        workers are busy, so it doubles as a health check.
+        """
+        response = await self._request(
+            {"id": str(uuid.uuid4()), "type": "stats"}, timeout
         )
+        return response.get("stats", {})
+
+    async def call_tool(
+        self,
+        tool_name: str,
+        args: Optional[Dict[str, Any]] = None,
+        *,
+        timeout: Optional[float] = None,
+        request_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Call a tool on the MCP server.
 
-        # Read the initial message from the server
-        self._read_message()
+        Calls are pipelined, so several can be awaited together (e.g. with
+        asyncio.gather) over the one connection. With a session cache,
+        repeated read-only calls are answered from it (marked "cached").
 
-        # Get available tools
-        self.tools_info = self.list_tools()
-        self.available_tools = {
-            tool["name"]: tool for tool in self.tools_info.get("tools", [])
+        Args:
+            tool_name: Name of the tool to call
+            args: Arguments to pass to the tool
+            timeout: Seconds to wait for the response (defaults to the
+                client's timeout)
+            request_id: Id of the call, to cancel it by (a new one by default)
+
+        Returns:
+            The response from the MCP server
+
+        Raises:
+            TimeoutError: If the response doesn't arrive in time
+            ConnectionError: If the server is lost and can't be restarted
+        """
+        args = args or {}
+        message = {
+            "id": request_id or str(uuid.uuid4()),
+            "type": "tool_call",
+            "tool": tool_name,
+            "args": args,
         }
+        if self.max_response_bytes:
+            message["max_response_bytes"] = self.max_response_bytes
+        if self.cache is None:
+            return await self._request(message, timeout)
+        return await self.cache.call(
+            tool_name,
+            args,
+            lambda: self._request(message, timeout),
+            self.max_response_bytes,
+            message["id"],
+        )
+
+    async def call_tools_batch(
+        self,
+        calls: List[Dict[str, Any]],
+        stream: bool = False,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Call several tools with a single message; the server runs them concurrently.
+
+        Args:
+            calls: The calls, each with a tool name and its arguments, e.g.
+                {"tool": "search", "args": {"query": "headphones"}}
+            stream: Have the server send each response as soon as it is ready
+                instead of one response for the whole batch
+            timeout: Seconds to wait for the whole batch
 
-    def _read_message(self) -> Dict[str, Any]:
-        """Read a message from the MCP server."""
-        line = self.process.stdout.readline().strip()
-        if not line:
-            return {}
+        Returns:
+            The response to each call, in call order
+        """
+        if stream:
+            message = self._batch_message(calls, "stream")
+            responses = {}
+            async for response in self._stream_batch(message, timeout):
+                responses[response.get("id")] = response
+            return [responses[call["id"]] for call in message["calls"]]
+
+        message = self._batch_message(calls, "batched")
         try:
-            return json.loads(line)
-        except json.JSONDecodeError:
-            print(f"Error decoding JSON: {line}")
-            return {}
+            response = await self._request(message, timeout)
+        except ConnectionError as e:
+            return self._batch_failure(message, {"error": str(e)})
+        if response.get("type") != "batch_response":
+            return self._batch_failure(message, response)
+        return response["results"]
+
+    async def stream_tools_batch(
+        self, calls: List[Dict[str, Any]], timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Call several tools with a single message and yield responses as they finish.
+
+        Args:
+            calls: The calls, as for call_tools_batch
+            timeout: Seconds to wait for the whole batch
+
+        Yields:
+            The response to each call, in completion order
+        """
+        message = self._batch_message(calls, "stream")
+        async for response in self._stream_batch(message, timeout):
+            yield response
+
+    async def _stream_batch(
+        self, message: Dict[str, Any], timeout: Optional[float]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Send a streamed batch and yield each call's response (or failure)."""
+
+        def answered(future: asyncio.Future) -> bool:
+            return (
+                future.done() and not future.cancelled() and future.exception() is None
+            )
+
+        await self.connect()
+        loop = asyncio.get_running_loop()
+        timeout = timeout or self.timeout
+        deadline = None if timeout is None else loop.time() + timeout
+        futures = {call["id"]: loop.create_future() for call in message["calls"]}
+        batch = loop.create_future()
+        self.pending.update(futures)
+        self.pending[message["id"]] = batch
+        try:
+            await self._write(message)
+            waiting = {batch, *futures.values()}
+            while batch in waiting:
+                remaining = None if deadline is None else max(0, deadline - loop.time())
+                done, waiting = await asyncio.wait(
+                    waiting, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    await self.cancel(message["id"])
+                    raise TimeoutError(f"Batch {message['id']} timed out")
+                for future in done:
+                    if future is not batch and answered(future):
+                        yield future.result()
+
+            # Unless it completed, the batch was cancelled, rejected or lost
+            if batch.cancelled():
+                outcome = {"error": "The batch was cancelled"}
+            elif batch.exception() is not None:
+                outcome = {"error": str(batch.exception())}
+            else:
+                outcome = batch.result()
+            if outcome.get("type") != "batch_complete":
+                for call_id, response in zip(
+                    futures, self._batch_failure(message, outcome)
+                ):
+                    if not answered(futures[call_id]):
+                        yield response
+        finally:
+            for request_id in [message["id"], *futures]:
+                self.pending.pop(request_id, None)
+
+    def _batch_message(self, calls: List[Dict[str, Any]], mode: str) -> Dict[str, Any]:
+        """Build a batch message, giving each call an ID to match its response."""
+        message = {
+            "id": str(uuid.uuid4()),
+            "type": "batch",
+            "mode": mode,
+            "calls": [
+                {
+                    "id": call.get("id") or str(uuid.uuid4()),
+                    "tool": call["tool"],
+                    "args": call.get("args", {}),
+                }
+                for call in calls
+            ],
+        }
+        if self.max_response_bytes:
+            message["max_response_bytes"] = self.max_response_bytes
+        return message
+
+    def _batch_failure(
+        self, message: Dict[str, Any], response: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Turn the failure of a whole batch into an error response per call."""
+        error = response.get("error", "No response from server")
+        return [
+            {"id": call["id"], "type": "error", "error": error}
+            for call in message["calls"]
+        ]
+
+    async def cancel(self, request_id: str) -> None:
+        """
+        Cancel a tool call or batch that is still running on the server.
+
+        The server stops working on the request and sends no response for it.
+
+        Args:
+            request_id: The id of the tool_call or batch message
+        """
+        future = self.pending.pop(request_id, None)
+        if future is not None and not future.done():
+            future.cancel()
+        if self.connected:
+            try:
+                await self._write({"type": "cancel", "request_id": request_id})
+            except (OSError, RuntimeError) as e:
+                logger.debug("Could not send cancel for %s: %s", request_id, e)
+
+    async def _close_connection(self) -> None:
+        """Close the current connection and stop its server process, if any."""
+        if self.read_task is not None:
+            self.read_task.cancel()
+            try:
+                await self.read_task
+            except asyncio.CancelledError:
+                pass
+            self.read_task = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.process is not None:
+            if self.process.returncode is None:
+                self.process.terminate()
+                try:
+                    await asyncio.wait_for(self.process.wait(), SERVER_EXIT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self.process.kill()
+                    await self.process.wait()
+            self.process = None
+
+    async def close(self) -> None:
+        """Close the connection to the MCP server."""
+        async with self.connect_lock:
+            await self._close_connection()
 
-    def _send_message(self, message: Dict[str, Any]) -> None:
-        """Send a message to the MCP server."""
-        json_message = json.dumps(message)
-        self.process.stdin.write(json_message + "\n")
-        self.process.stdin.flush()
+
+class MCPClient:
+    """
+    Synchronous MCP client for interacting with the Search MCP server.
+
+    A wrapper around AsyncMCPClient (or MCPClientPool, for several
+    servers), which runs on an event loop in a background thread.
+    """
+
+    def __init__(
+        self,
+        server_command: Optional[List[str]] = None,
+        address: Optional[str] = SERVER_ADDRESS or None,
+        framing: str = FRAMING,
+        compression: Optional[str] = COMPRESSION,
+        max_response_bytes: Optional[int] = None,
+        timeout: Optional[float] = CALL_TIMEOUT,
+        pool_size: int = POOL_SIZE,
+        cache_ttl: float = SESSION_CACHE_TTL,
+    ):
+        """
+        Initialize the MCP client and connect to the server.
+
+        Args:
+            server_command: Command to start the MCP server
+            address: Address of a shared server to connect to instead of
+                starting one (defaults to MCP_SERVER_ADDRESS); several
+                comma-separated addresses are used as a pool
+            framing: "length" to switch to length-prefixed frames if the
+                server supports them (defaults to MCP_FRAMING)
+            compression: "zlib" to have large frames compressed (defaults to
+                MCP_COMPRESSION)
+            max_response_bytes: Limit on the size of each tool result
+            timeout: Seconds to wait for each response (None waits indefinitely)
+            pool_size: Start this many server processes and spread calls
+                over them (defaults to MCP_POOL_SIZE; 0 or 1 starts one)
+            cache_ttl: Seconds to reuse the results of repeated searches
+                (defaults to MCP_SESSION_CACHE_TTL; 0 disables the cache)
+        """
+        options = {
+            "framing": framing,
+            "compression": compression,
+            "max_response_bytes": max_response_bytes,
+            "timeout": timeout,
+            "cache_ttl": cache_ttl,
+        }
+        addresses = [part.strip() for part in (address or "").split(",") if part]
+        if len(addresses) > 1 or (not addresses and pool_size > 1):
+            from .pool import MCPClientPool
+
+            self.client = MCPClientPool(
+                server_command, addresses, size=pool_size, **options
+            )
+        else:
+            self.client = AsyncMCPClient(server_command, address, **options)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="mcp-client", daemon=True
+        )
+        self.thread.start()
+        try:
+            self._run(self.client.connect())
+        except BaseException:
+            self._stop_loop()
+            raise
+
+    def _run(self, coroutine: Any) -> Any:
+        """Run a coroutine on the client's event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    @property
+    def tools_info(self) -> Dict[str, Any]:
+        return self.client.tools_info
+
+    @property
+    def available_tools(self) -> Dict[str, Any]:
+        return self.client.available_tools
+
+    @property
+    def max_response_bytes(self) -> Optional[int]:
+        return self.client.max_response_bytes
+
+    @max_response_bytes.setter
+    def max_response_bytes(self, value: Optional[int]) -> None:
+        self.client.max_response_bytes = value
 
     def list_tools(self) -> Dict[str, Any]:
-        """List the available tools from the MCP server."""
-        message = {"id": str(uuid.uuid4()), "type": "list_tools"}
-        self._send_message(message)
-        return self._read_message()
+        """
+        List the available tools from the MCP server.
+
+        The manifest is cached; the server only sends it again when its
+        version differs from the cached one.
+        """
+        return self._run(self.client.list_tools())
 
     def call_tool(self, tool_name: str, **kwargs) -> Dict[str, Any]:
         """
@@ -77,41 +659,136 @@ class MCPClient:
         Returns:
             The response from the MCP server
         """
-        message = {
-            "id": str(uuid.uuid4()),
-            "type": "tool_call",
-            "tool": tool_name,
-            "args": kwargs,
-        }
-        self._send_message(message)
-        return self._read_message()
+        return self._run(self.client.call_tool(tool_name, kwargs))
+
+    def submit_tool(
+        self, tool_name: str, *, request_id: Optional[str] = None, **kwargs
+    ) -> Future:
+        """
+        Start a tool call without waiting for its response.
+
+        Args:
+            tool_name: Name of the tool to call
+            request_id: Id of the call, to cancel it by with cancel() (a new
+                one by default)
+            **kwargs: Arguments to pass to the tool
+
+        Returns:
+            A future resolved with the response from the MCP server
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.client.call_tool(tool_name, kwargs, request_id=request_id),
+            self.loop,
+        )
+
+    def call_tools_batch(
+        self, calls: List[Dict[str, Any]], stream: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Call several tools with a single message; the server runs them concurrently.
+
+        Args:
+            calls: The calls, each with a tool name and its arguments, e.g.
+                {"tool": "search", "args": {"query": "headphones"}}
+            stream: Have the server send each response as soon as it is ready
+                instead of one response for the whole batch
+
+        Returns:
+            The response to each call, in call order
+        """
+        return self._run(self.client.call_tools_batch(calls, stream))
+
+    def stream_tools_batch(
+        self, calls: List[Dict[str, Any]]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Call several tools with a single message and yield responses as they finish.
+
+        Args:
+            calls: The calls, as for call_tools_batch
+
+        Yields:
+            The response to each call, in completion order
+        """
+        responses = self.client.stream_tools_batch(calls)
+        while True:
+            try:
+                yield self._run(responses.__anext__())
+            except StopAsyncIteration:
+                return
+
+    def cancel(self, request_id: str) -> None:
+        """
+        Cancel a tool call or batch that is still running on the server.
+
+        The server stops working on the request and sends no response for it.
+        With a pool, the call is cancelled on whichever worker has it.
+
+        Args:
+            request_id: The id of the tool_call or batch message (e.g. the
+                request_id given to submit_tool, or a call's id in a batch)
+        """
+        self._run(self.client.cancel(request_id))
+
+    def worker_stats(self) -> List[Dict[str, Any]]:
+        """Report each pool worker's load and latency (empty without a pool)."""
+        if not hasattr(self.client, "worker_stats"):
+            return []
+        return self.client.worker_stats()
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Report the session cache's hits and misses (None if it is off)."""
+        if self.client.cache is None:
+            return None
+        return self.client.cache.stats()
+
+    def _stop_loop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=SERVER_EXIT_TIMEOUT)
+        self.loop.close()
 
     def close(self) -> None:
         """Close the connection to the MCP server."""
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
+        if self.loop.is_closed():
+            return
+        try:
+            self._run(self.client.close())
+        finally:
+            self._stop_loop()
 
 
 class LLMPoweredMCPClient:
     """LLM-powered MCP client that uses an LLM to decide which tools to call."""
 
-    def __init__(self, server_command: List[str]):
+    def __init__(
+        self,
+        server_command: Optional[List[str]] = None,
+        address: Optional[str] = SERVER_ADDRESS or None,
+    ):
         """
         Initialize the LLM-powered MCP client.
 
         Args:
             server_command: Command to start the MCP server
+            address: Address of a shared server to connect to instead of
+                starting one (defaults to MCP_SERVER_ADDRESS)
         """
-        self.mcp_client = MCPClient(server_command)
+        self.mcp_client = MCPClient(server_command, address)
         self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 
         # Create a system prompt with tool descriptions
         self.system_prompt = self._create_system_prompt()
 
-        # Conversation history
-        self.conversation_history = [{"role": "system", "content": self.system_prompt}]
+        # Conversation history, compacted to a token budget before each request
+        self.history = ConversationHistory(self.system_prompt)
+
+        # Time to first token and to the complete response of the last query
+        self.last_timings: Dict[str, Optional[float]] = {}
+
+    @property
+    def conversation_history(self) -> List[Dict[str, Any]]:
+        return self.history.messages
 
     def _create_system_prompt(self) -> str:
         """Create a system prompt with tool descriptions."""
@@ -121,7 +798,7 @@ class LLMPoweredMCPClient:
             [
                 f"Tool: {tool['name']}\n"
                 f"Description: {tool.get('description', 'No description')}\n"
-                f"Parameters: {json.dumps(tool.get('parameters', {}), indent=2)}"
+                f"Parameters: {json.dumps(tool.get('input_schema', {}), indent=2)}"
                 for tool in tools_info
             ]
         )
@@ -152,6 +829,17 @@ If you need to have a conversation with the user without calling a tool, respond
 Always think carefully about which tool is most appropriate for the user's request.
 """
 
+    @staticmethod
+    def _tool_request(response_json: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """The tool and parameters an LLM response asks for, if well formed."""
+        if not isinstance(response_json, dict):
+            return None
+        tool_name = response_json.get("tool")
+        parameters = response_json.get("parameters")
+        if not isinstance(tool_name, str) or not isinstance(parameters, dict):
+            return None
+        return tool_name, parameters
+
     def process_query(self, user_query: str) -> str:
         """
         Process a user query using the LLM to decide which tool to call.
@@ -163,40 +851,84 @@ Always think carefully about which tool is most appropriate for the user's reque
             The response to the user
         """
         # Add user query to conversation history
-        self.conversation_history.append({"role": "user", "content": user_query})
-
-        # Get LLM response
-        llm_response = self.openai_client.chat.completions.create(
-            model=self.model, messages=self.conversation_history, temperature=0.1
+        self.history.add_user(user_query)
+
+        # Stream the LLM response; a tool call starts as soon as the JSON
+        # decision is complete, without waiting for the rest of the stream
+        started = time.perf_counter()
+        stream = self.openai_client.chat.completions.create(
+            model=self.model,
+            messages=self.history.prepare(),
+            temperature=0.1,
+            stream=True,
         )
-
-        llm_content = llm_response.choices[0].message.content
+        logger.info("%s", self.history.describe())
+
+        llm_content = ""
+        first_token = None
+        response_json = None
+        pending_tool = None
+        for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if not text:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            llm_content += text
+            # A top-level JSON object is complete once it parses
+            if response_json is None and llm_content.rstrip().endswith("}"):
+                try:
+                    response_json = json.loads(llm_content)
+                except json.JSONDecodeError:
+                    continue
+                tool_request = self._tool_request(response_json)
+                if tool_request is not None:
+                    tool_name, parameters = tool_request
+                    pending_tool = self.mcp_client.submit_tool(tool_name, **parameters)
+
+        self.last_timings = {
+            "first_token": first_token,
+            "completion": time.perf_counter() - started,
+        }
+        if first_token is not None:
+            logger.info(
+                "LLM response: first token after %.2fs, complete after %.2fs",
+                first_token,
+                self.last_timings["completion"],
+            )
 
         # Add LLM response to conversation history
-        self.conversation_history.append({"role": "assistant", "content": llm_content})
+        self.history.add({"role": "assistant", "content": llm_content})
 
         # Parse LLM response
         try:
-            response_json = json.loads(llm_content)
+            if response_json is None:
+                response_json = json.loads(llm_content)
+            if not isinstance(response_json, dict):
+                return "Error: Invalid LLM response format"
 
             # If the LLM wants to send a message without calling a tool
             if "message" in response_json:
                 return response_json["message"]
 
             # If the LLM wants to call a tool
-            if "tool" in response_json and "parameters" in response_json:
-                tool_name = response_json["tool"]
-                parameters = response_json["parameters"]
+            tool_request = self._tool_request(response_json)
+            if tool_request is not None:
+                tool_name, parameters = tool_request
 
-                # Call the tool
-                tool_response = self.mcp_client.call_tool(tool_name, **parameters)
+                # Call the tool, unless the call started while streaming
+                if pending_tool is not None:
+                    tool_response = pending_tool.result()
+                else:
+                    tool_response = self.mcp_client.call_tool(tool_name, **parameters)
 
                 # Add tool response to conversation history
-                self.conversation_history.append(
+                self.history.add_tool_result(
                     {
                         "role": "system",
                         "content": f"Tool response: {tool_response.get('result', 'No result')}",
-                    }
+                    },
+                    tool_name,
                 )
 
                 return tool_response.get("result", "Error: No result from tool")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+JSON codec for the Search MCP line protocol.
+
+Uses orjson or msgspec when one of them is installed and falls back to the
+standard library otherwise. The backend can be forced with the
+MCP_JSON_CODEC environment variable ("orjson", "msgspec" or "json").
+
+All backends produce compact JSON, and decoding errors are always raised as
+json.JSONDecodeError so callers don't need to know which backend is active.
+"""
+
+import os
+import json
+from typing import Any, Callable, Dict, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(
+        obj, separators=(",", ":"), ensure_ascii=False, default=str
+    ).encode("utf-8")
+
+
+def _json_loads(data: Union[str, bytes]) -> Any:
+    return json.loads(data)
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    try:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # e.g. integers wider than 64 bits
+        return _json_dumps(obj)
+
+
+def _orjson_loads(data: Union[str, bytes]) -> Any:
+    return orjson.loads(data)
+
+
+def _msgspec_dumps(obj: Any) -> bytes:
+    try:
+        return _msgspec_encoder.encode(obj)
+    except (TypeError, msgspec.EncodeError):
+        return _json_dumps(obj)
+
+
+def _msgspec_loads(data: Union[str, bytes]) -> Any:
+    try:
+        return _msgspec_decoder.decode(data)
+    except msgspec.DecodeError as e:
+        text = data.decode("utf-8", "replace") if isinstance(data, bytes) else data
+        raise json.JSONDecodeError(str(e), text, 0) from e
+
+
+BACKENDS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[Any], Any]]] = {
+    "json": (_json_dumps, _json_loads)
+}
+if orjson is not None:
+    BACKENDS["orjson"] = (_orjson_dumps, _orjson_loads)
+if msgspec is not None:
+    _msgspec_encoder = msgspec.json.Encoder(enc_hook=str)
+    _msgspec_decoder = msgspec.json.Decoder()
+    BACKENDS["msgspec"] = (_msgspec_dumps, _msgspec_loads)
+
+
+def _select_backend() -> str:
+    requested = os.getenv("MCP_JSON_CODEC", "auto").lower()
+    if requested in BACKENDS:
+        return requested
+    for name in ("orjson", "msgspec"):
+        if name in BACKENDS:
+            return name
+    return "json"
+
+
+# Name of the active backend
+BACKEND = _select_backend()
+
+# dumps_bytes(obj) -> bytes serializes to compact UTF-8 JSON;
+# loads(str | bytes) parses JSON, raising json.JSONDecodeError on bad input
+dumps_bytes, loads = BACKENDS[BACKEND]
+
+
+def dumps(obj: Any) -> str:
+    """
+    Serialize an object to a compact JSON string.
+
+    Args:
+        obj: The object to serialize; unknown types are converted with str()
+
+    Returns:
+        The JSON text
+    """
+    return dumps_bytes(obj).decode("utf-8")
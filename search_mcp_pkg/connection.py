@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Socket addresses and client connections for a shared Search MCP server.
+
+`run_server.py --listen ADDRESS` serves the line protocol on a Unix domain
+socket or a TCP port, and any number of clients can connect to it instead of
+each starting its own server process. Addresses are written as:
+
+- unix:/path/to/socket
+- tcp:HOST:PORT (or just HOST:PORT)
+"""
+
+import os
+import socket
+from typing import Optional, Tuple, Union
+
+# Address of a running shared server; clients start their own server when empty
+SERVER_ADDRESS = os.getenv("MCP_SERVER_ADDRESS", "")
+
+
+def parse_address(address: str) -> Tuple[str, Union[str, Tuple[str, int]]]:
+    """
+    Parse a server address.
+
+    Args:
+        address: "unix:/path", "tcp:host:port" or "host:port"
+
+    Returns:
+        ("unix", path) or ("tcp", (host, port))
+
+    Raises:
+        ValueError: If the address is malformed
+    """
+    if address.startswith("unix:"):
+        path = address[len("unix:") :]
+        if not path:
+            raise ValueError(f"Missing socket path in address: {address}")
+        return "unix", path
+
+    if address.startswith("tcp:"):
+        address = address[len("tcp:") :]
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid server address: {address}")
+    return "tcp", (host.strip("[]") or "127.0.0.1", int(port))
+
+
+class ServerConnection:
+    """
+    A connection to a shared server, usable in place of a server process.
+
+    Like a `subprocess.Popen` started with pipes, it exposes `stdin` and
+    `stdout` streams (text by default, or binary), so code written against a
+    server process can talk to a shared server unchanged. `terminate()` only closes this
+    connection; the server keeps running for its other clients.
+    """
+
+    stderr = None
+
+    def __init__(
+        self, address: str, timeout: Optional[float] = 10.0, binary: bool = False
+    ):
+        """
+        Connect to a server.
+
+        Args:
+            address: The server address (see parse_address)
+            timeout: Seconds to wait for the connection to be established
+            binary: Expose binary streams instead of text streams
+        """
+        family, target = parse_address(address)
+        if family == "unix":
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(target)
+        else:
+            self.socket = socket.create_connection(target, timeout=timeout)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.settimeout(None)
+
+        self.address = address
+        if binary:
+            self.stdin = self.socket.makefile("wb")
+            self.stdout = self.socket.makefile("rb")
+        else:
+            self.stdin = self.socket.makefile("w", encoding="utf-8", newline="\n")
+            self.stdout = self.socket.makefile("r", encoding="utf-8", newline="\n")
+        self.returncode: Optional[int] = None
+
+    def poll(self) -> Optional[int]:
+        """Get the exit status: None while the connection is open."""
+        return self.returncode
+
+    def terminate(self) -> None:
+        """Close the connection."""
+        if self.returncode is not None:
+            return
+        self.returncode = 0
+        for stream in (self.stdin, self.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
+    kill = terminate
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        """Close the connection (if still open) and get the exit status."""
+        self.terminate()
+        return self.returncode
@@ -6,36 +6,552 @@ with Elasticsearch and LLM query planning.
 
 import os
 import json
-from typing import Dict, List, Any, Optional
+import time
+import logging
+import hashlib
+import threading
+from typing import Callable, Collection, Dict, FrozenSet, List, Any, Optional, Tuple
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch
-from openai import OpenAI
-from mcp.server.fastmcp import FastMCP
+from . import codec, metrics
+from .cancellation import check_cancelled, current_token
+from .formatting import (
+    check_output_format,
+    check_plan_detail,
+    default_fields,
+    format_results,
+)
+from .framing import response_limit
+from .mappings import (
+    CATCH_ALL_FIELD,
+    CONTENT_HASH_FIELD,
+    FACET_FIELDS,
+    ECOMMERCE_PROFILE_VERSION,
+    ecommerce_index_body,
+    profile_version,
+)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize FastMCP server
-mcp = FastMCP("search")
-
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Diagnostics go to the logging system; stdout may carry the protocol
+logger = logging.getLogger(__name__)
 
-# Initialize Elasticsearch client
+# Elasticsearch connection settings
 es_host = os.getenv("ELASTICSEARCH_HOST", "http://localhost:9200")
 es_user = os.getenv("ELASTICSEARCH_USER", "")
 es_pass = os.getenv("ELASTICSEARCH_PASSWORD", "")
 
-es = Elasticsearch(
-    es_host,
-    basic_auth=(es_user, es_pass) if es_user and es_pass else None,
-    verify_certs=False,
-)
+# The FastMCP server and the OpenAI and Elasticsearch clients are created on
+# first use (see get_mcp, get_openai_client and get_es) so that importing this
+# module stays cheap. `mcp`, `client` and `es` remain available as module
+# attributes for existing callers.
+_mcp = None
+_openai_client = None
+_es = None
+_mcp_lock = threading.Lock()
+_openai_lock = threading.Lock()
+_es_lock = threading.Lock()
+
+# Functions registered as MCP tools, added to the FastMCP server when it is created
+TOOLS: List[Callable[..., Any]] = []
+
+
+def tool(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Register a function as an MCP tool.
+
+    Args:
+        fn: The tool function; its name, docstring and signature describe the tool
+
+    Returns:
+        The function, unchanged
+    """
+    TOOLS.append(fn)
+    return fn
+
+
+def get_mcp():
+    """Get the FastMCP server, creating it and registering the tools on first use."""
+    global _mcp
+
+    if _mcp is None:
+        with _mcp_lock:
+            if _mcp is None:
+                from mcp.server.fastmcp import FastMCP
+
+                server = FastMCP("search")
+                for fn in TOOLS:
+                    server.add_tool(fn)
+                _mcp = server
+    return _mcp
+
+
+def get_openai_client():
+    """Get the OpenAI client, creating it on first use."""
+    global _openai_client
+
+    if _openai_client is None:
+        with _openai_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+
+                _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _openai_client
+
+
+def get_es():
+    """Get the Elasticsearch client, creating it on first use."""
+    global _es
+
+    if _es is None:
+        with _es_lock:
+            if _es is None:
+                from elasticsearch import Elasticsearch
+
+                _es = Elasticsearch(
+                    es_host,
+                    basic_auth=(es_user, es_pass) if es_user and es_pass else None,
+                    verify_certs=False,
+                )
+    return _es
+
+
+def warm_up() -> None:
+    """Create the clients ahead of the first request (e.g. right after startup)."""
+    get_es()
+    get_openai_client()
+
+
+def search_es():
+    """
+    Get the Elasticsearch client for a search made on behalf of a request.
+
+    Searches are tagged with the request's opaque ID so that they can be
+    cancelled along with the request (see cancel_search_tasks).
+    """
+    token = current_token()
+    if token is None:
+        return get_es()
+    return get_es().options(opaque_id=token.opaque_id)
+
+
+def cancel_search_tasks(opaque_ids: Collection[str]) -> int:
+    """
+    Cancel the running searches made on behalf of cancelled requests.
+
+    Args:
+        opaque_ids: The opaque IDs of the requests' cancel tokens
+
+    Returns:
+        The number of search tasks cancelled
+    """
+    opaque_ids = set(opaque_ids)
+    es = get_es()
+    tasks = es.tasks.list(actions="*search*", detailed=True, group_by="none")
+    cancelled = 0
+    for task in tasks.get("tasks", []):
+        if task.get("headers", {}).get("X-Opaque-Id") in opaque_ids:
+            es.tasks.cancel(task_id=f"{task['node']}:{task['id']}")
+            cancelled += 1
+    return cancelled
+
+
+def __getattr__(name: str) -> Any:
+    # Lazy module attributes for the server and clients
+    if name == "mcp":
+        return get_mcp()
+    if name == "client":
+        return get_openai_client()
+    if name == "es":
+        return get_es()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Default index name
 DEFAULT_INDEX = os.getenv("ELASTICSEARCH_INDEX", "ecommerce")
 
+# Fields that identify a product when it carries no SKU
+PRODUCT_IDENTITY_FIELDS = ("brand", "product_name", "description")
+
+# Number of document IDs looked up per mget request during a sync
+SYNC_LOOKUP_CHUNK_SIZE = 1000
+
+# Physical indexes behind an alias are named "<alias>__v<generation>", with
+# the generation zero-padded so names also sort in build order
+GENERATION_SEPARATOR = "__v"
+GENERATION_DIGITS = 16
+
+# Number of previous index generations kept after an alias swap, for rollback
+KEEP_GENERATIONS = int(os.getenv("ELASTICSEARCH_KEEP_GENERATIONS", "1"))
+
+# Seconds an alias -> physical index resolution is reused
+ALIAS_CACHE_TTL = float(os.getenv("ALIAS_CACHE_TTL", "5"))
+
+# Seconds the planner's view of an index (schema and available values) is reused
+PLANNER_CACHE_TTL = float(os.getenv("PLANNER_CACHE_TTL", "60"))
+
+# File the planner cache is saved to at shutdown and restored from at startup,
+# so a restarted server doesn't start cold (disabled when empty)
+PLANNER_CACHE_SNAPSHOT = os.getenv("PLANNER_CACHE_SNAPSHOT", "")
+
+# Collapse per-field match clauses into a single clause where possible
+COLLAPSE_SEARCH_FIELDS = os.getenv("SEARCH_COLLAPSE_FIELDS", "true").lower() == "true"
+
+# Fields searched when the plan doesn't name any (or couldn't be parsed)
+DEFAULT_SEARCH_FIELDS = ["product_name", "description", "brand", "category"]
+
+# Caches are keyed by physical index, so they follow alias swaps automatically
+_alias_cache: Dict[str, Tuple[float, str]] = {}
+_planner_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_cache_lock = threading.Lock()
+
+
+def product_id(product: Dict[str, Any]) -> str:
+    """
+    Get the deterministic document ID for a product.
+
+    The SKU is used when present; otherwise the ID is a hash of the
+    identifying fields, so re-indexing the same product always targets
+    the same document.
+
+    Args:
+        product: The product document
+
+    Returns:
+        The document ID for the product
+    """
+    sku = product.get("sku")
+    if sku:
+        return str(sku)
+
+    identity = "\x1f".join(
+        str(product.get(field, "")).strip().lower() for field in PRODUCT_IDENTITY_FIELDS
+    )
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+def content_hash(product: Dict[str, Any]) -> str:
+    """
+    Compute a stable hash of a product's content.
+
+    Args:
+        product: The product document (any existing content hash is ignored)
+
+    Returns:
+        A hex digest that changes whenever any indexed field changes
+    """
+    content = {k: v for k, v in product.items() if k != CONTENT_HASH_FIELD}
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def upsert_products(index: str, products: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Idempotently write products to an index.
+
+    Each product gets a deterministic ID and a content hash. Products whose
+    hash matches the stored document are skipped; new and changed products
+    are indexed in full, so fields removed from a product don't linger in
+    the stored document behind an up-to-date hash.
+
+    Args:
+        index: The Elasticsearch index to write to
+        products: The product documents to write
+
+    Returns:
+        A dictionary with the created, updated and unchanged counts and the
+        ID of every product, in input order
+    """
+    prepared: Dict[str, Dict[str, Any]] = {}
+    ids = []
+    for product in products:
+        doc_id = product_id(product)
+        prepared[doc_id] = {**product, CONTENT_HASH_FIELD: content_hash(product)}
+        ids.append(doc_id)
+
+    # Look up what is already stored for these IDs
+    existing: Dict[str, Dict[str, Any]] = {}
+    if prepared and get_es().indices.exists(index=index):
+        lookup_ids = list(prepared)
+        for start in range(0, len(lookup_ids), SYNC_LOOKUP_CHUNK_SIZE):
+            chunk = lookup_ids[start : start + SYNC_LOOKUP_CHUNK_SIZE]
+            response = get_es().mget(index=index, ids=chunk)
+            for doc in response["docs"]:
+                if doc.get("found"):
+                    existing[doc["_id"]] = doc["_source"]
+
+    actions = []
+    stats = {"created": 0, "updated": 0, "unchanged": 0}
+    for doc_id, document in prepared.items():
+        current = existing.get(doc_id)
+        if current is not None and (
+            current.get(CONTENT_HASH_FIELD) == document[CONTENT_HASH_FIELD]
+        ):
+            stats["unchanged"] += 1
+            continue
+        actions.append(
+            {"_op_type": "index", "_index": index, "_id": doc_id, "_source": document}
+        )
+        stats["created" if current is None else "updated"] += 1
+
+    if actions:
+        from elasticsearch import helpers
+
+        helpers.bulk(get_es(), actions)
+
+    return {**stats, "ids": ids}
+
+
+def resolve_index(index: str) -> str:
+    """
+    Resolve an alias to the physical index it currently points to.
+
+    Args:
+        index: An alias or a concrete index name
+
+    Returns:
+        The physical index name, or the given name if it is not an alias
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _alias_cache.get(index)
+    if cached and cached[0] > now:
+        metrics.inc("cache_hits_total", cache="alias")
+        return cached[1]
+    metrics.inc("cache_misses_total", cache="alias")
+
+    physical = index
+    try:
+        if get_es().indices.exists_alias(name=index):
+            physical = max(get_es().indices.get_alias(name=index), key=_generation)
+    except Exception as e:
+        logger.error("Error resolving alias '%s': %s", index, e)
+
+    with _cache_lock:
+        _alias_cache[index] = (now + ALIAS_CACHE_TTL, physical)
+    return physical
+
+
+def _generation(name: str) -> int:
+    """Get the generation number of a physical index (-1 if it has none)."""
+    suffix = name.rsplit(GENERATION_SEPARATOR, 1)[-1]
+    return int(suffix) if GENERATION_SEPARATOR in name and suffix.isdigit() else -1
+
+
+def _generations(alias: str) -> List[str]:
+    """List the physical indexes built for an alias, oldest first."""
+    pattern = f"{alias}{GENERATION_SEPARATOR}*"
+    names = [
+        name
+        for name in get_es().indices.get(index=pattern, expand_wildcards="open,closed")
+        if _generation(name) >= 0
+    ]
+    return sorted(names, key=_generation)
+
+
+def _create_generation(alias: str, body: Dict[str, Any]) -> str:
+    """
+    Create the next physical index of an alias.
+
+    Generations are millisecond timestamps, raised past the newest existing
+    generation when needed, so they always increase. A name that is
+    already taken (another build in the same millisecond) is skipped.
+
+    Returns:
+        The name of the new index
+    """
+    existing = [_generation(name) for name in _generations(alias)]
+    generation = max([time.time_ns() // 1_000_000] + [n + 1 for n in existing])
+    while True:
+        name = f"{alias}{GENERATION_SEPARATOR}{generation:0{GENERATION_DIGITS}d}"
+        if not get_es().indices.exists(index=name):
+            try:
+                get_es().indices.create(index=name, body=body)
+                return name
+            except Exception:
+                # Lost a race with another build for the same name
+                if not get_es().indices.exists(index=name):
+                    raise
+        generation += 1
+
+
+def _forget_index(name: str) -> None:
+    """Drop cached state for an alias or physical index."""
+    with _cache_lock:
+        _alias_cache.pop(name, None)
+        _planner_cache.pop(name, None)
+
+
+def save_planner_cache(path: str = PLANNER_CACHE_SNAPSHOT) -> int:
+    """
+    Save the unexpired planner cache entries to a file.
+
+    Args:
+        path: The snapshot file, replaced atomically
+
+    Returns:
+        The number of entries saved
+    """
+    now = time.monotonic()
+    wall_now = time.time()
+    with _cache_lock:
+        entries = {
+            physical: {"expires_at": wall_now + expiry - now, "context": context}
+            for physical, (expiry, context) in _planner_cache.items()
+            if expiry > now
+        }
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(codec.dumps_bytes(entries))
+    os.replace(temporary, path)
+    return len(entries)
+
+
+def load_planner_cache(path: str = PLANNER_CACHE_SNAPSHOT) -> int:
+    """
+    Restore the planner cache from a snapshot saved by save_planner_cache.
+
+    Entries keep the expiry they had when they were saved, so a snapshot
+    never serves data older than PLANNER_CACHE_TTL.
+
+    Args:
+        path: The snapshot file
+
+    Returns:
+        The number of entries restored
+    """
+    with open(path, "rb") as f:
+        entries = codec.loads(f.read())
+    now = time.monotonic()
+    wall_now = time.time()
+    restored = 0
+    with _cache_lock:
+        for physical, entry in entries.items():
+            remaining = entry["expires_at"] - wall_now
+            if remaining > 0 and physical not in _planner_cache:
+                _planner_cache[physical] = (now + remaining, entry["context"])
+                restored += 1
+    return restored
+
+
+def swap_alias(alias: str, new_index: str) -> None:
+    """
+    Atomically point an alias at a new physical index.
+
+    A concrete (pre-alias) index that has the alias's name is removed in the
+    same atomic request, so it can be migrated without a gap.
+
+    Args:
+        alias: The alias that searches use
+        new_index: The physical index to point it at
+    """
+    actions = []
+    if get_es().indices.exists_alias(name=alias):
+        for old_index in get_es().indices.get_alias(name=alias):
+            actions.append({"remove": {"index": old_index, "alias": alias}})
+    elif get_es().indices.exists(index=alias):
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": new_index, "alias": alias}})
+
+    get_es().indices.update_aliases(actions=actions)
+    _forget_index(alias)
+
+
+def gc_generations(alias: str, keep: int = KEEP_GENERATIONS) -> List[str]:
+    """
+    Delete old physical indexes of an alias, keeping the live one and the
+    most recent `keep` previous generations.
+
+    Args:
+        alias: The alias whose generations to collect
+        keep: Number of previous generations to keep
+
+    Returns:
+        The names of the deleted indexes
+    """
+    live = (
+        set(get_es().indices.get_alias(name=alias))
+        if get_es().indices.exists_alias(name=alias)
+        else set()
+    )
+    previous = [name for name in _generations(alias) if name not in live]
+    stale = previous[: max(len(previous) - keep, 0)]
+    for name in stale:
+        get_es().indices.delete(index=name, ignore_unavailable=True)
+        _forget_index(name)
+    return stale
+
+
+def build_index_generation(
+    alias: str, body: Dict[str, Any], populate: Callable[[str], Any]
+) -> str:
+    """
+    Build a new generation of an index and swap the alias to it.
+
+    The new physical index is created and filled while the alias keeps
+    serving the previous generation. Only when the build is complete is the
+    alias swapped, after which old generations are garbage-collected. A
+    failed build is deleted and the live index is left untouched.
+
+    Args:
+        alias: The alias that searches use
+        body: Settings and mappings for the new index
+        populate: Called with the new index name to fill it with documents
+
+    Returns:
+        The name of the new physical index
+    """
+    new_index = _create_generation(alias, body)
+    try:
+        populate(new_index)
+        get_es().indices.refresh(index=new_index)
+    except Exception:
+        get_es().indices.delete(index=new_index, ignore_unavailable=True)
+        raise
+
+    swap_alias(alias, new_index)
+    gc_generations(alias)
+    return new_index
+
 
+def ensure_index(alias: str, body: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Make sure an alias (or legacy concrete index) exists, creating an empty
+    first generation behind the alias if it does not.
+
+    Args:
+        alias: The alias that searches and writes use
+        body: Optional settings and mappings for a newly created index
+    """
+    if not get_es().indices.exists(index=alias):
+        build_index_generation(alias, body or {}, lambda _: None)
+
+
+def delete_index(alias: str) -> bool:
+    """
+    Delete an alias together with every physical generation behind it, or
+    a plain concrete index.
+
+    Args:
+        alias: The alias or concrete index to delete
+
+    Returns:
+        True if anything was deleted
+    """
+    deleted = False
+    if get_es().indices.exists_alias(name=alias):
+        for name in _generations(alias) + list(get_es().indices.get_alias(name=alias)):
+            get_es().indices.delete(index=name, ignore_unavailable=True)
+            _forget_index(name)
+        deleted = True
+    elif get_es().indices.exists(index=alias):
+        get_es().indices.delete(index=alias)
+        deleted = True
+    _forget_index(alias)
+    return deleted
+
+
+@metrics.timed("stage_latency", stage="schema_fetch")
 def get_index_schema(index: str) -> Dict[str, Any]:
     """
     Get the schema (mappings) for the specified Elasticsearch index.
@@ -47,10 +563,14 @@ def get_index_schema(index: str) -> Dict[str, Any]:
         A dictionary containing the index schema/mappings or an empty dict if not found
     """
     try:
-        if es.indices.exists(index=index):
-            index_info = es.indices.get(index=index)
-            if index in index_info and "mappings" in index_info[index]:
-                return index_info[index]["mappings"]
+        if get_es().indices.exists(index=index):
+            # The response is keyed by the physical index an alias points to;
+            # take that name from the response, which a swap can't make stale
+            index_info = get_es().indices.get(index=index)
+            if index_info:
+                physical = max(index_info, key=_generation)
+                if "mappings" in index_info[physical]:
+                    return index_info[physical]["mappings"]
 
         # If we can't get the schema, return a default schema based on the ecommerce index
         return {
@@ -66,76 +586,97 @@ def get_index_schema(index: str) -> Dict[str, Any]:
             }
         }
     except Exception as e:
-        print(f"Error getting index schema: {e}")
+        metrics.inc("errors_total", kind="schema_fetch")
+        logger.error("Error getting index schema: %s", e)
         return {}
 
 
-def generate_query_plan(query: str, index: str = DEFAULT_INDEX) -> Dict[str, Any]:
+@metrics.timed("stage_latency", stage="vocabulary_aggregations")
+def get_available_values(index: str) -> Dict[str, List[str]]:
     """
-    Use LLM to generate a query plan for the given search query.
+    Get the distinct categories, brands and common tags of an index.
 
     Args:
-        query: The user's search query
-        index: The Elasticsearch index to search
+        index: The name of the index
 
     Returns:
-        A dictionary containing the query plan
+        A dictionary of value lists, empty if the index doesn't exist
     """
-    # Get the index schema
-    schema = get_index_schema(index)
-
-    # Format the schema information for the prompt
-    schema_info = json.dumps(schema, indent=2)
-
-    # Get available categories and brands if the index exists
-    available_categories = []
-    available_brands = []
-    common_tags = []
+    available_values = {"categories": [], "brands": [], "common_tags": []}
 
     try:
-        if es.indices.exists(index=index):
-            # Get distinct categories
-            category_query = {
+        if get_es().indices.exists(index=index):
+            # Fetch all facets in one request; the fields load global ordinals
+            # eagerly (see mappings.py), so this stays cheap after refreshes
+            facets_query = {
                 "size": 0,
-                "aggs": {"categories": {"terms": {"field": "category", "size": 50}}},
+                "aggs": {
+                    field: {"terms": {"field": field, "size": 50}}
+                    for field in FACET_FIELDS
+                },
             }
-            category_response = es.search(index=index, body=category_query)
-            available_categories = [
-                bucket["key"]
-                for bucket in category_response["aggregations"]["categories"]["buckets"]
-            ]
-
-            # Get distinct brands
-            brand_query = {
-                "size": 0,
-                "aggs": {"brands": {"terms": {"field": "brand", "size": 50}}},
-            }
-            brand_response = es.search(index=index, body=brand_query)
-            available_brands = [
-                bucket["key"]
-                for bucket in brand_response["aggregations"]["brands"]["buckets"]
-            ]
-
-            # Get common tags
-            tags_query = {
-                "size": 0,
-                "aggs": {"tags": {"terms": {"field": "tags", "size": 50}}},
+            response = search_es().search(index=index, body=facets_query)
+            aggregations = response["aggregations"]
+            available_values = {
+                "categories": [b["key"] for b in aggregations["category"]["buckets"]],
+                "brands": [b["key"] for b in aggregations["brand"]["buckets"]],
+                "common_tags": [b["key"] for b in aggregations["tags"]["buckets"]],
             }
-            tags_response = es.search(index=index, body=tags_query)
-            common_tags = [
-                bucket["key"]
-                for bucket in tags_response["aggregations"]["tags"]["buckets"]
-            ]
     except Exception as e:
-        print(f"Error getting available values: {e}")
+        metrics.inc("errors_total", kind="vocabulary_aggregations")
+        logger.error("Error getting available values: %s", e)
+
+    return available_values
+
+
+def get_planner_context(index: str) -> Dict[str, Any]:
+    """
+    Get the schema and available values the query planner needs.
+
+    The result is cached per physical index for PLANNER_CACHE_TTL seconds.
+    Because the cache key is the index an alias resolves to, swapping the
+    alias to a new generation makes the next query see the new data.
+
+    Args:
+        index: An alias or concrete index name
 
-    # Add information about available values to the prompt
-    available_values = {
-        "categories": available_categories,
-        "brands": available_brands,
-        "common_tags": common_tags,
+    Returns:
+        A dictionary with "schema" and "available_values"
+    """
+    physical = resolve_index(index)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _planner_cache.get(physical)
+    if cached and cached[0] > now:
+        metrics.inc("cache_hits_total", cache="planner")
+        return cached[1]
+    metrics.inc("cache_misses_total", cache="planner")
+
+    context = {
+        "schema": get_index_schema(index),
+        "available_values": get_available_values(index),
     }
-    available_values_info = json.dumps(available_values, indent=2)
+    with _cache_lock:
+        _planner_cache[physical] = (now + PLANNER_CACHE_TTL, context)
+    return context
+
+
+def generate_query_plan(query: str, index: str = DEFAULT_INDEX) -> Dict[str, Any]:
+    """
+    Use LLM to generate a query plan for the given search query.
+
+    Args:
+        query: The user's search query
+        index: The Elasticsearch index to search
+
+    Returns:
+        A dictionary containing the query plan
+    """
+    context = get_planner_context(index)
+
+    # Format the schema and available values for the prompt
+    schema_info = json.dumps(context["schema"], indent=2)
+    available_values_info = json.dumps(context["available_values"], indent=2)
 
     prompt = f"""
 You are a search query planner for an e-commerce platform. Given a user's search query, determine the best search strategy.
@@ -174,13 +715,24 @@ User query: {query}
 Respond with a valid JSON object only.
 """
 
-    response = client.chat.completions.create(
-        model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.1,
-    )
+    # Stream the plan so that generation stops as soon as the request is
+    # cancelled; closing the stream closes the connection to the API
+    check_cancelled()
+    with metrics.timer("stage_latency", stage="llm_planning"):
+        stream = get_openai_client().chat.completions.create(
+            model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.1,
+            stream=True,
+        )
+        parts = []
+        with stream:
+            for chunk in stream:
+                check_cancelled()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
 
-    plan_text = response.choices[0].message.content.strip()
+    plan_text = "".join(parts).strip()
 
     # Extract JSON from the response
     try:
@@ -200,12 +752,7 @@ Respond with a valid JSON object only.
                     "expanded_query": query,
                     "ranking_algorithm": "bm25",
                     "filters": {},
-                    "search_fields": [
-                        "product_name",
-                        "description",
-                        "brand",
-                        "category",
-                    ],
+                    "search_fields": list(DEFAULT_SEARCH_FIELDS),
                     "sort_by": "relevance",
                     "explanation": "Failed to parse LLM response, using default settings.",
                 }
@@ -215,7 +762,7 @@ Respond with a valid JSON object only.
                 "expanded_query": query,
                 "ranking_algorithm": "bm25",
                 "filters": {},
-                "search_fields": ["product_name", "description", "brand", "category"],
+                "search_fields": list(DEFAULT_SEARCH_FIELDS),
                 "sort_by": "relevance",
                 "explanation": "Failed to parse LLM response, using default settings.",
             }
@@ -223,6 +770,71 @@ Respond with a valid JSON object only.
     return plan
 
 
+def catch_all_sources(index: str) -> FrozenSet[str]:
+    """
+    Get the fields that are copied into the index's catch-all field.
+
+    Args:
+        index: An alias or concrete index name
+
+    Returns:
+        The source fields of the catch-all field, empty if the index has none
+    """
+    properties = get_planner_context(index)["schema"].get("properties", {})
+    if CATCH_ALL_FIELD not in properties:
+        return frozenset()
+
+    sources = set()
+    for field, mapping in properties.items():
+        copy_to = mapping.get("copy_to", [])
+        if CATCH_ALL_FIELD in ([copy_to] if isinstance(copy_to, str) else copy_to):
+            sources.add(field)
+    return frozenset(sources)
+
+
+def build_text_clauses(
+    search_query: str,
+    search_fields: List[str],
+    catch_all_fields: FrozenSet[str] = frozenset(),
+) -> List[Dict[str, Any]]:
+    """
+    Build the full-text should clauses for a query.
+
+    When every field the plan searches is copied into the catch-all field
+    (or is the catch-all field itself) and no field carries a boost (e.g.
+    "product_name^3"), the per-field match clauses are collapsed into a
+    single match on the catch-all field, so each term is looked up and
+    scored once instead of once per field. For a subset of the copied
+    fields, such as DEFAULT_SEARCH_FIELDS, this also matches the other
+    copied fields (e.g. tags). Otherwise the fields are combined into one
+    multi_match, which scores like the original per-field clauses.
+
+    Args:
+        search_query: The text to search for
+        search_fields: The fields the plan wants to search
+        catch_all_fields: The fields copied into the catch-all field
+
+    Returns:
+        A list of should clauses
+    """
+    if not COLLAPSE_SEARCH_FIELDS or not search_fields:
+        return [{"match": {field: search_query}} for field in search_fields]
+
+    boosted = any("^" in field for field in search_fields)
+    if not boosted and set(search_fields) <= catch_all_fields | {CATCH_ALL_FIELD}:
+        return [{"match": {CATCH_ALL_FIELD: search_query}}]
+
+    return [
+        {
+            "multi_match": {
+                "query": search_query,
+                "fields": list(search_fields),
+                "type": "most_fields",
+            }
+        }
+    ]
+
+
 def execute_search(
     query: str, index: str, plan: Dict[str, Any]
 ) -> List[Dict[str, Any]]:
@@ -238,18 +850,16 @@ def execute_search(
         A list of search results
     """
     search_query = plan["expanded_query"] if plan["should_expand"] else query
-    search_fields = plan.get(
-        "search_fields", ["product_name", "description", "brand", "category"]
-    )
+    search_fields = plan.get("search_fields", DEFAULT_SEARCH_FIELDS)
 
     # Build the Elasticsearch query
     if plan["ranking_algorithm"] == "bm25":
         es_query = {
             "query": {
                 "bool": {
-                    "should": [
-                        {"match": {field: search_query}} for field in search_fields
-                    ]
+                    "should": build_text_clauses(
+                        search_query, search_fields, catch_all_sources(index)
+                    )
                 }
             }
         }
@@ -276,9 +886,9 @@ def execute_search(
         es_query = {
             "query": {
                 "bool": {
-                    "should": [
-                        {"match": {field: search_query}} for field in search_fields
-                    ]
+                    "should": build_text_clauses(
+                        search_query, search_fields, catch_all_sources(index)
+                    )
                 }
             }
         }
@@ -356,18 +966,22 @@ def execute_search(
 
     # Execute the search
     try:
-        response = es.search(index=index, body=es_query, size=10)
+        with metrics.timer("stage_latency", stage="es_execution"):
+            response = search_es().search(index=index, body=es_query, size=10)
         results = [
             {**hit["_source"], "score": hit["_score"]}
             for hit in response["hits"]["hits"]
         ]
         return results
     except Exception as e:
-        print(f"Search error: {e}")
+        # Searches of a cancelled request fail; report the cancellation instead
+        check_cancelled()
+        metrics.inc("errors_total", kind="es_execution")
+        logger.error("Search error: %s", e)
         return []
 
 
-@mcp.tool()
+@tool
 def index_product(
     product_name: str,
     description: str,
@@ -410,34 +1024,90 @@ def index_product(
         **metadata,
     }
 
-    # Create the index if it doesn't exist
-    if not es.indices.exists(index=index):
-        es.indices.create(index=index)
+    # Create the index (behind an alias) if it doesn't exist
+    ensure_index(index)
 
     try:
-        response = es.index(index=index, document=document)
-        return f"Product indexed successfully with ID: {response['_id']}"
+        stats = upsert_products(index, [document])
+        doc_id = stats["ids"][0]
+        if stats["unchanged"]:
+            return f"Product unchanged, skipped re-indexing (ID: {doc_id})"
+        if stats["updated"]:
+            return f"Product updated successfully with ID: {doc_id}"
+        return f"Product indexed successfully with ID: {doc_id}"
     except Exception as e:
         return f"Failed to index product: {str(e)}"
 
 
-@mcp.tool()
-def search(query: str, index: str = DEFAULT_INDEX) -> str:
+@tool
+def sync_products(products: List[Dict[str, Any]], index: str = DEFAULT_INDEX) -> str:
+    """
+    Sync a batch of products into Elasticsearch, touching only what changed.
+
+    Products are identified by their "sku" field, or by a hash of brand,
+    name and description when there is no SKU. Unchanged products are
+    skipped and new or changed products are indexed whole, replacing the
+    stored document, so re-running a catalog sync never creates duplicates.
+
+    Args:
+        products: The product documents to sync
+        index: The Elasticsearch index to use (defaults to environment variable)
+
+    Returns:
+        A summary of how many products were created, updated and unchanged
+    """
+    # Create the index (behind an alias) if it doesn't exist
+    ensure_index(index)
+
+    try:
+        stats = upsert_products(index, products)
+        get_es().indices.refresh(index=index)
+    except Exception as e:
+        return f"Failed to sync products: {str(e)}"
+
+    return (
+        f"Synced {len(products)} products into '{index}': "
+        f"{stats['created']} created, {stats['updated']} updated, "
+        f"{stats['unchanged']} unchanged"
+    )
+
+
+@tool
+def search(
+    query: str,
+    index: str = DEFAULT_INDEX,
+    output_format: str = "text",
+    fields: Optional[List[str]] = None,
+    plan_detail: str = "full",
+    max_tokens: Optional[int] = None,
+) -> str:
     """
     Search for products matching a query with LLM-powered query planning.
 
     Args:
         query: The search query (supports natural language queries like "red shoes under $50")
         index: The Elasticsearch index to search (defaults to environment variable)
+        output_format: "text" for readable results, "compact" for a line per
+            product, "markdown" for a table, or "json" for compact JSON with
+            the query plan, the hits and stage timings
+        fields: Product fields to include for each hit (defaults to name,
+            brand, price, rating, stock and category, plus the description
+            in text results)
+        plan_detail: Include the "full" query plan, only its "explanation",
+            or "none"
+        max_tokens: Estimated tokens to truncate the results to (defaults to
+            MCP_RESULT_TOKEN_BUDGET)
 
     Returns:
-        Formatted search results with query plan explanation
+        Formatted search results with query plan explanation, or JSON
     """
+    check_output_format(output_format)
+    check_plan_detail(plan_detail)
+
     # Special command to delete the index (used by demo scripts)
     if query == "DELETE_INDEX":
         try:
-            if es.indices.exists(index=index):
-                es.indices.delete(index=index)
+            if delete_index(index):
                 return f"Successfully deleted index '{index}'."
             else:
                 return f"Index '{index}' does not exist."
@@ -445,40 +1115,73 @@ def search(query: str, index: str = DEFAULT_INDEX) -> str:
             return f"Error deleting index '{index}': {str(e)}"
 
     # Generate query plan using LLM
+    started = time.perf_counter()
     plan = generate_query_plan(query, index)
+    planned = time.perf_counter()
+    check_cancelled()
 
     # Execute the search based on the plan
     results = execute_search(query, index, plan)
 
     # Format the results
-    if not results:
-        return f"No products found for query: {query}\n\nQuery plan: {json.dumps(plan, indent=2)}"
-
-    formatted_results = "\n\n".join(
-        [
-            f"Product {i+1}:\n"
-            f"Name: {result.get('product_name', 'Unnamed product')}\n"
-            f"Brand: {result.get('brand', 'N/A')}\n"
-            f"Price: ${result.get('price', 'N/A')}\n"
-            f"Rating: {result.get('rating', 'N/A')}/5\n"
-            f"In Stock: {'Yes' if result.get('in_stock', False) else 'No'}\n"
-            f"Category: {result.get('category', 'N/A')}\n"
-            f"Description: {result.get('description', 'No description')[:150]}..."
-            for i, result in enumerate(results)
-        ]
+    return render_results(
+        results,
+        output_format,
+        fields,
+        max_tokens,
+        title=f"Search results for: {query}",
+        context={
+            "query": query,
+            "timings_ms": {
+                "planning": elapsed_ms(started, planned),
+                "search": elapsed_ms(planned),
+            },
+        },
+        plan=plan,
+        plan_detail=plan_detail,
+        empty=f"No products found for query: {query}",
     )
 
-    return f"""Search results for: {query}
 
-Query plan:
-{json.dumps(plan, indent=2)}
+def elapsed_ms(start: float, end: Optional[float] = None) -> float:
+    """Milliseconds between two perf_counter readings (the second defaults to now)."""
+    return round(((end or time.perf_counter()) - start) * 1000, 1)
 
-Results:
-{formatted_results}
-"""
+
+@metrics.timed("stage_latency", stage="formatting")
+def render_results(
+    results: List[Dict[str, Any]],
+    output_format: str,
+    fields: Optional[List[str]],
+    max_tokens: Optional[int],
+    exclude: Tuple[str, ...] = (),
+    **options: Any,
+) -> str:
+    """
+    Format the results of a search tool within the request's limits.
+
+    Args:
+        results: The search results, best first
+        output_format: One of formatting.OUTPUT_FORMATS
+        fields: The product fields the call asked for, if any
+        max_tokens: The token budget the call asked for, if any
+        exclude: Default fields left out because the header already gives them
+        **options: Passed to formatting.format_results (title, context, plan, ...)
+
+    Returns:
+        The formatted results, truncated to max_response_bytes and max_tokens
+    """
+    return format_results(
+        results,
+        output_format,
+        fields or default_fields(output_format, exclude),
+        byte_limit=response_limit(),
+        max_tokens=max_tokens,
+        **options,
+    )
 
 
-@mcp.tool()
+@tool
 def create_test_index(num_documents: int = 10, index: str = "test_documents") -> str:
     """
     Create a test index with sample documents for demonstration purposes.
@@ -554,24 +1257,17 @@ def create_test_index(num_documents: int = 10, index: str = "test_documents") ->
             }
         )
 
-    # Delete the index if it exists
-    if es.indices.exists(index=index):
-        es.indices.delete(index=index)
+    def populate(new_index: str) -> None:
+        for doc in sample_docs:
+            get_es().index(index=new_index, document=doc)
 
-    # Create the index
-    es.indices.create(index=index)
-
-    # Index the documents
-    for doc in sample_docs:
-        es.index(index=index, document=doc)
-
-    # Refresh the index to make the documents searchable immediately
-    es.indices.refresh(index=index)
+    # Build a new generation and swap the alias, so searches never see a missing index
+    build_index_generation(index, {}, populate)
 
     return f"Created test index '{index}' with {len(sample_docs)} documents"
 
 
-@mcp.tool()
+@tool
 def create_ecommerce_test_index(
     num_products: int = 20, index: str = "ecommerce"
 ) -> str:
@@ -924,41 +1620,63 @@ def create_ecommerce_test_index(
             }
         )
 
-    # Delete the index if it exists
-    if es.indices.exists(index=index):
-        es.indices.delete(index=index)
+    # Create the index with the tuned e-commerce settings and mappings profile
+    mappings = ecommerce_index_body()
 
-    # Create the index with appropriate mappings for e-commerce
-    mappings = {
-        "mappings": {
-            "properties": {
-                "product_name": {"type": "text"},
-                "description": {"type": "text"},
-                "price": {"type": "float"},
-                "brand": {"type": "keyword"},
-                "category": {"type": "keyword"},
-                "rating": {"type": "float"},
-                "in_stock": {"type": "boolean"},
-                "tags": {"type": "keyword"},
-            }
-        }
-    }
+    # Build a new generation with deterministic IDs in a single bulk request,
+    # then swap the alias so the live index keeps serving until it is ready
+    build_index_generation(
+        index, mappings, lambda new_index: upsert_products(new_index, sample_products)
+    )
+
+    return (
+        f"Created e-commerce test index '{index}' with {len(sample_products)} products"
+    )
 
-    es.indices.create(index=index, body=mappings)
 
-    # Index the products
-    for product in sample_products:
-        es.index(index=index, document=product)
+@tool
+def migrate_index(index: str = DEFAULT_INDEX) -> str:
+    """
+    Rebuild an e-commerce index with the current settings and mappings profile.
+
+    The documents are reindexed into a new generation built with the current
+    profile, and the alias is swapped to it once complete, so searches keep
+    working throughout. Indexes already on the current profile are left alone.
+
+    Args:
+        index: The alias (or legacy concrete index) to migrate
+
+    Returns:
+        A message describing the migration
+    """
+    try:
+        if not get_es().indices.exists(index=index):
+            return f"Index '{index}' does not exist."
+
+        source = resolve_index(index)
+        current_version = profile_version(get_index_schema(index))
+        if current_version >= ECOMMERCE_PROFILE_VERSION:
+            return f"Index '{index}' already uses profile version {current_version}."
+
+        def populate(new_index: str) -> None:
+            get_es().reindex(
+                source={"index": source},
+                dest={"index": new_index},
+                wait_for_completion=True,
+                refresh=True,
+            )
 
-    # Refresh the index to make the products searchable immediately
-    es.indices.refresh(index=index)
+        new_index = build_index_generation(index, ecommerce_index_body(), populate)
+    except Exception as e:
+        return f"Error migrating index '{index}': {str(e)}"
 
     return (
-        f"Created e-commerce test index '{index}' with {len(sample_products)} products"
+        f"Migrated '{index}' from profile version {current_version} to "
+        f"{ECOMMERCE_PROFILE_VERSION} (now served by '{new_index}')."
     )
 
 
-@mcp.tool()
+@tool
 def search_products_by_category(
     category: str,
     min_price: float = 0,
@@ -966,6 +1684,9 @@ def search_products_by_category(
     min_rating: float = 0,
     in_stock_only: bool = False,
     index: str = DEFAULT_INDEX,
+    output_format: str = "text",
+    fields: Optional[List[str]] = None,
+    max_tokens: Optional[int] = None,
 ) -> str:
     """
     Search for products in a specific category with optional price and rating filters.
@@ -977,10 +1698,17 @@ def search_products_by_category(
         min_rating: Minimum rating filter (0-5)
         in_stock_only: Whether to show only in-stock products
         index: The Elasticsearch index to search
+        output_format: "text" for readable results, "compact" for a line per
+            product, "markdown" for a table, or "json" for compact JSON with
+            the filters, the hits and the search time
+        fields: Product fields to include for each hit
+        max_tokens: Estimated tokens to truncate the results to
 
     Returns:
-        Formatted search results
+        Formatted search results, or JSON
     """
+    check_output_format(output_format)
+
     # Build the Elasticsearch query
     es_query = {
         "query": {
@@ -993,6 +1721,9 @@ def search_products_by_category(
             }
         },
         "sort": [{"rating": {"order": "desc"}}, {"price": {"order": "asc"}}],
+        # The sort matches the index sort, so skipping the hit count lets
+        # Elasticsearch stop after the top hits of each segment
+        "track_total_hits": False,
     }
 
     # Add in_stock filter if requested
@@ -1000,91 +1731,116 @@ def search_products_by_category(
         es_query["query"]["bool"]["filter"].append({"term": {"in_stock": True}})
 
     # Execute the search
+    started = time.perf_counter()
     try:
-        response = es.search(index=index, body=es_query, size=10)
+        with metrics.timer("stage_latency", stage="es_execution"):
+            response = search_es().search(index=index, body=es_query, size=10)
         results = [
             {**hit["_source"], "score": hit["_score"]}
             for hit in response["hits"]["hits"]
         ]
     except Exception as e:
-        print(f"Search error: {e}")
-        return f"Error searching for products in category '{category}': {str(e)}"
+        # Searches of a cancelled request fail; report the cancellation instead
+        check_cancelled()
+        metrics.inc("errors_total", kind="es_execution")
+        logger.error("Search error: %s", e)
+        error = f"Error searching for products in category '{category}': {str(e)}"
+        return codec.dumps({"error": error}) if output_format == "json" else error
 
     # Format the results
-    if not results:
-        return f"No products found in category '{category}' matching your criteria."
-
-    formatted_results = "\n\n".join(
-        [
-            f"Product {i+1}:\n"
-            f"Name: {result.get('product_name', 'Unnamed product')}\n"
-            f"Brand: {result.get('brand', 'N/A')}\n"
-            f"Price: ${result.get('price', 'N/A')}\n"
-            f"Rating: {result.get('rating', 'N/A')}/5\n"
-            f"In Stock: {'Yes' if result.get('in_stock', False) else 'No'}\n"
-            f"Description: {result.get('description', 'No description')[:150]}..."
-            for i, result in enumerate(results)
-        ]
-    )
-
-    return f"""Products in category '{category}':
+    return render_results(
+        results,
+        output_format,
+        fields,
+        max_tokens,
+        exclude=("category",),
+        title=f"""Products in category '{category}':
 Price range: ${min_price} - ${max_price}
 Minimum rating: {min_rating}/5
-In stock only: {'Yes' if in_stock_only else 'No'}
-
-Results:
-{formatted_results}
-"""
+In stock only: {'Yes' if in_stock_only else 'No'}""",
+        context={
+            "category": category,
+            "filters": {
+                "min_price": min_price,
+                "max_price": max_price,
+                "min_rating": min_rating,
+                "in_stock_only": in_stock_only,
+            },
+            "timings_ms": {"search": elapsed_ms(started)},
+        },
+        empty=f"No products found in category '{category}' matching your criteria.",
+    )
 
 
-@mcp.tool()
-def search_products_by_brand(brand: str, index: str = DEFAULT_INDEX) -> str:
+@tool
+def search_products_by_brand(
+    brand: str,
+    index: str = DEFAULT_INDEX,
+    output_format: str = "text",
+    fields: Optional[List[str]] = None,
+    max_tokens: Optional[int] = None,
+) -> str:
     """
     Search for products from a specific brand.
 
     Args:
         brand: The brand name to search for
         index: The Elasticsearch index to search
+        output_format: "text" for readable results, "compact" for a line per
+            product, "markdown" for a table, or "json" for compact JSON with
+            the hits and the search time
+        fields: Product fields to include for each hit
+        max_tokens: Estimated tokens to truncate the results to
 
     Returns:
-        Formatted search results
+        Formatted search results, or JSON
     """
+    check_output_format(output_format)
+
     # Build the Elasticsearch query
     es_query = {
         "query": {"term": {"brand": brand}},
         "sort": [{"rating": {"order": "desc"}}],
+        "track_total_hits": False,
     }
 
     # Execute the search
+    started = time.perf_counter()
     try:
-        response = es.search(index=index, body=es_query, size=10)
+        with metrics.timer("stage_latency", stage="es_execution"):
+            response = search_es().search(index=index, body=es_query, size=10)
         results = [
             {**hit["_source"], "score": hit["_score"]}
             for hit in response["hits"]["hits"]
         ]
     except Exception as e:
-        print(f"Search error: {e}")
-        return f"Error searching for products from brand '{brand}': {str(e)}"
+        # Searches of a cancelled request fail; report the cancellation instead
+        check_cancelled()
+        metrics.inc("errors_total", kind="es_execution")
+        logger.error("Search error: %s", e)
+        error = f"Error searching for products from brand '{brand}': {str(e)}"
+        return codec.dumps({"error": error}) if output_format == "json" else error
 
     # Format the results
-    if not results:
-        return f"No products found from brand '{brand}'."
-
-    formatted_results = "\n\n".join(
-        [
-            f"Product {i+1}:\n"
-            f"Name: {result.get('product_name', 'Unnamed product')}\n"
-            f"Price: ${result.get('price', 'N/A')}\n"
-            f"Category: {result.get('category', 'N/A')}\n"
-            f"Rating: {result.get('rating', 'N/A')}/5\n"
-            f"In Stock: {'Yes' if result.get('in_stock', False) else 'No'}\n"
-            f"Description: {result.get('description', 'No description')[:150]}..."
-            for i, result in enumerate(results)
-        ]
+    return render_results(
+        results,
+        output_format,
+        fields,
+        max_tokens,
+        exclude=("brand",),
+        title=f"Products from brand '{brand}':",
+        context={"brand": brand, "timings_ms": {"search": elapsed_ms(started)}},
+        empty=f"No products found from brand '{brand}'.",
     )
 
-    return f"""Products from brand '{brand}':
 
-Results:
-{formatted_results}
-"""
+@tool
+def server_stats() -> str:
+    """
+    Get the server's metrics: call counts, errors and latency histograms per
+    tool and per search stage, cache hit rates and queue depths.
+
+    Returns:
+        The metrics as JSON
+    """
+    return codec.dumps(metrics.stats())
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Result formatting for the search tools.
+
+All three search tools format their hits here, in one of four output
+profiles:
+
+- "text": the readable default, a labelled block of lines per product
+- "compact": one line per product
+- "markdown": a table with a row per product
+- "json": compact JSON with the hits as objects
+
+Each profile formats the product fields it is given (its defaults when the
+call doesn't choose), optionally with the query plan or just its
+explanation. The row formatter of a profile and field list is built
+once, and the response is written into a single buffer, stopping before
+the hit that would push it over max_response_bytes or a token budget;
+the hits left out are counted instead.
+"""
+
+import io
+import os
+import functools
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import codec
+from .framing import json_too_large
+from .history import CHARS_PER_TOKEN
+
+# Output profiles of the search tools, and how much of the query plan a
+# result includes
+OUTPUT_FORMATS = ("text", "compact", "markdown", "json")
+PLAN_DETAILS = ("full", "explanation", "none")
+
+# Estimated tokens a search result is truncated to (0 for no budget)
+RESULT_TOKEN_BUDGET = int(os.getenv("MCP_RESULT_TOKEN_BUDGET", "0"))
+
+# Product fields of the readable text profile, and of the other profiles
+# when the call doesn't ask for others
+TEXT_FIELDS = (
+    "product_name",
+    "brand",
+    "price",
+    "rating",
+    "in_stock",
+    "category",
+    "description",
+)
+DEFAULT_RESULT_FIELDS = (
+    "product_name",
+    "brand",
+    "price",
+    "rating",
+    "in_stock",
+    "category",
+)
+
+# Characters of a description shown in text results
+DESCRIPTION_CHARS = 150
+
+# Bytes (or characters, for a token budget) kept free for the note about
+# the hits left out
+NOTE_RESERVE = 80
+
+# Label, value template and value getter of each known product field; other
+# fields are shown as they are
+_FIELDS: Dict[str, Tuple[str, str, Callable[[Dict[str, Any]], Any]]] = {
+    "product_name": ("Name", "{}", lambda r: r.get("product_name", "Unnamed product")),
+    "brand": ("Brand", "{}", lambda r: r.get("brand", "N/A")),
+    "price": ("Price", "${}", lambda r: r.get("price", "N/A")),
+    "rating": ("Rating", "{}/5", lambda r: r.get("rating", "N/A")),
+    "in_stock": ("In Stock", "{}", lambda r: "Yes" if r.get("in_stock") else "No"),
+    "category": ("Category", "{}", lambda r: r.get("category", "N/A")),
+    "description": (
+        "Description",
+        "{}...",
+        lambda r: str(r.get("description", "No description"))[:DESCRIPTION_CHARS],
+    ),
+}
+
+# Getters that differ in the compact profile, where values aren't labelled
+_COMPACT_GETTERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "in_stock": lambda r: "in stock" if r.get("in_stock") else "out of stock",
+}
+
+Row = Callable[[int, Dict[str, Any]], str]
+
+
+def check_output_format(output_format: str) -> None:
+    """
+    Check the output_format of a search tool call.
+
+    Raises:
+        ValueError: If the format isn't one of OUTPUT_FORMATS
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unknown output_format {output_format!r}; "
+            f"expected one of: {', '.join(OUTPUT_FORMATS)}"
+        )
+
+
+def check_plan_detail(plan_detail: str) -> None:
+    """
+    Check the plan_detail of a search tool call.
+
+    Raises:
+        ValueError: If the detail isn't one of PLAN_DETAILS
+    """
+    if plan_detail not in PLAN_DETAILS:
+        raise ValueError(
+            f"Unknown plan_detail {plan_detail!r}; "
+            f"expected one of: {', '.join(PLAN_DETAILS)}"
+        )
+
+
+def default_fields(output_format: str, exclude: Sequence[str] = ()) -> List[str]:
+    """The fields a profile shows by default, less any the header already gives."""
+    fields = TEXT_FIELDS if output_format == "text" else DEFAULT_RESULT_FIELDS
+    return [field for field in fields if field not in exclude]
+
+
+def _field(
+    field: str, compact: bool = False
+) -> Tuple[str, str, Callable[[Dict[str, Any]], Any]]:
+    if field in _FIELDS:
+        label, template, get = _FIELDS[field]
+    else:
+        label, template = field.replace("_", " ").title(), "{}"
+
+        def get(r: Dict[str, Any]) -> Any:
+            return r.get(field, "N/A")
+
+    if compact:
+        get = _COMPACT_GETTERS.get(field, get)
+    return label, template, get
+
+
+def _markdown_cell(text: str) -> str:
+    return text.replace("|", "\\|").replace("\n", " ")
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+@functools.lru_cache(maxsize=64)
+def compile_row(output_format: str, fields: Tuple[str, ...]) -> Row:
+    """
+    Build the formatter of one hit for a profile and field list.
+
+    The text and compact rows are a single str.format template with a slot
+    per field, built once per profile and field list, so formatting a hit
+    is one getter call per field and one format call.
+
+    Args:
+        output_format: One of OUTPUT_FORMATS
+        fields: The product fields to show, in order
+
+    Returns:
+        A function of a hit's position and source that formats it
+    """
+    if output_format == "json":
+        return lambda i, r: codec.dumps(
+            {field: r[field] for field in fields if field in r}
+        )
+
+    specs = [_field(field, output_format == "compact") for field in fields]
+    getters = [get for _, _, get in specs]
+    if output_format == "markdown":
+        cells = [(value, get) for _, value, get in specs]
+        template = "| {} | " + " | ".join("{}" for _ in specs) + " |"
+        return lambda i, r: template.format(
+            i + 1, *[_markdown_cell(value.format(get(r))) for value, get in cells]
+        )
+
+    if output_format == "text":
+        template = "Product {}:\n" + "\n".join(
+            f"{_escape(label)}: {value}" for label, value, _ in specs
+        )
+    else:
+        template = "{}. " + " | ".join(value for _, value, _ in specs)
+    return lambda i, r: template.format(i + 1, *[get(r) for get in getters])
+
+
+def _plan_text(output_format: str, plan: Dict[str, Any], plan_detail: str) -> str:
+    """Format the plan section of a text, compact or markdown result."""
+    if plan_detail == "explanation":
+        return f"Query plan: {plan.get('explanation', 'N/A')}"
+    if output_format == "markdown":
+        return f"Query plan:\n```json\n{codec.dumps(plan)}\n```"
+    if output_format == "compact":
+        return f"Query plan: {codec.dumps(plan)}"
+    return f"Query plan:\n{codec.dumps(plan)}"
+
+
+def _head(
+    output_format: str,
+    fields: Sequence[str],
+    title: str,
+    context: Dict[str, Any],
+    plan: Optional[Dict[str, Any]],
+    plan_detail: str,
+    total: int,
+) -> Tuple[str, str, str]:
+    """Build the text before the hits, the separator between them and the text after."""
+    if output_format == "json":
+        response = dict(context)
+        if plan is not None and plan_detail == "full":
+            response["plan"] = plan
+        elif plan is not None and plan_detail == "explanation":
+            response["explanation"] = plan.get("explanation")
+        response["total"] = total
+        # The hits are written after the other keys, inside the same object
+        return codec.dumps(response)[:-1] + ',"hits":[', ",", "]}"
+
+    sections = [title] if title else []
+    if plan is not None and plan_detail != "none":
+        sections.append(_plan_text(output_format, plan, plan_detail))
+    if output_format == "text":
+        return "\n\n".join(sections + ["Results:\n"]), "\n\n", "\n"
+    if output_format == "compact":
+        return "\n".join(sections + [""]), "\n", "\n"
+    labels = [_markdown_cell(_field(field)[0]) for field in fields]
+    table = "| # | " + " | ".join(labels) + " |\n|---|" + "---|" * len(labels) + "\n"
+    return "\n\n".join(sections + [table]), "\n", "\n"
+
+
+def format_results(
+    results: List[Dict[str, Any]],
+    output_format: str = "text",
+    fields: Optional[Sequence[str]] = None,
+    title: str = "",
+    context: Optional[Dict[str, Any]] = None,
+    plan: Optional[Dict[str, Any]] = None,
+    plan_detail: str = "full",
+    empty: str = "No products found.",
+    byte_limit: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """
+    Format search results in an output profile.
+
+    Args:
+        results: The search results, best first
+        output_format: One of OUTPUT_FORMATS
+        fields: The product fields to show (defaults to the profile's)
+        title: The first lines of a text, compact or markdown result
+        context: The other keys of a JSON result (query, filters, timings, ...)
+        plan: The query plan the search was run with, if any
+        plan_detail: Include the "full" plan, only its "explanation", or "none"
+        empty: The text result when nothing was found
+        byte_limit: Most bytes the result may take (max_response_bytes)
+        max_tokens: Most estimated tokens the result may take (defaults to
+            MCP_RESULT_TOKEN_BUDGET; 0 or None for no budget)
+
+    Returns:
+        The formatted results; hits that don't fit the limits are left out
+        and counted in a note (or in "omitted", for JSON)
+    """
+    fields = tuple(fields or default_fields(output_format))
+    if max_tokens is None:
+        max_tokens = RESULT_TOKEN_BUDGET
+    char_limit = max_tokens * CHARS_PER_TOKEN if max_tokens else None
+
+    if not results and output_format != "json":
+        text = empty
+        if plan is not None and plan_detail == "full" and output_format == "text":
+            # The plan follows on one line, as it always has for text results
+            text += f"\n\nQuery plan: {codec.dumps(plan)}"
+        elif plan is not None and plan_detail != "none":
+            text += "\n\n" + _plan_text(output_format, plan, plan_detail)
+        return text
+
+    head, separator, tail = _head(
+        output_format, fields, title, context or {}, plan, plan_detail, len(results)
+    )
+    row = compile_row(output_format, fields)
+    buffer = io.StringIO()
+    buffer.write(head)
+    if byte_limit is None and char_limit is None:
+        if output_format == "json":
+            # One serialization of all the hits, less the list's brackets
+            buffer.write(
+                codec.dumps(
+                    [
+                        {field: r[field] for field in fields if field in r}
+                        for r in results
+                    ]
+                )[1:-1]
+            )
+        else:
+            buffer.write(
+                separator.join([row(i, result) for i, result in enumerate(results)])
+            )
+        buffer.write(tail)
+        return buffer.getvalue()
+
+    used_bytes = len(head.encode("utf-8")) + len(tail)
+    if output_format == "json" and byte_limit is not None and used_bytes > byte_limit:
+        # Not even the response without hits fits; cutting it would break it
+        return json_too_large(used_bytes, byte_limit)
+    used_chars = len(head) + len(tail)
+    written = 0
+    limit = ""
+    for i, result in enumerate(results):
+        text = (separator if written else "") + row(i, result)
+        # Unless this is the last hit, keep room for the note about the rest
+        reserve = NOTE_RESERVE if i < len(results) - 1 else 0
+        text_bytes = len(text.encode("utf-8")) if byte_limit is not None else 0
+        if byte_limit is not None and used_bytes + text_bytes + reserve > byte_limit:
+            limit = "max_response_bytes"
+            break
+        if char_limit is not None and used_chars + len(text) + reserve > char_limit:
+            limit = "max_tokens"
+            break
+        buffer.write(text)
+        used_bytes += text_bytes
+        used_chars += len(text)
+        written += 1
+
+    omitted = len(results) - written
+    if output_format == "json":
+        buffer.write(f'],"omitted":{omitted}}}' if omitted else tail)
+    elif omitted:
+        buffer.write(f"{separator}[{omitted} more results left out to fit {limit}]\n")
+    else:
+        buffer.write(tail)
+    return buffer.getvalue()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Message framing and response size limits for the Search MCP protocol.
+
+Messages are newline-delimited JSON by default. After the ready message a
+client can send a hello message to switch its connection to length-prefixed
+frames:
+
+    {"type": "hello", "framing": "length", "compression": "zlib"}
+
+The server answers with a hello_response (still a line), and from then on
+every message in both directions is a frame: a 4-byte big-endian payload
+length, a flags byte, and the JSON payload. Payloads of at least
+COMPRESS_THRESHOLD bytes are zlib-compressed when compression was
+negotiated, which is flagged in the flags byte. Frames are read with two
+exact-size reads instead of scanning for a newline.
+
+A tool_call (or batch) can also carry `max_response_bytes`; the result
+formatters drop whole results to fit it, and the server truncates anything
+still larger. JSON results are never cut mid-object: one that can't fit is
+replaced with a small JSON error marked "truncated".
+"""
+
+import os
+import zlib
+import struct
+import contextvars
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+from . import codec
+
+# Framings and compressions a connection can use
+FRAMINGS = ("line", "length")
+COMPRESSIONS = ("zlib",)
+
+# Framing and compression requested by MCPClient
+FRAMING = os.getenv("MCP_FRAMING", "line")
+COMPRESSION = os.getenv("MCP_COMPRESSION", "") or None
+
+# Smallest payload worth compressing, in bytes, and the zlib level used
+COMPRESS_THRESHOLD = int(os.getenv("MCP_COMPRESS_THRESHOLD", "16384"))
+COMPRESS_LEVEL = 1
+
+# Largest message a client accepts, in bytes
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+# Frame header: payload length and flags
+HEADER = struct.Struct(">IB")
+FLAG_ZLIB = 0x01
+
+# Marker appended to a result cut short to fit max_response_bytes
+TRUNCATED_NOTE = "\n[truncated to fit max_response_bytes]"
+
+
+class FrameError(ValueError):
+    """Raised for a frame that can't be decoded."""
+
+
+def encode_frame(payload: bytes, compression: Optional[str] = None) -> bytes:
+    """
+    Frame a serialized message.
+
+    Args:
+        payload: The JSON message
+        compression: The negotiated compression, if any
+
+    Returns:
+        The frame header followed by the (possibly compressed) payload
+    """
+    flags = 0
+    if compression == "zlib" and len(payload) >= COMPRESS_THRESHOLD:
+        payload = zlib.compress(payload, COMPRESS_LEVEL)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(len(payload), flags) + payload
+
+
+def parse_header(header: bytes, max_bytes: int) -> Tuple[int, int]:
+    """
+    Parse a frame header.
+
+    Returns:
+        The payload length and flags
+
+    Raises:
+        FrameError: If the payload is larger than max_bytes
+    """
+    length, flags = HEADER.unpack(header)
+    if length > max_bytes:
+        raise FrameError(f"Frame of {length} bytes exceeds the {max_bytes} limit")
+    return length, flags
+
+
+def decode_payload(payload: bytes, flags: int, max_bytes: int) -> bytes:
+    """
+    Get the JSON message carried by a frame.
+
+    Raises:
+        FrameError: If the payload can't be decompressed, or decompresses to
+            more than max_bytes
+    """
+    if not flags & FLAG_ZLIB:
+        return payload
+    decompressor = zlib.decompressobj()
+    try:
+        message = decompressor.decompress(payload, max_bytes)
+    except zlib.error as e:
+        raise FrameError(f"Corrupt compressed frame: {e}") from None
+    if decompressor.unconsumed_tail:
+        raise FrameError(f"Frame decompresses to more than {max_bytes} bytes")
+    return message
+
+
+_response_limit: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "max_response_bytes", default=None
+)
+
+
+def response_limit() -> Optional[int]:
+    """Get the max_response_bytes of the request being handled, if any."""
+    return _response_limit.get()
+
+
+@contextmanager
+def response_limit_scope(limit: Optional[int]) -> Iterator[None]:
+    """Bind a request's max_response_bytes to the code running in this context."""
+    reset = _response_limit.set(limit)
+    try:
+        yield
+    finally:
+        _response_limit.reset(reset)
+
+
+def fit_response(text: str, limit: Optional[int]) -> Tuple[str, bool]:
+    """
+    Truncate a result to at most `limit` UTF-8 bytes.
+
+    Returns:
+        The result, and whether it had to be truncated
+    """
+    if limit is None:
+        return text, False
+    encoded = text.encode("utf-8")
+    if len(encoded) <= limit:
+        return text, False
+    note = TRUNCATED_NOTE if len(TRUNCATED_NOTE) <= limit else ""
+    kept = encoded[: limit - len(note)].decode("utf-8", errors="ignore")
+    return kept + note, True
+
+
+def json_too_large(size: int, limit: int) -> str:
+    """The JSON result sent in place of one of `size` bytes over `limit`."""
+    return codec.dumps(
+        {
+            "error": f"Result of {size} bytes exceeds max_response_bytes ({limit})",
+            "truncated": True,
+        }
+    )
+
+
+def fit_json_response(text: str, limit: Optional[int]) -> Tuple[str, bool]:
+    """
+    Keep a JSON result valid under a byte limit.
+
+    Cutting JSON short would leave it unparseable, so a result that doesn't
+    fit is replaced whole with json_too_large's error object.
+
+    Returns:
+        The result, and whether it had to be replaced
+    """
+    if limit is None:
+        return text, False
+    size = len(text.encode("utf-8"))
+    if size <= limit:
+        return text, False
+    return json_too_large(size, limit), True
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Token-budgeted conversation history for the LLM clients.
+
+Every LLM request resends the whole conversation, and search results are
+long, so an unmanaged history makes each turn slower and costlier than the
+last. ConversationHistory keeps the messages of a conversation and, before
+each request, compacts them to fit a token budget:
+
+1. Tool results outside the most recent turns are replaced with a compact
+   summary (the result's first line, the number of products and their
+   names, brands and prices).
+2. If that isn't enough, the oldest turns are dropped whole, so every
+   remaining function call still has its result and the conversation still
+   starts with a user message.
+
+The system prompt and the most recent turns are never touched. Tokens are
+estimated from message length, which is close enough for budgeting.
+"""
+
+import os
+import re
+import logging
+from typing import Any, Dict, List, Optional
+
+from . import codec
+
+logger = logging.getLogger(__name__)
+
+# Estimated prompt tokens a conversation is compacted to fit, and the
+# turns (a user message and everything up to the next one) kept verbatim
+HISTORY_TOKEN_BUDGET = int(os.getenv("MCP_HISTORY_TOKEN_BUDGET", "6000"))
+KEEP_RECENT_TURNS = int(os.getenv("MCP_HISTORY_KEEP_TURNS", "2"))
+
+# Rough characters per token, and the overhead of each message
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Products listed by name in a tool result summary
+SUMMARY_PRODUCTS = 5
+
+_NAME_RE = re.compile(r"^Name: (.*)$", re.MULTILINE)
+_BRAND_RE = re.compile(r"^Brand: (.*)$", re.MULTILINE)
+_PRICE_RE = re.compile(r"^Price: (.*)$", re.MULTILINE)
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the tokens of a piece of text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Estimate the tokens a list of messages takes in a prompt."""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if content and not isinstance(content, str):
+            content = codec.dumps(content)
+        rest = {
+            key: value
+            for key, value in message.items()
+            if key not in ("role", "content") and value
+        }
+        total += MESSAGE_OVERHEAD_TOKENS + count_tokens(content or "")
+        if rest:
+            total += count_tokens(codec.dumps(rest))
+    return total
+
+
+def summarize_tool_result(text: str, tool_name: Optional[str] = None) -> str:
+    """
+    Summarize a tool result for a compacted history.
+
+    Args:
+        text: The tool result
+        tool_name: The tool that produced it
+
+    Returns:
+        A one-line JSON summary: the result's first line, the number of
+        products in it (text or JSON results), and the first few products
+    """
+    lines = text.strip().splitlines()
+    first_line = lines[0][:200] if lines else ""
+    names = _NAME_RE.findall(text)
+    brands = _BRAND_RE.findall(text)
+    prices = _PRICE_RE.findall(text)
+    if text.startswith("{"):
+        # A JSON result (output_format="json") lists its hits as objects
+        try:
+            data = codec.loads(text)
+            hits = data.get("hits") or []
+        except (ValueError, AttributeError):
+            data, hits = {}, []
+        first_line = " ".join(
+            f"{key}: {data[key]}"
+            for key in ("query", "category", "brand", "error")
+            if key in data
+        )[:200]
+        names = [str(hit.get("product_name", "")) for hit in hits]
+        brands = [str(hit.get("brand", "")) for hit in hits]
+        prices = [f"${hit['price']}" if "price" in hit else "" for hit in hits]
+    summary: Dict[str, Any] = {"summary_of": tool_name or "tool result"}
+    summary["first_line"] = first_line
+    if names:
+        summary["products"] = len(names)
+        summary["top"] = [
+            " | ".join(
+                part
+                for part in (
+                    name,
+                    brands[i] if i < len(brands) else "",
+                    prices[i] if i < len(prices) else "",
+                )
+                if part
+            )
+            for i, name in enumerate(names[:SUMMARY_PRODUCTS])
+        ]
+    return codec.dumps(summary)
+
+
+class ConversationHistory:
+    """The messages of an LLM conversation, compacted to a token budget."""
+
+    def __init__(
+        self,
+        system_prompt: str = "",
+        budget: int = HISTORY_TOKEN_BUDGET,
+        keep_turns: int = KEEP_RECENT_TURNS,
+        system_message: bool = True,
+    ):
+        """
+        Start a conversation.
+
+        Args:
+            system_prompt: The system prompt; always kept, and counted
+                against the budget
+            budget: Estimated prompt tokens to compact the history to
+            keep_turns: Most recent turns never compacted or dropped
+            system_message: Send the system prompt as the first message
+                (OpenAI); if False it is sent separately (Anthropic) and
+                only counted
+        """
+        self.system_prompt = system_prompt
+        self.budget = budget
+        self.keep_turns = max(1, keep_turns)
+        self.system_message = system_message
+        self.turns: List[List[Dict[str, Any]]] = []
+        # Ids of the messages holding tool results not yet compacted, with
+        # the tool's name
+        self.tool_results: Dict[int, Optional[str]] = {}
+        self.last_stats: Dict[str, Any] = {}
+
+    def add_user(self, content: Any) -> None:
+        """Start a new turn with a user message."""
+        self.turns.append([{"role": "user", "content": content}])
+
+    def add(self, message: Dict[str, Any]) -> None:
+        """Add a message (the assistant's reply, say) to the current turn."""
+        if not self.turns:
+            self.turns.append([])
+        self.turns[-1].append(message)
+
+    def add_tool_result(
+        self, message: Dict[str, Any], tool_name: Optional[str] = None
+    ) -> None:
+        """
+        Add a message carrying a tool result to the current turn.
+
+        Its content (a string, or content blocks of type tool_result) is
+        summarized once the turn is no longer recent.
+        """
+        self.add(message)
+        self.tool_results[id(message)] = tool_name
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        """The messages to send, without compacting them."""
+        messages = [message for turn in self.turns for message in turn]
+        if self.system_message and self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        return messages
+
+    def prompt_tokens(self) -> int:
+        """Estimate the tokens the conversation would take as a prompt."""
+        tokens = estimate_tokens([message for turn in self.turns for message in turn])
+        return tokens + count_tokens(self.system_prompt) + MESSAGE_OVERHEAD_TOKENS
+
+    def prepare(self) -> List[Dict[str, Any]]:
+        """
+        Compact the history to the budget and get the messages to send.
+
+        The estimated prompt size and what was compacted are kept in
+        `last_stats` (and logged) for each request.
+        """
+        before = self.prompt_tokens()
+        compacted = dropped = 0
+        old_turns = max(0, len(self.turns) - self.keep_turns)
+
+        if before > self.budget:
+            for turn in self.turns[:old_turns]:
+                for message in turn:
+                    if id(message) in self.tool_results and self._compact(message):
+                        compacted += 1
+            while old_turns - dropped > 0 and self.prompt_tokens() > self.budget:
+                for message in self.turns[0]:
+                    self.tool_results.pop(id(message), None)
+                del self.turns[0]
+                dropped += 1
+
+        after = self.prompt_tokens()
+        self.last_stats = {
+            "prompt_tokens": after,
+            "tokens_before_compaction": before,
+            "budget": self.budget,
+            "messages": sum(len(turn) for turn in self.turns),
+            "compacted_results": compacted,
+            "dropped_turns": dropped,
+        }
+        if after > self.budget:
+            logger.warning(
+                "Prompt of ~%d tokens exceeds the %d token budget even after "
+                "compaction",
+                after,
+                self.budget,
+            )
+        else:
+            logger.debug("Prompt of ~%d tokens: %s", after, self.last_stats)
+        return self.messages
+
+    def describe(self) -> str:
+        """Describe the last prompt's size and compaction in one line."""
+        stats = self.last_stats
+        if not stats:
+            return "No prompt sent yet"
+        text = f"Prompt ~{stats['prompt_tokens']} tokens (budget {stats['budget']})"
+        if stats["compacted_results"] or stats["dropped_turns"]:
+            text += (
+                f", down from ~{stats['tokens_before_compaction']}:"
+                f" {stats['compacted_results']} tool results summarized,"
+                f" {stats['dropped_turns']} turns dropped"
+            )
+        return text
+
+    def _compact(self, message: Dict[str, Any]) -> bool:
+        """Replace a tool result with its summary; False if already compact."""
+        tool_name = self.tool_results.pop(id(message))
+        content = message.get("content")
+        if isinstance(content, str):
+            summary = summarize_tool_result(content, tool_name)
+            if len(summary) >= len(content):
+                return False
+            message["content"] = summary
+            return True
+        changed = False
+        for block in content if isinstance(content, list) else []:
+            if isinstance(block, dict) and block.get("type") == "tool_result":
+                text = block.get("content")
+                if isinstance(text, str):
+                    summary = summarize_tool_result(text, tool_name)
+                    if len(summary) < len(text):
+                        block["content"] = summary
+                        changed = True
+        return changed
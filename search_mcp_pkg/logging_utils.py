@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Low-overhead structured logging for the Search MCP server.
+
+Log records are handed to a bounded queue and written to stderr by a
+background thread, so a slow stderr never blocks request handling. Records
+are formatted on that thread too, and large payloads are only truncated and
+rendered if the record is actually emitted.
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from typing import Any, Dict, Optional
+
+# Log level, output format ("text" or "json") and payload size limit
+LOG_LEVEL = os.getenv("MCP_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("MCP_LOG_FORMAT", "text").lower()
+LOG_PAYLOAD_LIMIT = int(os.getenv("MCP_LOG_PAYLOAD_LIMIT", "500"))
+
+# Fraction of high-volume (per-request) events that are logged
+LOG_SAMPLE_RATE = float(os.getenv("MCP_LOG_SAMPLE_RATE", "1.0"))
+
+# Records waiting to be written; further records are dropped when it's full
+LOG_QUEUE_SIZE = int(os.getenv("MCP_LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+class Truncated:
+    """
+    Lazily rendered, truncated log argument.
+
+    Pass it as a %-style argument: the value is only converted to a string,
+    and cut down to `limit` characters, when the record is formatted.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = LOG_PAYLOAD_LIMIT):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if isinstance(self.value, str):
+            text = self.value
+        elif isinstance(self.value, bytes):
+            text = self.value.decode("utf-8", "replace")
+        else:
+            text = repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[: self.limit]}... [{len(text) - self.limit} more chars]"
+
+    __repr__ = __str__
+
+
+def truncate(value: Any, limit: int = LOG_PAYLOAD_LIMIT) -> Truncated:
+    """Wrap a log argument so it is truncated when (and only if) it's logged."""
+    return Truncated(value, limit)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of high-volume records.
+
+    Records logged with `extra={"sampled": True}` are kept once every
+    1 / rate records of the same message template; all other records pass.
+    """
+
+    def __init__(self, rate: float = LOG_SAMPLE_RATE):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self.counts: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False):
+            return True
+        if not self.every:
+            return False
+        with self.lock:
+            count = self.counts.get(record.msg, 0)
+            self.counts[record.msg] = count + 1
+        return count % self.every == 0
+
+
+def extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """Get the structured fields passed to a log call through `extra`."""
+    return {
+        key: value
+        for key, value in vars(record).items()
+        if key not in _RECORD_ATTRS and key != "sampled"
+    }
+
+
+class TextFormatter(logging.Formatter):
+    """Classic one-line format with `extra` fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **extra_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks and leaves formatting to the listener.
+
+    The stdlib handler formats the message in the calling thread; here the
+    record is queued as-is and rendered by the listener thread. When the
+    queue is full the record is dropped and counted instead of waiting.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(
+    level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None
+) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a background writer thread.
+
+    Args:
+        level: The root log level
+        fmt: "text" for the classic one-line format or "json" for JSON lines
+        stream: Where the listener writes (defaults to stderr)
+
+    Returns:
+        The running queue listener (stopped automatically at exit)
+    """
+    global _listener, _handler
+
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+    _handler = handler
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the background writer."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    """Get the number of log records dropped because the queue was full."""
+    return _handler.dropped if _handler is not None else 0
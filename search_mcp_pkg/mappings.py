@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Index settings and mapping profiles for the Search MCP indexes.
+
+Profiles are versioned: the version is stored in the index mapping's
+`_meta` so that `migrate_index` can tell when a live index was built with an
+older profile and needs to be rebuilt.
+"""
+
+import os
+from typing import Any, Dict, Optional
+
+# Bump whenever the e-commerce settings or mappings below change
+ECOMMERCE_PROFILE_NAME = "ecommerce"
+ECOMMERCE_PROFILE_VERSION = 2
+
+# Catch-all text field that every searchable field is copied into
+CATCH_ALL_FIELD = "search_text"
+
+# Field holding the hash of a product's content, used to skip unchanged products
+CONTENT_HASH_FIELD = "content_hash"
+
+# Keyword fields the query planner aggregates on for every query
+FACET_FIELDS = ("category", "brand", "tags")
+
+# Shard and replica counts; a single shard suits catalogs up to a few million products
+DEFAULT_SHARDS = int(os.getenv("ELASTICSEARCH_SHARDS", "1"))
+DEFAULT_REPLICAS = int(os.getenv("ELASTICSEARCH_REPLICAS", "0"))
+
+
+def ecommerce_index_body(
+    shards: Optional[int] = None, replicas: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Get the settings and mappings of the e-commerce index profile.
+
+    The profile is tuned for the query mix the server runs:
+    - brand, category and tags load global ordinals eagerly, so the planner's
+      terms aggregations don't rebuild them on the first query after a refresh
+    - product_name has a keyword subfield for exact matches and sorting, and
+      index_prefixes for fast prefix queries
+    - text and facet fields are copied into a single catch-all field
+    - segments are sorted by rating then price, matching category and brand
+      browsing, so sorted top-N queries can terminate early
+
+    Args:
+        shards: Number of primary shards (defaults to ELASTICSEARCH_SHARDS)
+        replicas: Number of replicas (defaults to ELASTICSEARCH_REPLICAS)
+
+    Returns:
+        A request body for creating the index
+    """
+    return {
+        "settings": {
+            "index": {
+                "number_of_shards": DEFAULT_SHARDS if shards is None else shards,
+                "number_of_replicas": (
+                    DEFAULT_REPLICAS if replicas is None else replicas
+                ),
+                "sort.field": ["rating", "price"],
+                "sort.order": ["desc", "asc"],
+            }
+        },
+        "mappings": {
+            "_meta": {
+                "profile": ECOMMERCE_PROFILE_NAME,
+                "profile_version": ECOMMERCE_PROFILE_VERSION,
+            },
+            "properties": {
+                "product_name": {
+                    "type": "text",
+                    "index_prefixes": {},
+                    "fields": {"keyword": {"type": "keyword", "ignore_above": 256}},
+                    "copy_to": CATCH_ALL_FIELD,
+                },
+                "description": {"type": "text", "copy_to": CATCH_ALL_FIELD},
+                "price": {"type": "scaled_float", "scaling_factor": 100},
+                "brand": {
+                    "type": "keyword",
+                    "eager_global_ordinals": True,
+                    "copy_to": CATCH_ALL_FIELD,
+                },
+                "category": {
+                    "type": "keyword",
+                    "eager_global_ordinals": True,
+                    "copy_to": CATCH_ALL_FIELD,
+                },
+                "rating": {"type": "float"},
+                "in_stock": {"type": "boolean"},
+                "tags": {
+                    "type": "keyword",
+                    "eager_global_ordinals": True,
+                    "copy_to": CATCH_ALL_FIELD,
+                },
+                "sku": {"type": "keyword"},
+                CONTENT_HASH_FIELD: {"type": "keyword", "index": False},
+                CATCH_ALL_FIELD: {"type": "text"},
+            },
+        },
+    }
+
+
+def profile_version(mappings: Dict[str, Any]) -> int:
+    """
+    Get the profile version an index was built with.
+
+    Args:
+        mappings: The index mappings as returned by Elasticsearch
+
+    Returns:
+        The stored profile version, or 0 for indexes built before profiles
+    """
+    return int(mappings.get("_meta", {}).get("profile_version", 0))
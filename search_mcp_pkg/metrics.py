@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+In-process metrics for the Search MCP server.
+
+Counters and latency histograms are kept in a process-wide registry that
+the server and the tools record into. Histograms are HDR-style:
+log-linear buckets with a fixed relative error (about 3%), so recording is
+O(1) and percentiles stay accurate from microseconds to minutes without
+storing samples.
+
+The registry can be read as a JSON-friendly snapshot (the server's `stats`
+message and the `server_stats` tool) or as Prometheus text. The text can be
+written to a file periodically (MCP_METRICS_FILE) or served over HTTP
+(MCP_METRICS_PORT), on localhost unless MCP_METRICS_HOST says otherwise.
+"""
+
+import os
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Where to write Prometheus text, and how often (seconds)
+METRICS_FILE = os.getenv("MCP_METRICS_FILE", "")
+METRICS_INTERVAL = float(os.getenv("MCP_METRICS_INTERVAL", "15"))
+
+# Port to serve Prometheus text on at /metrics (0 disables it), and the
+# interface it listens on; tool names and latencies stay local by default
+METRICS_PORT = int(os.getenv("MCP_METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("MCP_METRICS_HOST", "127.0.0.1")
+
+# Prefix of every exported metric name
+PROMETHEUS_PREFIX = "search_mcp_"
+
+# Quantiles reported for each histogram
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+# Sub-buckets per power of two; 2**5 gives a relative error of about 3%
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKETS = SUB_BUCKETS // 2
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    HDR-style latency histogram.
+
+    Values are recorded in microseconds. Values below SUB_BUCKETS get an
+    exact bucket each. Above that, every power of two is split into
+    HALF_SUB_BUCKETS equal buckets.
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max", "lock")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def bucket(value: int) -> int:
+        if value < SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        return (
+            SUB_BUCKETS
+            + (shift - 1) * HALF_SUB_BUCKETS
+            + (value >> shift)
+            - HALF_SUB_BUCKETS
+        )
+
+    @staticmethod
+    def bucket_value(index: int) -> int:
+        """The highest value that falls into a bucket."""
+        if index < SUB_BUCKETS:
+            return index
+        shift, offset = divmod(index - SUB_BUCKETS, HALF_SUB_BUCKETS)
+        shift += 1
+        return ((offset + HALF_SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        value = max(0, int(seconds * 1_000_000))
+        index = self.bucket(value)
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            if not self.count or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+            self.count += 1
+            self.total += value
+
+    def percentiles(self, quantiles=QUANTILES) -> List[int]:
+        """Get the values (in microseconds) at the given quantiles."""
+        with self.lock:
+            buckets = sorted(self.counts.items())
+            count, maximum = self.count, self.max
+        results = []
+        for quantile in quantiles:
+            target = max(1, int(quantile * count + 0.5))
+            seen = 0
+            for index, bucket_count in buckets:
+                seen += bucket_count
+                if seen >= target:
+                    results.append(min(self.bucket_value(index), maximum))
+                    break
+            else:
+                results.append(maximum)
+        return results
+
+    def snapshot(self) -> Dict[str, float]:
+        """Summarize the histogram, with latencies in milliseconds."""
+        if not self.count:
+            return {"count": 0}
+        summary = {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count / 1000, 3),
+            "min_ms": round(self.min / 1000, 3),
+            "max_ms": round(self.max / 1000, 3),
+        }
+        for quantile, value in zip(QUANTILES, self.percentiles()):
+            summary[f"p{quantile * 100:g}_ms"] = round(value / 1000, 3)
+        return summary
+
+
+def label_key(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def label_text(labels: Labels) -> str:
+    return ",".join(f"{key}={value}" for key, value in labels) or "all"
+
+
+class MetricsRegistry:
+    """Counters, histograms and gauges, keyed by name and labels."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.gauges: Dict[str, Callable[[], Dict[Labels, float]]] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Add to a counter."""
+        key = label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def histogram(self, name: str, **labels: Any) -> Histogram:
+        """Get (or create) a histogram."""
+        key = label_key(labels)
+        series = self.histograms.get(name)
+        if series is None or key not in series:
+            with self.lock:
+                series = self.histograms.setdefault(name, {})
+                series.setdefault(key, Histogram())
+        return series[key]
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        """Record a duration in a histogram."""
+        self.histogram(name, **labels).record(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Time a block of code into a histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def gauge(self, name: str, read: Callable[[], Any]) -> None:
+        """
+        Register a gauge, read whenever metrics are collected.
+
+        Args:
+            name: The gauge name
+            read: Returns a number, or a dictionary mapping label
+                dictionaries (as tuples of pairs) to numbers
+        """
+
+        def collect() -> Dict[Labels, float]:
+            value = read()
+            return value if isinstance(value, dict) else {(): value}
+
+        self.gauges[name] = collect
+
+    def collect_gauges(self) -> Dict[str, Dict[Labels, float]]:
+        values = {}
+        for name, collect in list(self.gauges.items()):
+            try:
+                values[name] = collect()
+            except Exception:
+                logger.warning("Could not read gauge %s", name, exc_info=True)
+        return values
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get every metric as a JSON-friendly dictionary."""
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {
+                name: dict(series) for name, series in self.histograms.items()
+            }
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "counters": {
+                name: {label_text(key): value for key, value in series.items()}
+                for name, series in counters.items()
+            },
+            "histograms": {
+                name: {label_text(key): hist.snapshot() for key, hist in series.items()}
+                for name, series in histograms.items()
+            },
+            "gauges": {
+                name: {label_text(key): value for key, value in series.items()}
+                for name, series in self.collect_gauges().items()
+            },
+        }
+
+    def prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+
+        def escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def series_name(name: str, labels: Labels, extra: Labels = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return PROMETHEUS_PREFIX + name
+            rendered = ",".join(f'{key}="{escape(value)}"' for key, value in pairs)
+            return f"{PROMETHEUS_PREFIX}{name}{{{rendered}}}"
+
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {
+                name: dict(series) for name, series in self.histograms.items()
+            }
+
+        lines = [
+            f"# TYPE {PROMETHEUS_PREFIX}uptime_seconds gauge",
+            f"{PROMETHEUS_PREFIX}uptime_seconds {time.time() - self.started:.1f}",
+        ]
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{series_name(name, labels)} {value:g}")
+        for name, series in sorted(self.collect_gauges().items()):
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} gauge")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{series_name(name, labels)} {value:g}")
+        for name, series in sorted(histograms.items()):
+            metric = f"{name}_seconds"
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}{metric} summary")
+            for labels, hist in sorted(series.items()):
+                if hist.count:
+                    for quantile, value in zip(QUANTILES, hist.percentiles()):
+                        quantile_label = (("quantile", f"{quantile:g}"),)
+                        lines.append(
+                            f"{series_name(metric, labels, quantile_label)} "
+                            f"{value / 1_000_000:.6f}"
+                        )
+                lines.append(
+                    f"{series_name(metric + '_sum', labels)} {hist.total / 1_000_000:.6f}"
+                )
+                lines.append(f"{series_name(metric + '_count', labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry
+registry = MetricsRegistry()
+inc = registry.inc
+observe = registry.observe
+timer = registry.timer
+gauge = registry.gauge
+
+
+def timed(name: str, **labels: Any) -> Callable:
+    """Decorator that times every call of a function into a histogram."""
+
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with registry.timer(name, **labels):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def cache_stats(snapshot: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """
+    Compute cache hit rates from the cache_hits_total/cache_misses_total counters.
+
+    Args:
+        snapshot: A registry snapshot
+
+    Returns:
+        The hits, misses and hit rate of each cache
+    """
+    hits = snapshot["counters"].get("cache_hits_total", {})
+    misses = snapshot["counters"].get("cache_misses_total", {})
+    stats = {}
+    for labels in sorted(set(hits) | set(misses)):
+        cache = labels.partition("cache=")[2] or labels
+        total = hits.get(labels, 0) + misses.get(labels, 0)
+        stats[cache] = {
+            "hits": hits.get(labels, 0),
+            "misses": misses.get(labels, 0),
+            "hit_rate": round(hits.get(labels, 0) / total, 4) if total else None,
+        }
+    return stats
+
+
+def stats() -> Dict[str, Any]:
+    """Get a snapshot of every metric, with cache hit rates."""
+    snapshot = registry.snapshot()
+    snapshot["caches"] = cache_stats(snapshot)
+    return snapshot
+
+
+def write_prometheus_file(path: str) -> None:
+    """Write the metrics to a file, replacing it atomically."""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(registry.prometheus())
+    os.replace(temporary, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("metrics: " + format, *args)
+
+
+def start_exporters(
+    path: str = METRICS_FILE,
+    port: int = METRICS_PORT,
+    interval: float = METRICS_INTERVAL,
+    host: str = METRICS_HOST,
+) -> Optional[ThreadingHTTPServer]:
+    """
+    Start exporting Prometheus text on background threads.
+
+    Args:
+        path: File to rewrite every `interval` seconds (disabled when empty)
+        port: Port to serve /metrics on (disabled when 0)
+        interval: Seconds between file writes
+        host: Interface to serve /metrics on ("0.0.0.0" for every interface)
+
+    Returns:
+        The HTTP server, if one was started
+    """
+    if path:
+
+        def write_periodically() -> None:
+            while True:
+                try:
+                    write_prometheus_file(path)
+                except OSError:
+                    logger.warning("Could not write metrics to %s", path, exc_info=True)
+                time.sleep(interval)
+
+        threading.Thread(
+            target=write_periodically, name="mcp-metrics-file", daemon=True
+        ).start()
+        logger.info("Writing metrics to %s every %gs", path, interval)
+
+    server = None
+    if port:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(
+            target=server.serve_forever, name="mcp-metrics-http", daemon=True
+        ).start()
+        logger.info("Serving metrics on %s:%d", host, server.server_address[1])
+    return server
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+A pool of Search MCP servers behind one client.
+
+MCPClientPool starts several server processes (or connects to several
+server addresses) and sends each call to the worker with the fewest calls
+outstanding, so CPU-bound searches are spread over processes instead of
+queueing behind one server's workers.
+
+Each worker is checked every HEALTH_INTERVAL seconds with a stats request,
+which a server answers even while its tool workers are busy. A worker that
+has died is started again; one that doesn't answer within HANG_TIMEOUT is
+considered hung and restarted. Calls to read-only tools that were waiting
+on a lost worker are retried once on another. worker_stats() reports each
+worker's outstanding calls, errors, restarts and latency percentiles.
+"""
+
+import os
+import asyncio
+import logging
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .client import AsyncMCPClient, POOL_SIZE
+from .metrics import Histogram
+from .session_cache import SESSION_CACHE_TTL, SessionCache
+
+logger = logging.getLogger(__name__)
+
+# Seconds between worker health checks, and seconds a worker may take to
+# answer one before it is restarted
+HEALTH_INTERVAL = float(os.getenv("MCP_POOL_HEALTH_INTERVAL", "5"))
+HANG_TIMEOUT = float(os.getenv("MCP_POOL_HANG_TIMEOUT", "10"))
+
+# Tools that only read, so a call lost with its worker can safely be retried
+RETRYABLE_TOOLS = frozenset(
+    {"search", "search_products_by_category", "search_products_by_brand"}
+)
+
+
+class PoolWorker:
+    """One server in a pool, with its load and latency."""
+
+    def __init__(self, index: int, client: AsyncMCPClient, target: str):
+        self.index = index
+        self.client = client
+        self.target = target
+        self.outstanding = 0
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        # False while the worker is being restarted, so calls go elsewhere
+        self.healthy = True
+
+    @property
+    def restarts(self) -> int:
+        return max(0, self.client.connections - 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summarize the worker's load and latency."""
+        process = self.client.process
+        return {
+            "worker": self.index,
+            "target": self.target,
+            "pid": process.pid if process is not None else None,
+            "healthy": self.healthy and self.client.connected,
+            "outstanding": self.outstanding,
+            "calls": self.calls,
+            "errors": self.errors,
+            "restarts": self.restarts,
+            "latency": self.latency.snapshot(),
+        }
+
+
+class MCPClientPool:
+    """
+    Spreads MCP calls over several servers by least outstanding requests.
+
+    Has the same interface as AsyncMCPClient, so MCPClient can run on
+    either.
+    """
+
+    def __init__(
+        self,
+        server_command: Optional[List[str]] = None,
+        addresses: Optional[List[str]] = None,
+        size: int = POOL_SIZE,
+        health_interval: float = HEALTH_INTERVAL,
+        hang_timeout: float = HANG_TIMEOUT,
+        cache_ttl: float = SESSION_CACHE_TTL,
+        **client_options: Any,
+    ):
+        """
+        Initialize the pool; it connects on first use (or with connect()).
+
+        Args:
+            server_command: Command to start each server process
+            addresses: Addresses of running servers to use instead of
+                starting processes; one worker is made per address
+            size: Server processes to start (defaults to MCP_POOL_SIZE, or
+                the number of CPUs)
+            health_interval: Seconds between worker health checks
+            hang_timeout: Seconds a worker may take to answer a health check
+                before it is restarted
+            cache_ttl: Seconds to reuse the results of repeated read-only
+                calls, whichever worker made them (0 disables the cache)
+            **client_options: Passed to each worker's AsyncMCPClient
+        """
+        # The session cache is shared by the workers, not kept per worker
+        client_options["cache_ttl"] = 0
+        self.cache = SessionCache(cache_ttl) if cache_ttl > 0 else None
+        if addresses:
+            clients = [
+                (AsyncMCPClient(address=address, **client_options), address)
+                for address in addresses
+            ]
+        elif server_command:
+            count = size if size > 0 else os.cpu_count() or 1
+            clients = [
+                (AsyncMCPClient(server_command, address=None, **client_options), "")
+                for _ in range(count)
+            ]
+        else:
+            raise ValueError("Either a server command or addresses are required")
+        self.workers = [
+            PoolWorker(index, client, target)
+            for index, (client, target) in enumerate(clients)
+        ]
+        self.health_interval = health_interval
+        self.hang_timeout = hang_timeout
+        self.health_task: Optional[asyncio.Task] = None
+        # The worker each call in flight was sent to, by request id
+        self.routes: Dict[str, PoolWorker] = {}
+
+    async def __aenter__(self) -> "MCPClientPool":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def connect(self) -> None:
+        """
+        Connect every worker and start the health checks.
+
+        Workers that can't be reached are retried by the health checks.
+
+        Raises:
+            ConnectionError: If no worker could be reached
+        """
+        results = await asyncio.gather(
+            *(worker.client.connect() for worker in self.workers),
+            return_exceptions=True,
+        )
+        failures = [result for result in results if isinstance(result, Exception)]
+        if len(failures) == len(self.workers):
+            raise ConnectionError(f"No pool worker could connect: {failures[0]}")
+        for worker, result in zip(self.workers, results):
+            if isinstance(result, Exception):
+                logger.warning("Pool worker %d is down: %s", worker.index, result)
+        if self.health_task is None or self.health_task.done():
+            self.health_task = asyncio.create_task(self._health_loop())
+
+    @property
+    def tools_info(self) -> Dict[str, Any]:
+        # Any worker that has connected has the manifest (they all serve the same tools)
+        for worker in self.workers:
+            if worker.client.tools_info:
+                return worker.client.tools_info
+        return {}
+
+    @property
+    def available_tools(self) -> Dict[str, Any]:
+        for worker in self.workers:
+            if worker.client.available_tools:
+                return worker.client.available_tools
+        return {}
+
+    @property
+    def max_response_bytes(self) -> Optional[int]:
+        return self.workers[0].client.max_response_bytes
+
+    @max_response_bytes.setter
+    def max_response_bytes(self, value: Optional[int]) -> None:
+        for worker in self.workers:
+            worker.client.max_response_bytes = value
+
+    def _pick(self, exclude: Optional[PoolWorker] = None) -> PoolWorker:
+        """Choose the healthy worker with the fewest outstanding calls."""
+        candidates = [
+            worker
+            for worker in self.workers
+            if worker is not exclude and worker.healthy
+        ] or [worker for worker in self.workers if worker is not exclude]
+        return min(
+            candidates or self.workers,
+            key=lambda worker: (worker.outstanding, worker.calls),
+        )
+
+    async def list_tools(self) -> Dict[str, Any]:
+        """List the available tools (all workers serve the same ones)."""
+        return await self._pick().client.list_tools()
+
+    async def call_tool(
+        self,
+        tool_name: str,
+        args: Optional[Dict[str, Any]] = None,
+        *,
+        timeout: Optional[float] = None,
+        request_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Call a tool on the least loaded worker.
+
+        Args:
+            tool_name: Name of the tool to call
+            args: Arguments to pass to the tool
+            timeout: Seconds to wait for the response (defaults to the
+                workers' timeout)
+            request_id: Id of the call, to cancel it by (a new one by default)
+
+        Returns:
+            The response from the MCP server
+
+        Raises:
+            TimeoutError: If the response doesn't arrive in time
+            ConnectionError: If the worker is lost (and, for read-only
+                tools, so is the one the call was retried on)
+        """
+        request_id = request_id or str(uuid.uuid4())
+        if self.cache is not None:
+            return await self.cache.call(
+                tool_name,
+                args or {},
+                lambda: self._route(tool_name, args, timeout, request_id),
+                self.max_response_bytes,
+                request_id,
+            )
+        return await self._route(tool_name, args, timeout, request_id)
+
+    async def _route(
+        self,
+        tool_name: str,
+        args: Optional[Dict[str, Any]],
+        timeout: Optional[float],
+        request_id: str,
+    ) -> Dict[str, Any]:
+        """Call a tool on the least loaded worker, retrying reads on another."""
+        worker = self._pick()
+        try:
+            return await self._call(worker, tool_name, args, timeout, request_id)
+        except ConnectionError as e:
+            if tool_name not in RETRYABLE_TOOLS or len(self.workers) < 2:
+                raise
+            logger.warning(
+                "Pool worker %d was lost (%s); retrying %s on another",
+                worker.index,
+                e,
+                tool_name,
+            )
+            return await self._call(
+                self._pick(worker), tool_name, args, timeout, request_id
+            )
+
+    async def _call(
+        self,
+        worker: PoolWorker,
+        tool_name: str,
+        args: Optional[Dict[str, Any]],
+        timeout: Optional[float],
+        request_id: str,
+    ) -> Dict[str, Any]:
+        """Call a tool on one worker, recording its load and latency."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        worker.outstanding += 1
+        worker.calls += 1
+        self.routes[request_id] = worker
+        try:
+            response = await worker.client.call_tool(
+                tool_name, args, timeout=timeout, request_id=request_id
+            )
+        except (ConnectionError, TimeoutError):
+            worker.errors += 1
+            raise
+        finally:
+            worker.outstanding -= 1
+            if self.routes.get(request_id) is worker:
+                del self.routes[request_id]
+        worker.latency.record(loop.time() - started)
+        if response.get("type") == "error":
+            worker.errors += 1
+        return response
+
+    async def call_tools_batch(
+        self,
+        calls: List[Dict[str, Any]],
+        stream: bool = False,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Call several tools concurrently, spread over the workers.
+
+        Args:
+            calls: The calls, each with a tool name and its arguments, e.g.
+                {"tool": "search", "args": {"query": "headphones"}}
+            stream: Accepted for compatibility with AsyncMCPClient; the
+                calls are always sent separately
+            timeout: Seconds to wait for each call
+
+        Returns:
+            The response to each call, in call order
+        """
+        return list(
+            await asyncio.gather(*(self._batch_call(call, timeout) for call in calls))
+        )
+
+    async def stream_tools_batch(
+        self, calls: List[Dict[str, Any]], timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Call several tools concurrently and yield responses as they finish.
+
+        Args:
+            calls: The calls, as for call_tools_batch
+            timeout: Seconds to wait for each call
+
+        Yields:
+            The response to each call, in completion order
+        """
+        tasks = [
+            asyncio.ensure_future(self._batch_call(call, timeout)) for call in calls
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _batch_call(
+        self, call: Dict[str, Any], timeout: Optional[float]
+    ) -> Dict[str, Any]:
+        """Make one call of a batch, tagging its response (or failure) with its id."""
+        call_id = call.get("id") or str(uuid.uuid4())
+        try:
+            response = await self.call_tool(
+                call["tool"], call.get("args", {}), timeout=timeout, request_id=call_id
+            )
+        except (ConnectionError, TimeoutError) as e:
+            response = {"type": "error", "error": str(e)}
+        return {**response, "id": call_id}
+
+    async def cancel(self, request_id: str) -> None:
+        """
+        Cancel a call that is still running on whichever worker has it.
+
+        Args:
+            request_id: The request_id the call was made with, or the id of
+                a call in a batch
+        """
+        worker = self.routes.get(request_id)
+        if worker is None:
+            logger.debug("No pool worker has request %s", request_id)
+            return
+        await worker.client.cancel(request_id)
+
+    def worker_stats(self) -> List[Dict[str, Any]]:
+        """Report each worker's load, errors, restarts and latency percentiles."""
+        return [worker.snapshot() for worker in self.workers]
+
+    async def _health_loop(self) -> None:
+        """Periodically check every worker, restarting any that died or hung."""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(
+                *(self._check(worker) for worker in self.workers),
+                return_exceptions=True,
+            )
+
+    async def _check(self, worker: PoolWorker) -> None:
+        if not worker.client.connected:
+            logger.warning("Pool worker %d is down; restarting it", worker.index)
+            await self._restart(worker)
+            return
+        try:
+            await worker.client.stats(timeout=self.hang_timeout)
+        except TimeoutError:
+            logger.warning(
+                "Pool worker %d did not answer within %gs; restarting it",
+                worker.index,
+                self.hang_timeout,
+            )
+            await self._restart(worker, kill=True)
+        except ConnectionError:
+            await self._restart(worker)
+
+    async def _restart(self, worker: PoolWorker, kill: bool = False) -> None:
+        """
+        Replace a worker's connection (and server process); its calls fail.
+
+        Args:
+            worker: The worker to restart
+            kill: Kill the server process rather than asking it to shut
+                down, for a server too stuck to answer
+        """
+        worker.healthy = False
+        process = worker.client.process
+        if kill and process is not None and process.returncode is None:
+            process.kill()
+        try:
+            await worker.client.close()
+            await worker.client.connect()
+        except ConnectionError as e:
+            logger.error("Could not restart pool worker %d: %s", worker.index, e)
+        else:
+            worker.healthy = True
+
+    async def close(self) -> None:
+        """Stop the health checks and close every worker."""
+        if self.health_task is not None:
+            self.health_task.cancel()
+            try:
+                await self.health_task
+            except asyncio.CancelledError:
+                pass
+            self.health_task = None
+        await asyncio.gather(*(worker.client.close() for worker in self.workers))
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Thread-based request/response matching for clients of the line protocol.
+
+A ResponseReader owns a server connection (a server process or a
+ServerConnection, after its ready message has been read). A background
+thread reads every message the server sends and hands it to the future of
+the request with the same id, so a caller is woken as soon as its response
+arrives, and several threads can have requests outstanding at once.
+Messages that no request is waiting for go to an optional callback.
+
+Messages are newline-delimited JSON until negotiate() switches the
+connection to length-prefixed frames (see framing.py), which needs binary
+streams.
+"""
+
+import io
+import logging
+import threading
+import uuid
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+from . import codec
+from .framing import (
+    FRAMINGS,
+    HEADER,
+    MAX_MESSAGE_BYTES,
+    FrameError,
+    decode_payload,
+    encode_frame,
+    parse_header,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseReader:
+    """Sends requests to a server and matches its responses to them by id."""
+
+    def __init__(
+        self,
+        process: Any,
+        on_message: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        """
+        Start reading the server's messages.
+
+        Args:
+            process: The server process or connection, with `stdin` and
+                `stdout` streams (text or binary)
+            on_message: Called (on the reader thread) with each message that
+                no request is waiting for
+        """
+        self.process = process
+        self.on_message = on_message
+        self.binary = not isinstance(process.stdin, io.TextIOBase)
+        # Framing and compression of each direction; both start as lines
+        self.read_framing = self.write_framing = "line"
+        self.compression: Optional[str] = None
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.closed = False
+        self.thread = threading.Thread(
+            target=self._read_loop, name="mcp-reader", daemon=True
+        )
+        self.thread.start()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        """Send a message without waiting for a response."""
+        payload = codec.dumps_bytes(message)
+        with self.write_lock:
+            if self.write_framing == "length":
+                data = encode_frame(payload, self.compression)
+            else:
+                data = payload + b"\n"
+            self.process.stdin.write(data if self.binary else data.decode("utf-8"))
+            self.process.stdin.flush()
+
+    def negotiate(
+        self,
+        framing: str = "length",
+        compression: Optional[str] = None,
+        timeout: Optional[float] = 10,
+    ) -> bool:
+        """
+        Switch the connection's framing with a hello message.
+
+        Call it before sending other requests: the server switches as soon
+        as it answers, and messages already sent as lines would be misread.
+
+        Args:
+            framing: One of FRAMINGS
+            compression: "zlib" to have large frames compressed
+
+        Returns:
+            Whether the server switched; if it refused, the connection stays
+            newline-delimited
+
+        Raises:
+            ValueError: If length framing is asked for on text streams
+        """
+        if framing not in FRAMINGS:
+            raise ValueError(f"Unknown framing: {framing}")
+        if framing == "length" and not self.binary:
+            raise ValueError("Length-prefixed framing needs binary streams")
+        response = self.request(
+            {
+                "id": str(uuid.uuid4()),
+                "type": "hello",
+                "framing": framing,
+                "compression": compression,
+            },
+            timeout,
+        )
+        if response.get("type") != "hello_response":
+            logger.warning("Server refused %s framing: %s", framing, response)
+            return False
+        # The reader thread switched before handing over the response
+        with self.write_lock:
+            self.write_framing = response["framing"]
+        return True
+
+    def submit(self, message: Dict[str, Any]) -> Future:
+        """
+        Send a request.
+
+        Args:
+            message: The request; its id is used to match the response
+
+        Returns:
+            A future resolved with the response, or failed with
+            ConnectionError if the server goes away first
+        """
+        future: Future = Future()
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("The server connection is closed")
+            self.pending[message["id"]] = future
+        try:
+            self.send(message)
+        except Exception:
+            self.discard(message["id"])
+            raise
+        return future
+
+    def request(
+        self, message: Dict[str, Any], timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Send a request and wait for its response.
+
+        Raises:
+            TimeoutError: If no response arrives within `timeout` seconds; a
+                response arriving later is dropped
+            ConnectionError: If the server goes away first
+        """
+        future = self.submit(message)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"No response within {timeout}s") from None
+        finally:
+            self.discard(message["id"])
+
+    def discard(self, request_id: str) -> None:
+        """Stop waiting for a response."""
+        with self.lock:
+            self.pending.pop(request_id, None)
+
+    def _read_loop(self) -> None:
+        try:
+            while True:
+                data = self._read()
+                if data is None:
+                    break
+                try:
+                    message = codec.loads(data)
+                except ValueError:
+                    logger.warning("Could not parse server message: %r", data[:200])
+                    continue
+                self._deliver(message)
+        except FrameError as e:
+            # The rest of the stream can't be read once a frame is lost
+            logger.warning("Unreadable frame from the server: %s", e)
+        except (OSError, ValueError) as e:
+            # The stream was closed under us (e.g. by close())
+            logger.debug("Stopped reading server messages: %s", e)
+        finally:
+            self._fail_pending()
+
+    def _read(self) -> Optional[Any]:
+        """Read the next message's JSON; None at end of stream."""
+        if self.read_framing == "length":
+            header = self._read_exactly(HEADER.size)
+            if header is None:
+                return None
+            length, flags = parse_header(header, MAX_MESSAGE_BYTES)
+            payload = self._read_exactly(length)
+            if payload is None:
+                return None
+            return decode_payload(payload, flags, MAX_MESSAGE_BYTES)
+
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if line:
+                return line
+
+    def _read_exactly(self, size: int) -> Optional[bytes]:
+        """Read `size` bytes; None if the stream ends first."""
+        data = b""
+        while len(data) < size:
+            chunk = self.process.stdout.read(size - len(data))
+            if not chunk:
+                if data:
+                    logger.warning("Server closed the connection mid-frame")
+                return None
+            data += chunk
+        return data
+
+    def _deliver(self, message: Dict[str, Any]) -> None:
+        if message.get("type") == "hello_response":
+            # Every later message from the server uses the new framing
+            self.read_framing = message.get("framing", "line")
+            self.compression = message.get("compression")
+        with self.lock:
+            future = self.pending.pop(message.get("id"), None)
+        if future is not None:
+            future.set_result(message)
+        elif self.on_message is not None:
+            self.on_message(message)
+
+    def _fail_pending(self) -> None:
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("The server closed the connection"))
+
+    def close(self) -> None:
+        """Fail the requests still waiting; the thread ends with the connection."""
+        self._fail_pending()
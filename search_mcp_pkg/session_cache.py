@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Session-scoped cache of tool results for MCP clients.
+
+In a conversation the LLM often repeats a search with the same arguments
+("show me those again"), and each repeat costs a server round trip that
+includes LLM query planning. A SessionCache keeps the responses of
+read-only tool calls for a client's session, keyed by tool name, the
+canonical JSON of the arguments and the client's max_response_bytes.
+
+A cached response is returned with "cached": true and the id of the call
+it answers, not of the call that was cached. Only successful results are
+kept: errors, error results and empty searches aren't, since the server
+reports an Elasticsearch outage during a search as no results.
+
+Entries expire after a TTL, and any call that may change the catalog (a
+tool that isn't known to be read-only, or a search for DELETE_INDEX)
+clears the cache, before and after it runs. Reads that were in flight
+while it ran aren't stored, so they can't bring stale results back.
+
+The cache is opt-in: clients use one when MCP_SESSION_CACHE_TTL (or their
+cache_ttl argument) is above zero.
+"""
+
+import os
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from . import codec
+
+# Seconds a cached tool result is reused (0 disables the cache), and the most
+# results kept
+SESSION_CACHE_TTL = float(os.getenv("MCP_SESSION_CACHE_TTL", "0"))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("MCP_SESSION_CACHE_MAX_ENTRIES", "256"))
+
+# Tools whose results are cached, and tools that read without being cached;
+# every other tool is treated as a write and clears the cache
+CACHEABLE_TOOLS = frozenset(
+    {"search", "search_products_by_category", "search_products_by_brand"}
+)
+UNCACHED_READ_TOOLS = frozenset({"server_stats"})
+
+# Query the search tool treats as a request to delete the index
+DELETE_INDEX_QUERY = "DELETE_INDEX"
+
+
+def cache_key(
+    tool_name: str, args: Dict[str, Any], max_response_bytes: Optional[int] = None
+) -> str:
+    """Build the cache key of a call: the tool and its canonicalized arguments."""
+    canonical = json.dumps(
+        args, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return f"{tool_name}:{max_response_bytes or ''}:{canonical}"
+
+
+def is_write(tool_name: str, args: Dict[str, Any]) -> bool:
+    """Whether a call may change the catalog, invalidating cached results."""
+    if tool_name == "search":
+        return args.get("query") == DELETE_INDEX_QUERY
+    return tool_name not in CACHEABLE_TOOLS and tool_name not in UNCACHED_READ_TOOLS
+
+
+def succeeded(response: Dict[str, Any]) -> bool:
+    """Whether a response holds results worth caching (not a failed or empty search)."""
+    if response.get("type") != "tool_call_response":
+        return False
+    result = response.get("result")
+    if not isinstance(result, str):
+        return True
+    # The search tools report Elasticsearch failures as their result, or (for
+    # a failed planned search) as no results at all
+    if result.startswith(("Error", "No products found")):
+        return False
+    if result.startswith("{"):
+        try:
+            data = codec.loads(result)
+        except ValueError:
+            return False
+        return isinstance(data, dict) and "error" not in data and bool(data.get("hits"))
+    return True
+
+
+class SessionCache:
+    """A TTL and LRU bounded cache of tool call responses."""
+
+    def __init__(
+        self,
+        ttl: float = SESSION_CACHE_TTL,
+        max_entries: int = SESSION_CACHE_MAX_ENTRIES,
+    ):
+        """
+        Create an empty cache.
+
+        Args:
+            ttl: Seconds a result is reused
+            max_entries: Most results kept; the least recently used go first
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Bumped by every write, so reads that started before it aren't stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached response, if it hasn't expired."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        """Cache a response."""
+        self.entries[key] = (time.monotonic() + self.ttl, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """Drop every cached response."""
+        self.entries.clear()
+        self.generation += 1
+        self.invalidations += 1
+
+    async def call(
+        self,
+        tool_name: str,
+        args: Dict[str, Any],
+        call: Callable[[], Awaitable[Dict[str, Any]]],
+        max_response_bytes: Optional[int] = None,
+        request_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Make a tool call through the cache.
+
+        Args:
+            tool_name: Name of the tool to call
+            args: Arguments to pass to the tool
+            call: Makes the call on the server
+            max_response_bytes: The limit the call is made with, which is part
+                of the key
+            request_id: The id of this call, given to a cached response in
+                place of the id of the call that was cached
+
+        Returns:
+            The response, with "cached": true if it came from the cache
+        """
+        if is_write(tool_name, args):
+            self.invalidate()
+            try:
+                return await call()
+            finally:
+                # Reads made while the write ran may have seen the old data
+                self.invalidate()
+        if tool_name not in CACHEABLE_TOOLS:
+            return await call()
+
+        key = cache_key(tool_name, args, max_response_bytes)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            response = {**cached, "cached": True}
+            if request_id is None:
+                response.pop("id", None)
+            else:
+                response["id"] = request_id
+            return response
+        self.misses += 1
+
+        generation = self.generation
+        response = await call()
+        if succeeded(response) and generation == self.generation:
+            self.put(key, response)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the cache's hit and miss counts."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "invalidations": self.invalidations,
+        }
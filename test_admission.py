@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for admission control: lane limits, rejection and retry_after hints.
+"""
+
+import asyncio
+
+import pytest
+
+from search_mcp_pkg.admission import (
+    MAX_RETRY_AFTER,
+    MIN_RETRY_AFTER,
+    AdmissionController,
+    Lane,
+    Overloaded,
+    parse_tool_limits,
+)
+
+
+def controller(**options):
+    defaults = dict(
+        llm_concurrency=1,
+        llm_max_queue=1,
+        tool_concurrency=1,
+        tool_max_queue=0,
+        max_queue_wait=0.2,
+        tool_limits={},
+    )
+    return AdmissionController(**{**defaults, **options})
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario():
+        admission = controller()
+        async with admission.admit("search_products_by_brand"):
+            with pytest.raises(Overloaded) as rejected:
+                async with admission.admit("search_products_by_brand"):
+                    pass
+        return admission, rejected.value
+
+    admission, error = asyncio.run(scenario())
+    assert error.lane == "tools"
+    assert MIN_RETRY_AFTER <= error.retry_after <= MAX_RETRY_AFTER
+    assert admission.tools.rejected == 1
+    assert admission.tools.active == 0
+
+
+def test_queued_call_times_out_and_releases_nothing():
+    async def scenario():
+        admission = controller(max_queue_wait=0.05)
+        async with admission.admit("search"):
+            with pytest.raises(Overloaded, match="no slot"):
+                async with admission.admit("search"):
+                    pass
+        return admission
+
+    admission = asyncio.run(scenario())
+    assert admission.llm.snapshot()["active"] == 0
+    assert admission.llm.snapshot()["waiting"] == 0
+
+
+def test_queued_call_runs_once_a_slot_frees():
+    async def scenario():
+        admission = controller()
+        order = []
+
+        async def call(name, hold):
+            async with admission.admit("search") as queue_time:
+                order.append(name)
+                await asyncio.sleep(hold)
+                return queue_time
+
+        first = asyncio.ensure_future(call("first", 0.05))
+        await asyncio.sleep(0)
+        waited = await call("second", 0)
+        await first
+        return order, waited
+
+    order, waited = asyncio.run(scenario())
+    assert order == ["first", "second"]
+    assert waited > 0
+
+
+def test_lanes_are_separate():
+    async def scenario():
+        admission = controller()
+        async with admission.admit("search"):
+            async with admission.admit("server_stats"):
+                return admission.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["llm"]["active"] == 1
+    assert snapshot["tools"]["active"] == 1
+
+
+def test_tool_limit_adds_a_lane():
+    admission = controller(tool_limits={"search_products_by_brand": 2})
+    lanes = admission.lanes_for("search_products_by_brand")
+    assert [lane.name for lane in lanes] == ["search_products_by_brand", "tools"]
+
+
+def test_retry_after_grows_with_the_backlog_and_is_capped():
+    lane = Lane("tools", concurrency=2, max_queue=10)
+    lane.service_time = 1.0
+    quiet = lane.retry_after()
+    lane.waiting = 9
+    assert lane.retry_after() > quiet
+    lane.service_time = 1000.0
+    assert lane.retry_after() == MAX_RETRY_AFTER
+
+
+def test_parse_tool_limits():
+    assert parse_tool_limits(" search=2, server_stats=1 ,") == {
+        "search": 2,
+        "server_stats": 1,
+    }
+    with pytest.raises(ValueError):
+        parse_tool_limits("search")
+    with pytest.raises(ValueError):
+        parse_tool_limits("search=two")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for AsyncMCPClient: pipelining, timeouts and reconnects.
+
+The client talks to a fake server on a Unix socket, which answers each tool
+call after the delay given in its args, out of order if need be.
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from search_mcp_pkg.client import AsyncMCPClient
+
+
+class FakeServer:
+    """Speaks the line protocol; the "drop" tool closes the connection."""
+
+    def __init__(self, path):
+        self.path = path
+        self.received = []
+        self.connections = 0
+
+    async def start(self):
+        self.server = await asyncio.start_unix_server(self.serve, path=self.path)
+
+    async def serve(self, reader, writer):
+        self.connections += 1
+
+        async def send(message):
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+
+        async def answer(message):
+            if message["type"] == "list_tools":
+                await send(
+                    {
+                        "id": message["id"],
+                        "type": "list_tools_response",
+                        "version": "v1",
+                        "tools": [{"name": "search"}],
+                    }
+                )
+            elif message["tool"] == "drop":
+                writer.close()
+            else:
+                await asyncio.sleep(message["args"].get("delay", 0))
+                await send(
+                    {
+                        "id": message["id"],
+                        "type": "tool_call_response",
+                        "result": message["args"]["query"],
+                    }
+                )
+
+        await send({"type": "ready", "framing": ["line"]})
+        while line := await reader.readline():
+            message = json.loads(line)
+            self.received.append(message)
+            if message["type"] != "cancel":
+                asyncio.ensure_future(answer(message))
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def run(tmp_path, scenario):
+    async def main():
+        server = FakeServer(str(tmp_path / "mcp.sock"))
+        await server.start()
+        client = AsyncMCPClient(
+            address=f"unix:{server.path}", cache_ttl=0, reconnect_attempts=0
+        )
+        try:
+            return await scenario(client, server)
+        finally:
+            await client.close()
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_calls_are_pipelined_and_matched_by_id(tmp_path):
+    async def scenario(client, server):
+        finished = []
+
+        async def call(query, delay):
+            response = await client.call_tool(
+                "search", {"query": query, "delay": delay}
+            )
+            finished.append(query)
+            return response["result"]
+
+        started = time.perf_counter()
+        results = await asyncio.gather(call("slow", 0.2), call("fast", 0.05))
+        return results, finished, time.perf_counter() - started
+
+    results, finished, elapsed = run(tmp_path, scenario)
+    assert results == ["slow", "fast"]
+    assert finished == ["fast", "slow"]
+    assert elapsed < 0.2 + 0.05
+
+
+def test_timeout_cancels_the_call_on_the_server(tmp_path):
+    async def scenario(client, server):
+        with pytest.raises(TimeoutError):
+            await client.call_tool("search", {"query": "x", "delay": 1}, timeout=0.05)
+        await asyncio.sleep(0.05)
+        return server.received
+
+    received = run(tmp_path, scenario)
+    call = next(message for message in received if message["type"] == "tool_call")
+    assert {"type": "cancel", "request_id": call["id"]} in received
+
+
+def test_lost_connection_fails_pending_calls_and_reconnects(tmp_path):
+    async def scenario(client, server):
+        pending = asyncio.ensure_future(
+            client.call_tool("search", {"query": "slow", "delay": 1})
+        )
+        await asyncio.sleep(0.05)
+        with pytest.raises(ConnectionError):
+            await asyncio.gather(client.call_tool("drop"), pending)
+        response = await client.call_tool("search", {"query": "again"})
+        return response, client.connections, server.connections
+
+    response, client_connections, server_connections = run(tmp_path, scenario)
+    assert response["result"] == "again"
+    assert client_connections == server_connections == 2
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests that every installed JSON codec backend behaves the same.
+"""
+
+import json
+
+import pytest
+
+from search_mcp_pkg import codec
+
+MESSAGES = [
+    {"id": "1", "type": "tool_call", "tool": "search", "args": {"query": "shoes"}},
+    {"unicode": "café – 東京", "nested": [1, 2.5, None, True, {"a": []}]},
+    {"big": 2**70},
+]
+
+
+@pytest.mark.parametrize("backend", sorted(codec.BACKENDS))
+@pytest.mark.parametrize("message", MESSAGES)
+def test_backends_round_trip_like_the_standard_library(backend, message):
+    dumps_bytes, loads = codec.BACKENDS[backend]
+    encoded = dumps_bytes(message)
+    assert isinstance(encoded, bytes)
+    assert b"\n" not in encoded
+    assert loads(encoded) == message
+    assert loads(encoded.decode("utf-8")) == json.loads(encoded)
+
+
+class Money:
+    def __str__(self):
+        return "$9.99"
+
+
+@pytest.mark.parametrize("backend", sorted(codec.BACKENDS))
+def test_backends_fall_back_to_str_for_unknown_types(backend):
+    dumps_bytes, loads = codec.BACKENDS[backend]
+    assert loads(dumps_bytes({"price": Money()})) == {"price": "$9.99"}
+
+
+@pytest.mark.parametrize("backend", sorted(codec.BACKENDS))
+def test_backends_raise_json_decode_error(backend):
+    _, loads = codec.BACKENDS[backend]
+    with pytest.raises(json.JSONDecodeError):
+        loads(b"{not json")
+
+
+def test_dumps_returns_compact_text():
+    assert codec.dumps({"a": [1, 2]}) == '{"a":[1,2]}'
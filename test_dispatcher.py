@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Tests for RequestDispatcher: concurrency, batches, cancelling and draining.
+
+The dispatcher runs plain functions as its tools and writes its responses to
+an in-memory transport.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import run_server
+from search_mcp_pkg.admission import AdmissionController
+from search_mcp_pkg.cancellation import check_cancelled
+
+
+class FakeTransport:
+    """Collects the messages the dispatcher writes."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def write_message(self, message):
+        self.sent.append(message)
+        return True
+
+    async def write_raw(self, data):
+        self.sent.append(json.loads(data))
+        return True
+
+    def close(self):
+        pass
+
+    def by_id(self):
+        return {message.get("id"): message for message in self.sent}
+
+
+def sleep(delay, value):
+    time.sleep(delay)
+    return value
+
+
+def fail(error):
+    raise ValueError(error)
+
+
+def block(started, release, limit=5):
+    """Hold a worker until released or cancelled (or, if a test fails, for a while)."""
+    started.set()
+    deadline = time.monotonic() + limit
+    while not release.wait(0.01) and time.monotonic() < deadline:
+        check_cancelled()
+    return "released"
+
+
+TOOLS = {"sleep": sleep, "fail": fail, "block": block}
+
+
+def make_dispatcher(tools=TOOLS, **limits):
+    """A dispatcher whose tools have already loaded."""
+    options = dict(
+        llm_concurrency=1,
+        llm_max_queue=1,
+        tool_concurrency=4,
+        tool_max_queue=4,
+        max_queue_wait=5,
+        tool_limits={},
+    )
+    dispatcher = run_server.RequestDispatcher(
+        AdmissionController(**{**options, **limits})
+    )
+    dispatcher.tool_functions = dict(tools)
+    dispatcher.startup = asyncio.get_running_loop().create_future()
+    dispatcher.startup.set_result(None)
+    return dispatcher
+
+
+def run(scenario, **limits):
+    """Run a scenario with a fresh dispatcher and transport."""
+
+    async def main():
+        dispatcher = make_dispatcher(**limits)
+        try:
+            return await scenario(dispatcher, FakeTransport())
+        finally:
+            dispatcher.close()
+
+    return asyncio.run(main())
+
+
+def tool_call(request_id, tool, **args):
+    return {"id": request_id, "type": "tool_call", "tool": tool, "args": args}
+
+
+def test_responses_are_written_as_calls_finish():
+    async def scenario(dispatcher, transport):
+        started = time.perf_counter()
+        await asyncio.gather(
+            dispatcher.dispatch(
+                tool_call("slow", "sleep", delay=0.2, value=1), transport
+            ),
+            dispatcher.dispatch(
+                tool_call("fast", "sleep", delay=0.02, value=2), transport
+            ),
+        )
+        return transport.sent, time.perf_counter() - started
+
+    sent, elapsed = run(scenario)
+    assert [message["id"] for message in sent] == ["fast", "slow"]
+    assert [message["result"] for message in sent] == [2, 1]
+    assert all(message["type"] == "tool_call_response" for message in sent)
+    # The calls ran side by side on the worker pool
+    assert elapsed < 0.2 + 0.02
+
+
+def test_failing_and_unknown_tools_are_answered_with_errors():
+    async def scenario(dispatcher, transport):
+        await asyncio.gather(
+            dispatcher.dispatch(tool_call("a", "fail", error="boom"), transport),
+            dispatcher.dispatch(tool_call("b", "missing"), transport),
+        )
+        return transport.by_id()
+
+    sent = run(scenario)
+    assert sent["a"] == {"id": "a", "type": "error", "error": "boom"}
+    assert sent["b"]["error"] == "Tool not found: missing"
+
+
+def batch(request_id, calls, mode="batched"):
+    return {"id": request_id, "type": "batch", "mode": mode, "calls": calls}
+
+
+def test_batch_keeps_call_order_around_a_failing_call():
+    calls = [
+        {"id": "slow", "tool": "sleep", "args": {"delay": 0.1, "value": 1}},
+        {"id": "bad", "tool": "fail", "args": {"error": "boom"}},
+        {"tool": "sleep", "args": {"delay": 0, "value": 3}},
+    ]
+
+    async def scenario(dispatcher, transport):
+        await dispatcher.dispatch(batch("b1", calls), transport)
+        return transport.sent
+
+    sent = run(scenario)
+    assert len(sent) == 1
+    assert sent[0]["id"] == "b1"
+    assert sent[0]["type"] == "batch_response"
+    assert sent[0]["results"] == [
+        {"id": "slow", "type": "tool_call_response", "result": 1},
+        {"id": "bad", "type": "error", "error": "boom"},
+        {"id": "b1:2", "type": "tool_call_response", "result": 3},
+    ]
+
+
+def test_streamed_batch_writes_each_response_then_completes():
+    calls = [
+        {"id": "slow", "tool": "sleep", "args": {"delay": 0.1, "value": 1}},
+        {"id": "bad", "tool": "fail", "args": {"error": "boom"}},
+    ]
+
+    async def scenario(dispatcher, transport):
+        await dispatcher.dispatch(batch("b1", calls, "stream"), transport)
+        return transport.sent
+
+    sent = run(scenario)
+    assert [(message["id"], message["type"]) for message in sent] == [
+        ("bad", "error"),
+        ("slow", "tool_call_response"),
+        ("b1", "batch_complete"),
+    ]
+    assert sent[-1]["count"] == 2
+
+
+def test_invalid_batch_is_rejected_whole():
+    async def scenario(dispatcher, transport):
+        await dispatcher.dispatch(batch("b1", [], "sideways"), transport)
+        await dispatcher.dispatch(batch("b2", "not a list"), transport)
+        return transport.by_id()
+
+    sent = run(scenario)
+    assert sent["b1"]["error"] == "Unknown batch mode: sideways"
+    assert sent["b2"]["error"] == "A batch needs a list of calls"
+
+
+async def started_blocking(dispatcher, transport, request_id):
+    """Dispatch a call that holds its worker, once it is running."""
+    started, release = threading.Event(), threading.Event()
+    task = dispatcher.dispatch(
+        tool_call(request_id, "block", started=started, release=release), transport
+    )
+    while not started.is_set():
+        await asyncio.sleep(0.01)
+    return task, release
+
+
+def cancel(request_id):
+    return {"type": "cancel", "request_id": request_id}
+
+
+def test_cancelling_a_running_call_drops_its_response(monkeypatch):
+    searches = []
+    monkeypatch.setattr(run_server, "cancel_searches", searches.extend)
+
+    async def scenario(dispatcher, transport):
+        task, _ = await started_blocking(dispatcher, transport, "run")
+        await dispatcher.dispatch(cancel("run"), transport)
+        await task
+        return transport.sent, dispatcher
+
+    sent, dispatcher = run(scenario)
+    assert sent == []
+    assert len(searches) == 1
+    assert dispatcher.requests == {}
+    assert dispatcher.admission.tools.active == 0
+
+
+def test_cancelling_a_queued_call_frees_its_place(monkeypatch):
+    monkeypatch.setattr(run_server, "cancel_searches", lambda opaque_ids: None)
+
+    async def scenario(dispatcher, transport):
+        blocker, release = await started_blocking(dispatcher, transport, "busy")
+        queued = dispatcher.dispatch(
+            tool_call("queued", "sleep", delay=0, value=1), transport
+        )
+        await asyncio.sleep(0.01)
+        assert dispatcher.admission.tools.waiting == 1
+
+        # Answered right away, and its place in the queue is free again
+        await dispatcher.dispatch(cancel("queued"), transport)
+        await queued
+        assert transport.by_id()["queued"]["code"] == "cancelled"
+        assert dispatcher.admission.tools.waiting == 0
+
+        later = dispatcher.dispatch(
+            tool_call("later", "sleep", delay=0, value=2), transport
+        )
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(blocker, later)
+        return transport.by_id(), dispatcher.admission.tools.snapshot()
+
+    sent, lane = run(scenario, tool_concurrency=1, tool_max_queue=1)
+    assert sent["busy"]["result"] == "released"
+    assert sent["later"]["result"] == 2
+    assert lane["active"] == lane["waiting"] == lane["rejected"] == 0
+
+
+def test_drain_finishes_in_flight_work_then_refuses_new_work():
+    async def scenario(dispatcher, transport):
+        running = dispatcher.dispatch(
+            tool_call("running", "sleep", delay=0.1, value=1), transport
+        )
+        await asyncio.sleep(0.01)
+        draining = asyncio.ensure_future(dispatcher.drain(timeout=5))
+        await asyncio.sleep(0)
+        await dispatcher.dispatch(
+            tool_call("late", "sleep", delay=0, value=2), transport
+        )
+        assert not running.done()
+        await draining
+        return transport.by_id(), dispatcher
+
+    sent, dispatcher = run(scenario)
+    assert sent["running"]["result"] == 1
+    assert sent["late"]["code"] == "shutting_down"
+    assert not dispatcher.aborted
+
+
+def test_drain_cancels_calls_that_overrun(monkeypatch):
+    monkeypatch.setattr(run_server, "cancel_searches", lambda opaque_ids: None)
+
+    async def scenario(dispatcher, transport):
+        await started_blocking(dispatcher, transport, "stuck")
+        await dispatcher.drain(timeout=0.05)
+        return transport.by_id(), dispatcher
+
+    sent, dispatcher = run(scenario)
+    assert sent["stuck"]["code"] == "shutting_down"
+    assert dispatcher.aborted and not dispatcher.abandoned
+
+
+def test_drain_abandons_calls_that_ignore_cancellation(monkeypatch):
+    monkeypatch.setattr(run_server, "cancel_searches", lambda opaque_ids: None)
+    monkeypatch.setattr(run_server, "SHUTDOWN_GRACE", 0.05)
+
+    async def scenario(dispatcher, transport):
+        dispatcher.dispatch(tool_call("stuck", "sleep", delay=0.5, value=1), transport)
+        await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        await dispatcher.drain(timeout=0.05)
+        return dispatcher, time.perf_counter() - started
+
+    dispatcher, elapsed = run(scenario)
+    assert dispatcher.abandoned
+    # The drain gave up after its timeout and grace, not when the tool finished
+    assert elapsed < 0.5
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared search result formatter.
+"""
+
+import json
+
+from search_mcp_pkg.formatting import format_results
+
+PLAN = {"ranking_algorithm": "bm25", "explanation": "Cheap shoes."}
+
+SHOE = {
+    "product_name": "Trail Shoe",
+    "brand": "Acme",
+    "price": 49.99,
+    "rating": 4.5,
+    "in_stock": True,
+    "category": "Shoes",
+    "description": "Light | grippy",
+}
+
+
+def test_text_matches_the_original_search_output():
+    text = format_results(
+        [SHOE, {"product_name": "Bare"}],
+        "text",
+        title="Search results for: shoes",
+        plan=PLAN,
+    )
+    assert text == (
+        "Search results for: shoes\n\n"
+        'Query plan:\n{"ranking_algorithm":"bm25","explanation":"Cheap shoes."}\n\n'
+        "Results:\n"
+        "Product 1:\nName: Trail Shoe\nBrand: Acme\nPrice: $49.99\nRating: 4.5/5\n"
+        "In Stock: Yes\nCategory: Shoes\nDescription: Light | grippy...\n\n"
+        "Product 2:\nName: Bare\nBrand: N/A\nPrice: $N/A\nRating: N/A/5\n"
+        "In Stock: No\nCategory: N/A\nDescription: No description...\n"
+    )
+
+
+def test_empty_text_keeps_the_plan_on_one_line():
+    text = format_results(
+        [], "text", plan=PLAN, empty="No products found for query: shoes"
+    )
+    assert text == (
+        "No products found for query: shoes\n\n"
+        'Query plan: {"ranking_algorithm":"bm25","explanation":"Cheap shoes."}'
+    )
+
+
+def test_compact_and_markdown_profiles():
+    fields = ["product_name", "in_stock", "description"]
+    compact = format_results([SHOE], "compact", fields, plan=PLAN, plan_detail="none")
+    assert compact == "1. Trail Shoe | in stock | Light | grippy...\n"
+
+    markdown = format_results(
+        [SHOE], "markdown", fields, plan=PLAN, plan_detail="explanation"
+    )
+    assert markdown == (
+        "Query plan: Cheap shoes.\n\n"
+        "| # | Name | In Stock | Description |\n|---|---|---|---|\n"
+        "| 1 | Trail Shoe | Yes | Light \\| grippy... |\n"
+    )
+
+
+def test_json_selects_fields_and_plan_detail():
+    response = json.loads(
+        format_results(
+            [SHOE],
+            "json",
+            ["price"],
+            context={"query": "shoes"},
+            plan=PLAN,
+            plan_detail="explanation",
+        )
+    )
+    assert response == {
+        "query": "shoes",
+        "explanation": "Cheap shoes.",
+        "total": 1,
+        "hits": [{"price": 49.99}],
+    }
+
+
+def test_token_budget_drops_whole_hits():
+    text = format_results([SHOE] * 20, "compact", max_tokens=50)
+    lines = text.splitlines()
+    assert len(text) <= 50 * 4
+    assert lines[-1].startswith("[") and "max_tokens" in lines[-1]
+    assert lines[-1].split()[0] == f"[{20 - (len(lines) - 1)}"
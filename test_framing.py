@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for length-prefixed frames, zlib compression and response limits.
+"""
+
+import json
+import zlib
+
+import pytest
+
+from search_mcp_pkg.framing import (
+    COMPRESS_THRESHOLD,
+    FLAG_ZLIB,
+    HEADER,
+    TRUNCATED_NOTE,
+    FrameError,
+    decode_payload,
+    encode_frame,
+    fit_response,
+    parse_header,
+    response_limit,
+    response_limit_scope,
+)
+
+
+def round_trip(payload, compression=None, max_bytes=1 << 24):
+    frame = encode_frame(payload, compression)
+    length, flags = parse_header(frame[: HEADER.size], max_bytes)
+    body = frame[HEADER.size :]
+    assert len(body) == length
+    return decode_payload(body, flags, max_bytes), flags
+
+
+def test_small_payload_round_trips_uncompressed():
+    payload = json.dumps({"id": "1", "type": "list_tools"}).encode()
+    decoded, flags = round_trip(payload, "zlib")
+    assert decoded == payload
+    assert not flags & FLAG_ZLIB
+
+
+def test_large_payload_round_trips_compressed():
+    payload = json.dumps({"result": "x" * COMPRESS_THRESHOLD}).encode()
+    frame = encode_frame(payload, "zlib")
+    assert len(frame) < len(payload)
+    decoded, flags = round_trip(payload, "zlib")
+    assert decoded == payload
+    assert flags & FLAG_ZLIB
+
+
+def test_oversized_frame_is_rejected():
+    frame = encode_frame(b"x" * 100)
+    with pytest.raises(FrameError):
+        parse_header(frame[: HEADER.size], 99)
+
+
+def test_decompression_bomb_is_rejected():
+    payload = zlib.compress(b"x" * 10_000)
+    with pytest.raises(FrameError):
+        decode_payload(payload, FLAG_ZLIB, 1000)
+
+
+def test_corrupt_compressed_frame_is_rejected():
+    with pytest.raises(FrameError):
+        decode_payload(b"not zlib", FLAG_ZLIB, 1000)
+
+
+def test_fit_response_cuts_on_a_character_boundary():
+    text = "é" * 100
+    fitted, truncated = fit_response(text, 100)
+    assert truncated
+    assert fitted.endswith(TRUNCATED_NOTE)
+    assert len(fitted.encode("utf-8")) <= 100
+    assert fit_response(text, None) == (text, False)
+    assert fit_response("short", 100) == ("short", False)
+
+
+def test_response_limit_scope():
+    assert response_limit() is None
+    with response_limit_scope(123):
+        assert response_limit() == 123
+    assert response_limit() is None
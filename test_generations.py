@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for naming and resolving the physical index generations of an alias.
+"""
+
+import pytest
+
+from search_mcp_pkg import core
+
+
+class FakeIndices:
+    """The index and alias calls of Elasticsearch, backed by dicts."""
+
+    def __init__(self):
+        self.indexes = set()
+        self.aliases = {}
+        self.mappings = {}
+
+    def exists(self, index):
+        return index in self.indexes or index in self.aliases
+
+    def create(self, index, body):
+        if index in self.indexes:
+            raise RuntimeError("resource_already_exists_exception")
+        self.indexes.add(index)
+
+    def get(self, index, expand_wildcards="open"):
+        if index in self.aliases:
+            return {
+                name: {"mappings": self.mappings.get(name, {})}
+                for name in self.aliases[index]
+            }
+        prefix = index.rstrip("*")
+        return {name: {} for name in self.indexes if name.startswith(prefix)}
+
+    def exists_alias(self, name):
+        return name in self.aliases
+
+    def get_alias(self, name):
+        return {index: {} for index in self.aliases[name]}
+
+
+class FakeES:
+    def __init__(self):
+        self.indices = FakeIndices()
+
+
+@pytest.fixture
+def es(monkeypatch):
+    fake = FakeES()
+    monkeypatch.setattr(core, "get_es", lambda: fake)
+    core._alias_cache.clear()
+    yield fake
+    core._alias_cache.clear()
+
+
+def test_builds_in_the_same_millisecond_get_distinct_increasing_names(es, monkeypatch):
+    monkeypatch.setattr(core.time, "time_ns", lambda: 1_700_000_000_000_000_000)
+    names = [core._create_generation("products", {}) for _ in range(3)]
+    assert len(set(names)) == 3
+    assert [core._generation(name) for name in names] == sorted(
+        core._generation(name) for name in names
+    )
+    assert names == sorted(names)
+
+
+def test_generations_are_zero_padded(es):
+    name = core._create_generation("products", {})
+    suffix = name.rsplit(core.GENERATION_SEPARATOR, 1)[1]
+    assert len(suffix) == core.GENERATION_DIGITS
+
+
+def test_taken_name_is_skipped(es, monkeypatch):
+    monkeypatch.setattr(core.time, "time_ns", lambda: 5_000_000)
+    # The name of generation 5 is already used, here by an alias
+    taken = f"products__v{5:0{core.GENERATION_DIGITS}d}"
+    es.indices.aliases[taken] = ["other"]
+    name = core._create_generation("products", {})
+    assert core._generation(name) == 6
+
+
+def test_resolve_index_picks_the_highest_numeric_generation(es):
+    # Unpadded names from before the counter was padded sort wrongly as text
+    es.indices.aliases["products"] = ["products__v999", "products__v1000"]
+    assert core.resolve_index("products") == "products__v1000"
+
+
+def test_generations_sort_numerically(es):
+    es.indices.indexes.update({"products__v999", "products__v1000", "products__vx"})
+    assert core._generations("products") == ["products__v999", "products__v1000"]
+
+
+def test_schema_is_read_from_the_index_the_alias_points_to_now(es):
+    es.indices.aliases["products"] = ["products__v1"]
+    assert core.resolve_index("products") == "products__v1"
+    # Swapped after the alias was resolved (and cached)
+    es.indices.aliases["products"] = ["products__v2"]
+    es.indices.mappings["products__v2"] = {"properties": {"sku": {"type": "keyword"}}}
+    assert core.get_index_schema("products") == es.indices.mappings["products__v2"]
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for token-budgeted conversation history.
+"""
+
+import json
+
+from search_mcp_pkg.history import (
+    ConversationHistory,
+    estimate_tokens,
+    summarize_tool_result,
+)
+
+
+def text_result(count):
+    return "Search results for: shoes\n\nResults:\n" + "\n\n".join(
+        f"Product {i + 1}:\nName: Shoe {i}\nBrand: Acme\nPrice: ${10 + i}\n"
+        f"Description: {'A very comfortable shoe. ' * 10}..."
+        for i in range(count)
+    )
+
+
+def add_turn(history, query, result):
+    history.add_user(query)
+    history.add({"role": "assistant", "content": None, "tool_calls": [{"id": "c"}]})
+    history.add_tool_result(
+        {"role": "tool", "tool_call_id": "c", "content": result}, "search"
+    )
+    history.add({"role": "assistant", "content": f"Here are {query}."})
+
+
+def test_summarizes_text_results():
+    summary = json.loads(summarize_tool_result(text_result(8), "search"))
+    assert summary["summary_of"] == "search"
+    assert summary["first_line"] == "Search results for: shoes"
+    assert summary["products"] == 8
+    assert summary["top"][0] == "Shoe 0 | Acme | $10"
+    assert len(summary["top"]) == 5
+
+
+def test_summarizes_json_results():
+    result = json.dumps(
+        {
+            "query": "shoes",
+            "total": 2,
+            "hits": [
+                {"product_name": "Shoe 0", "brand": "Acme", "price": 10},
+                {"product_name": "Shoe 1"},
+            ],
+        }
+    )
+    summary = json.loads(summarize_tool_result(result, "search"))
+    assert summary["first_line"] == "query: shoes"
+    assert summary["top"] == ["Shoe 0 | Acme | $10", "Shoe 1"]
+
+
+def test_history_within_budget_is_untouched():
+    history = ConversationHistory("You help shoppers.", budget=100_000)
+    add_turn(history, "shoes", text_result(10))
+    messages = history.prepare()
+    assert messages[0] == {"role": "system", "content": "You help shoppers."}
+    assert messages[3]["content"] == text_result(10)
+    assert history.last_stats["compacted_results"] == 0
+
+
+def test_old_tool_results_are_summarized_before_turns_are_dropped():
+    history = ConversationHistory("", budget=2000, keep_turns=1)
+    for query in ("shoes", "boots", "sandals"):
+        add_turn(history, query, text_result(10))
+    history.prepare()
+
+    stats = history.last_stats
+    assert stats["compacted_results"] == 2
+    assert stats["dropped_turns"] == 0
+    assert stats["prompt_tokens"] <= 2000
+    old, recent = history.turns[0][2], history.turns[-1][2]
+    assert json.loads(old["content"])["products"] == 10
+    assert recent["content"] == text_result(10)
+
+
+def test_oldest_turns_are_dropped_whole_when_summaries_are_not_enough():
+    history = ConversationHistory("", budget=3000, keep_turns=2)
+    for i in range(20):
+        add_turn(history, f"query {i} " + "please " * 50, text_result(3))
+    history.prepare()
+
+    assert history.last_stats["dropped_turns"] > 0
+    assert history.last_stats["prompt_tokens"] <= 3000
+    # Every remaining turn starts with its user message
+    assert all(turn[0]["role"] == "user" for turn in history.turns)
+    assert history.turns[-1][0]["content"].startswith("query 19")
+
+
+def test_recent_turns_are_kept_even_over_budget():
+    history = ConversationHistory("", budget=10, keep_turns=1)
+    add_turn(history, "shoes", text_result(10))
+    history.prepare()
+    assert history.turns[0][2]["content"] == text_result(10)
+    assert history.last_stats["prompt_tokens"] > 10
+
+
+def test_anthropic_tool_result_blocks_are_summarized():
+    history = ConversationHistory("system", budget=1000, system_message=False)
+    for query in ("shoes", "boots", "sandals"):
+        history.add_user(query)
+        history.add({"role": "assistant", "content": [{"type": "tool_use"}]})
+        history.add_tool_result(
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": "t",
+                        "content": text_result(5),
+                    }
+                ],
+            },
+            "search",
+        )
+    messages = history.prepare()
+    assert history.last_stats["dropped_turns"] == 0
+    assert messages[0]["role"] == "user"
+    block = history.turns[0][2]["content"][0]
+    assert json.loads(block["content"])["products"] == 5
+
+
+def test_estimate_counts_tool_calls():
+    plain = [{"role": "assistant", "content": "hi"}]
+    with_call = [{**plain[0], "tool_calls": [{"id": "x" * 400}]}]
+    assert estimate_tokens(with_call) > estimate_tokens(plain)
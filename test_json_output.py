@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests that JSON search results stay valid JSON under max_response_bytes.
+"""
+
+import json
+
+from search_mcp_pkg import core
+from search_mcp_pkg.framing import fit_json_response, response_limit_scope
+
+PLAN = {"ranking_algorithm": "bm25", "explanation": "Shoes under $50."}
+
+
+def hits(count):
+    return [
+        {"product_name": f"Shoe {i}", "brand": "B", "price": 10 + i, "rating": 4}
+        for i in range(count)
+    ]
+
+
+def render(results, limit, **options):
+    with response_limit_scope(limit):
+        return core.render_results(results, "json", None, None, **options)
+
+
+def test_hits_are_dropped_whole_to_fit():
+    text = render(hits(20), 400, context={"query": "shoes"}, plan=PLAN)
+    response = json.loads(text)
+    assert len(text.encode("utf-8")) <= 400
+    assert response["total"] == 20
+    assert response["omitted"] == 20 - len(response["hits"])
+
+
+def test_head_over_the_limit_is_replaced_with_an_error():
+    text = render(
+        hits(1), 50, context={"brand": "B", "timings_ms": {"search": 1.5}}, plan=PLAN
+    )
+    response = json.loads(text)
+    assert response["truncated"] is True
+    assert "max_response_bytes" in response["error"]
+
+
+def test_fit_json_response_keeps_results_that_fit():
+    text = json.dumps({"error": "x"})
+    assert fit_json_response(text, 100) == (text, False)
+    assert fit_json_response(text, None) == (text, False)
+
+
+def test_fit_json_response_never_cuts_json_short():
+    text = json.dumps({"error": "Elasticsearch is unavailable " * 10})
+    fitted, truncated = fit_json_response(text, 80)
+    assert truncated
+    assert json.loads(fitted)["truncated"] is True
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the latency histogram and the metrics registry.
+"""
+
+import random
+import socket
+import urllib.request
+
+import pytest
+
+from search_mcp_pkg.metrics import (
+    HALF_SUB_BUCKETS,
+    Histogram,
+    MetricsRegistry,
+    start_exporters,
+)
+
+
+def test_small_values_are_exact():
+    histogram = Histogram()
+    for micros in range(1, 11):
+        histogram.record(micros / 1_000_000)
+    assert histogram.percentiles((0.5, 1.0)) == [5, 10]
+
+
+def test_every_bucket_value_maps_back_to_its_bucket():
+    for value in list(range(1, 5000)) + [10**6, 10**9]:
+        index = Histogram.bucket(value)
+        assert Histogram.bucket(Histogram.bucket_value(index)) == index
+        assert Histogram.bucket_value(index) >= value
+
+
+@pytest.mark.parametrize("quantile", [0.5, 0.9, 0.99])
+def test_percentiles_are_within_the_bucket_resolution(quantile):
+    rng = random.Random(7)
+    values = sorted(int(rng.lognormvariate(10, 1)) for _ in range(20_000))
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value / 1_000_000)
+    exact = values[int(quantile * len(values)) - 1]
+    (estimate,) = histogram.percentiles((quantile,))
+    assert abs(estimate - exact) / exact <= 1 / HALF_SUB_BUCKETS
+
+
+def test_snapshot_reports_milliseconds():
+    histogram = Histogram()
+    assert histogram.snapshot() == {"count": 0}
+    histogram.record(0.002)
+    histogram.record(0.004)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 2
+    assert snapshot["mean_ms"] == 3.0
+    assert snapshot["min_ms"] == 2.0
+    assert snapshot["max_ms"] == 4.0
+
+
+def test_registry_counts_and_times_by_label():
+    registry = MetricsRegistry()
+    registry.inc("calls_total", tool="search")
+    registry.inc("calls_total", tool="search")
+    registry.observe("latency", 0.01, tool="search")
+    snapshot = registry.snapshot()
+    assert snapshot["counters"]["calls_total"] == {"tool=search": 2}
+    assert snapshot["histograms"]["latency"]["tool=search"]["p50_ms"] == 10.0
+    exposition = registry.prometheus()
+    assert 'search_mcp_calls_total{tool="search"} 2' in exposition
+    assert 'search_mcp_latency_seconds_count{tool="search"} 1' in exposition
+
+
+def test_metrics_endpoint_listens_on_localhost_by_default():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = start_exporters(path="", port=port)
+    try:
+        assert server.server_address == ("127.0.0.1", port)
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.status == 200
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for running a Claude response's tool calls concurrently.
+
+The MCP server is stubbed: it answers each tool call after a delay of its
+own, so the calls finish in another order than they were made.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test-key")
+
+import claude_mcp_search_demo as demo
+
+
+class FakeReader:
+    """Answers each tool call on a timer; the delay is taken from its tool."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.sent = []
+
+    def submit(self, request):
+        self.sent.append(request)
+        future = Future()
+        delay = self.delays[request["tool"]]
+        response = {
+            "id": request["id"],
+            "type": "tool_call_response",
+            "result": f"{request['tool']} result",
+        }
+        threading.Timer(delay, future.set_result, [response]).start()
+        return future
+
+    def discard(self, request_id):
+        pass
+
+
+def fake_client():
+    """A demo MCPClient whose searches take longer than its brand lookups."""
+    client = demo.MCPClient.__new__(demo.MCPClient)
+    client.message_id = 0
+    client.debug_mode = False
+    client.reader = FakeReader({"search": 0.2, "search_products_by_brand": 0.05})
+    return client
+
+
+@pytest.fixture
+def client():
+    return fake_client()
+
+
+def test_results_come_back_in_request_order(client):
+    tool_uses = [
+        {"id": "toolu_1", "name": "search", "input": {"query": "boots"}},
+        {"id": "toolu_2", "name": "search_products_by_brand", "input": {}},
+    ]
+    started = time.perf_counter()
+    pending = [demo.start_tool_use(client, tool_use) for tool_use in tool_uses]
+    tool_results, _ = demo.finish_tool_uses(client, tool_uses, pending)
+    elapsed = time.perf_counter() - started
+
+    # The brand search answers first, but results follow the tool_use order
+    assert [block["tool_use_id"] for block in tool_results] == ["toolu_1", "toolu_2"]
+    assert [block["content"] for block in tool_results] == [
+        "search result",
+        "search_products_by_brand result",
+    ]
+    # The calls overlapped rather than running one after the other
+    assert elapsed < 0.2 + 0.05
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Tests for MCPClientPool: routing, restarts, cancelling and batches.
+
+Each worker's AsyncMCPClient is replaced by a fake that answers calls after
+a delay taken from their args and records what it was asked to do.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from search_mcp_pkg.client import MCPClient
+from search_mcp_pkg.pool import MCPClientPool
+
+
+class FakeWorkerClient:
+    """Stands in for one worker's AsyncMCPClient."""
+
+    def __init__(self, name):
+        self.name = name
+        self.connected = True
+        self.connections = 1
+        self.process = None
+        self.tools_info = {}
+        self.available_tools = {}
+        self.max_response_bytes = None
+        self.pending = {}
+        self.calls = []
+        self.cancelled = []
+
+    async def connect(self):
+        self.connected = True
+        self.connections += 1
+
+    async def close(self):
+        self.connected = False
+
+    async def stats(self, timeout=None):
+        return {"type": "stats_response"}
+
+    async def call_tool(self, tool_name, args, timeout=None, request_id=None):
+        self.calls.append(request_id)
+        if args.get("lost") == self.name:
+            raise ConnectionError(f"{self.name} went away")
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        asyncio.get_running_loop().call_later(
+            args.get("delay", 0), lambda: future.done() or future.set_result(None)
+        )
+        try:
+            await future
+        finally:
+            self.pending.pop(request_id, None)
+        return {"id": request_id, "type": "tool_call_response", "result": self.name}
+
+    async def cancel(self, request_id):
+        self.cancelled.append(request_id)
+        future = self.pending.pop(request_id, None)
+        if future is not None:
+            future.cancel()
+
+
+def make_pool(size=3):
+    pool = MCPClientPool(addresses=[f"w{i}" for i in range(size)], cache_ttl=0)
+    for worker in pool.workers:
+        worker.client = FakeWorkerClient(worker.target)
+    return pool
+
+
+def clients(pool):
+    return [worker.client for worker in pool.workers]
+
+
+def test_calls_go_to_the_worker_with_fewest_outstanding():
+    async def main():
+        pool = make_pool()
+        slow = asyncio.ensure_future(pool.call_tool("search", {"delay": 0.2}))
+        await asyncio.sleep(0.01)
+        # w0 is busy, so the next calls go to the others, one each
+        quick = await asyncio.gather(
+            pool.call_tool("search", {"delay": 0.05}),
+            pool.call_tool("search", {"delay": 0.05}),
+        )
+        busy = {worker.target: worker.outstanding for worker in pool.workers}
+        await slow
+        return pool, [response["result"] for response in quick], busy
+
+    pool, quick, busy = asyncio.run(main())
+    assert sorted(quick) == ["w1", "w2"]
+    assert busy == {"w0": 1, "w1": 0, "w2": 0}
+    assert [len(client.calls) for client in clients(pool)] == [1, 1, 1]
+
+
+def test_dead_worker_is_restarted_by_the_health_check():
+    async def main():
+        pool = make_pool()
+        worker = pool.workers[1]
+        worker.client.connected = False
+        await pool._check(worker)
+        return worker
+
+    worker = asyncio.run(main())
+    assert worker.client.connected
+    assert worker.healthy
+    assert worker.restarts == 1
+
+
+def test_read_lost_with_its_worker_is_retried_on_another():
+    async def main():
+        pool = make_pool(2)
+        # w0 is picked first and loses the call, which is retried on w1
+        response = await pool.call_tool("search", {"lost": "w0"}, request_id="r1")
+        return pool, response
+
+    pool, response = asyncio.run(main())
+    assert response["result"] == "w1"
+    assert [client.calls for client in clients(pool)] == [["r1"], ["r1"]]
+    assert [worker.errors for worker in pool.workers] == [1, 0]
+    assert pool.routes == {}
+
+
+def test_cancel_reaches_the_worker_running_the_call():
+    async def main():
+        pool = make_pool()
+        other = asyncio.ensure_future(pool.call_tool("search", {"delay": 0.2}))
+        target = asyncio.ensure_future(
+            pool.call_tool("search", {"delay": 5}, request_id="r1")
+        )
+        await asyncio.sleep(0.01)
+        await pool.cancel("r1")
+        with pytest.raises(asyncio.CancelledError):
+            await target
+        await other
+        # Unknown (or finished) ids are ignored
+        await pool.cancel("r1")
+        return pool
+
+    pool = asyncio.run(main())
+    assert [client.cancelled for client in clients(pool)] == [[], ["r1"], []]
+    assert pool.routes == {}
+
+
+def test_sync_client_cancels_a_submitted_call_on_a_pool():
+    client = MCPClient.__new__(MCPClient)
+    client.client = make_pool()
+    client.loop = asyncio.new_event_loop()
+    client.thread = threading.Thread(target=client.loop.run_forever, daemon=True)
+    client.thread.start()
+    try:
+        future = client.submit_tool("search", request_id="r1", delay=5)
+        while "r1" not in client.client.routes:
+            threading.Event().wait(0.01)
+        client.cancel("r1")
+        with pytest.raises(CancelledError):
+            future.result(timeout=5)
+    finally:
+        client._stop_loop()
+    assert clients(client.client)[0].cancelled == ["r1"]
+
+
+def test_batch_is_spread_over_the_workers_in_call_order():
+    calls = [
+        {"id": "a", "tool": "search", "args": {"delay": 0.1}},
+        {"id": "b", "tool": "search", "args": {"delay": 0.05}},
+        {"tool": "search", "args": {"delay": 0}},
+    ]
+
+    async def main():
+        pool = make_pool()
+        return pool, await pool.call_tools_batch(calls)
+
+    pool, responses = asyncio.run(main())
+    assert [response["id"] for response in responses[:2]] == ["a", "b"]
+    assert sorted(response["result"] for response in responses) == ["w0", "w1", "w2"]
+    assert [len(client.calls) for client in clients(pool)] == [1, 1, 1]
+    # Each call was sent under its own id, so it can be cancelled by it
+    assert [client.calls[0] for client in clients(pool)][:2] == ["a", "b"]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for collapsing the search fields of a query plan onto search_text.
+"""
+
+import pytest
+
+from search_mcp_pkg import core
+
+CATCH_ALL_SOURCES = frozenset(
+    {"product_name", "description", "brand", "category", "tags"}
+)
+
+
+@pytest.fixture(autouse=True)
+def collapse_enabled(monkeypatch):
+    monkeypatch.setattr(core, "COLLAPSE_SEARCH_FIELDS", True)
+
+
+def test_all_catch_all_sources_collapse_to_one_match():
+    clauses = core.build_text_clauses(
+        "red shoes", sorted(CATCH_ALL_SOURCES), CATCH_ALL_SOURCES
+    )
+    assert clauses == [{"match": {"search_text": "red shoes"}}]
+
+
+def test_catch_all_field_itself_collapses():
+    clauses = core.build_text_clauses("red shoes", ["search_text"], CATCH_ALL_SOURCES)
+    assert clauses == [{"match": {"search_text": "red shoes"}}]
+
+
+def test_default_plan_fields_collapse():
+    clauses = core.build_text_clauses(
+        "red shoes", core.DEFAULT_SEARCH_FIELDS, CATCH_ALL_SOURCES
+    )
+    assert clauses == [{"match": {"search_text": "red shoes"}}]
+
+
+def test_field_outside_the_catch_all_is_not_collapsed():
+    fields = ["product_name", "sku"]
+    clauses = core.build_text_clauses("red shoes", fields, CATCH_ALL_SOURCES)
+    assert clauses == [
+        {"multi_match": {"query": "red shoes", "fields": fields, "type": "most_fields"}}
+    ]
+
+
+def test_index_without_a_catch_all_is_not_collapsed():
+    clauses = core.build_text_clauses("red shoes", ["product_name"], frozenset())
+    assert clauses[0]["multi_match"]["fields"] == ["product_name"]
+
+
+def test_boosted_fields_keep_their_boosts():
+    fields = ["product_name^3"] + sorted(CATCH_ALL_SOURCES - {"product_name"})
+    clauses = core.build_text_clauses("red shoes", fields, CATCH_ALL_SOURCES)
+    assert clauses[0]["multi_match"]["fields"] == fields
+
+
+def test_disabled_collapse_keeps_per_field_matches(monkeypatch):
+    monkeypatch.setattr(core, "COLLAPSE_SEARCH_FIELDS", False)
+    clauses = core.build_text_clauses(
+        "red shoes", ["product_name", "brand"], CATCH_ALL_SOURCES
+    )
+    assert clauses == [
+        {"match": {"product_name": "red shoes"}},
+        {"match": {"brand": "red shoes"}},
+    ]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for ResponseReader over newline-delimited and length-prefixed framing.
+
+The server is a thread on the other end of a socket pair, which answers
+each request with its args and can switch to frames on a hello message.
+"""
+
+import io
+import json
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from search_mcp_pkg.framing import (
+    COMPRESS_THRESHOLD,
+    HEADER,
+    decode_payload,
+    encode_frame,
+    parse_header,
+)
+from search_mcp_pkg.reader import ResponseReader
+
+
+class FakeServer(threading.Thread):
+    """Echoes each request's args in its response, in lines or frames."""
+
+    def __init__(self, sock):
+        super().__init__(daemon=True)
+        self.stdin = sock.makefile("rb")
+        self.stdout = sock.makefile("wb")
+        self.framing = "line"
+        self.compression = None
+
+    def read(self):
+        if self.framing == "line":
+            return self.stdin.readline()
+        header = self.stdin.read(HEADER.size)
+        if not header:
+            return b""
+        length, flags = parse_header(header, 1 << 24)
+        return decode_payload(self.stdin.read(length), flags, 1 << 24)
+
+    def write(self, message):
+        payload = json.dumps(message).encode()
+        if self.framing == "line":
+            self.stdout.write(payload + b"\n")
+        else:
+            self.stdout.write(encode_frame(payload, self.compression))
+        self.stdout.flush()
+
+    def run(self):
+        while data := self.read():
+            message = json.loads(data)
+            if message["type"] == "hello":
+                self.write(
+                    {
+                        "id": message["id"],
+                        "type": "hello_response",
+                        "framing": message["framing"],
+                        "compression": message["compression"],
+                    }
+                )
+                self.framing = message["framing"]
+                self.compression = message["compression"]
+            else:
+                self.write(
+                    {
+                        "id": message["id"],
+                        "type": "tool_call_response",
+                        "result": message["args"],
+                    }
+                )
+
+
+@pytest.fixture
+def reader():
+    client, server = socket.socketpair()
+    FakeServer(server).start()
+    connection = SimpleNamespace(
+        stdin=client.makefile("wb"), stdout=client.makefile("rb")
+    )
+    reader = ResponseReader(connection)
+    yield reader
+    reader.close()
+    client.close()
+    server.close()
+
+
+def call(reader, request_id, args):
+    message = {"id": request_id, "type": "tool_call", "tool": "echo", "args": args}
+    return reader.request(message, timeout=5)
+
+
+def test_lines(reader):
+    assert call(reader, "1", {"query": "boots"})["result"] == {"query": "boots"}
+
+
+def test_length_prefixed_frames_after_hello(reader):
+    assert reader.negotiate("length", "zlib")
+    assert (reader.read_framing, reader.write_framing) == ("length", "length")
+    # Large enough to be compressed in both directions
+    text = "x" * COMPRESS_THRESHOLD
+    assert call(reader, "1", {"text": text})["result"] == {"text": text}
+    assert call(reader, "2", {"n": 2})["result"] == {"n": 2}
+
+
+def test_length_framing_needs_binary_streams():
+    reader = ResponseReader(SimpleNamespace(stdin=io.StringIO(), stdout=io.StringIO()))
+    with pytest.raises(ValueError, match="binary"):
+        reader.negotiate("length")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the client-side session cache of tool results.
+"""
+
+import asyncio
+import json
+
+from search_mcp_pkg.session_cache import SessionCache, cache_key
+
+
+def make_server(result="Search results for: shoes\n\nResults:\nProduct 1:\n"):
+    """A fake server call that counts how often it is made."""
+    calls = []
+
+    def call(request_id):
+        async def respond():
+            calls.append(request_id)
+            return {"id": request_id, "type": "tool_call_response", "result": result}
+
+        return respond
+
+    return calls, call
+
+
+def search(cache, call, request_id, query="shoes", tool="search"):
+    return asyncio.run(
+        cache.call(tool, {"query": query}, call(request_id), None, request_id)
+    )
+
+
+def test_key_ignores_argument_order():
+    assert cache_key("search", {"a": 1, "b": 2}) == cache_key(
+        "search", {"b": 2, "a": 1}
+    )
+
+
+def test_repeat_is_served_from_the_cache_with_its_own_id():
+    cache = SessionCache(ttl=60)
+    calls, call = make_server()
+    first = search(cache, call, "req-1")
+    second = search(cache, call, "req-2")
+    assert calls == ["req-1"]
+    assert second["cached"] is True
+    assert second["id"] == "req-2"
+    assert second["result"] == first["result"]
+    assert "cached" not in first
+
+
+def test_writes_invalidate():
+    cache = SessionCache(ttl=60)
+    calls, call = make_server()
+    search(cache, call, "req-1")
+    asyncio.run(cache.call("create_ecommerce_test_index", {}, call("req-2")))
+    search(cache, call, "req-3")
+    search(cache, call, "req-4", query="DELETE_INDEX")
+    search(cache, call, "req-5")
+    assert calls == ["req-1", "req-2", "req-3", "req-4", "req-5"]
+
+
+def test_entries_expire():
+    cache = SessionCache(ttl=0.01)
+    calls, call = make_server()
+    search(cache, call, "req-1")
+    asyncio.run(asyncio.sleep(0.02))
+    search(cache, call, "req-2")
+    assert calls == ["req-1", "req-2"]
+
+
+def test_failed_and_empty_results_are_not_cached():
+    results = [
+        "Error searching for products from brand 'B': connection refused",
+        "No products found for query: shoes",
+        json.dumps({"error": "connection refused"}),
+        json.dumps({"query": "shoes", "total": 0, "hits": []}),
+    ]
+    for result in results:
+        cache = SessionCache(ttl=60)
+        calls, call = make_server(result)
+        search(cache, call, "req-1")
+        search(cache, call, "req-2")
+        assert calls == ["req-1", "req-2"], result
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Tests for starting tool calls while the LLM response is still streaming.
+
+Claude's stream is stubbed as a list of events, and the MCP server as in
+test_parallel_tools.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test-key")
+
+import claude_mcp_search_demo as demo
+from search_mcp_pkg.client import LLMPoweredMCPClient, MCPClient
+from search_mcp_pkg.history import ConversationHistory
+from test_parallel_tools import fake_client
+
+
+def event(type, index, **fields):
+    return SimpleNamespace(type=type, index=index, **fields)
+
+
+def tool_use_events(index, tool_id, name, partial_json):
+    return [
+        event(
+            "content_block_start",
+            index,
+            content_block=SimpleNamespace(type="tool_use", id=tool_id, name=name),
+        ),
+        event(
+            "content_block_delta",
+            index,
+            delta=SimpleNamespace(type="input_json_delta", partial_json=partial_json),
+        ),
+        event("content_block_stop", index),
+    ]
+
+
+STREAM = [
+    event("content_block_start", 0, content_block=SimpleNamespace(type="text")),
+    event(
+        "content_block_delta",
+        0,
+        delta=SimpleNamespace(type="text_delta", text="Let me look."),
+    ),
+    event("content_block_stop", 0),
+    *tool_use_events(1, "toolu_1", "search", '{"query": "boots"}'),
+    *tool_use_events(2, "toolu_2", "search_products_by_brand", '{"brand": "Acme"}'),
+]
+
+
+@pytest.fixture
+def client():
+    return fake_client()
+
+
+def test_tool_calls_start_at_content_block_stop(monkeypatch, client):
+    log = []
+
+    def create(**request):
+        for item in STREAM:
+            log.append((item.type, item.index))
+            yield item
+
+    monkeypatch.setattr(demo.claude_client.messages, "create", create)
+    started = []
+
+    def on_tool_use(block, error):
+        log.append(("start", block["name"]))
+        started.append(demo.start_tool_use(client, block, error))
+
+    content, first_token, _ = demo.stream_claude_response({}, on_tool_use)
+
+    # Each call starts right after its block's stop event, before the next
+    # block has streamed
+    assert log.index(("start", "search")) == log.index(("content_block_stop", 1)) + 1
+    assert log[-1] == ("start", "search_products_by_brand")
+    assert log[-2] == ("content_block_stop", 2)
+    assert [request["args"] for request in client.reader.sent] == [
+        {"query": "boots", "index": "ecommerce"},
+        {"brand": "Acme", "index": "ecommerce"},
+    ]
+    assert [block["type"] for block in content] == ["text", "tool_use", "tool_use"]
+    assert first_token is not None
+
+
+class FakeAsyncClient:
+    """Answers call_tool after a delay taken from the call's args."""
+
+    async def call_tool(self, tool_name, args, timeout=None, request_id=None):
+        await asyncio.sleep(args["delay"])
+        return {"type": "tool_call_response", "result": args["query"]}
+
+
+def test_submit_tool_runs_calls_concurrently():
+    client = MCPClient.__new__(MCPClient)
+    client.client = FakeAsyncClient()
+    client.loop = asyncio.new_event_loop()
+    client.thread = threading.Thread(target=client.loop.run_forever, daemon=True)
+    client.thread.start()
+    try:
+        started = time.perf_counter()
+        futures = [
+            client.submit_tool("search", query=query, delay=delay)
+            for query, delay in (("slow", 0.2), ("fast", 0.05))
+        ]
+        results = [future.result(timeout=5)["result"] for future in futures]
+        elapsed = time.perf_counter() - started
+    finally:
+        client._stop_loop()
+    assert results == ["slow", "fast"]
+    assert elapsed < 0.2 + 0.05
+
+
+def test_cut_off_tool_input_is_reported_to_claude_as_an_error(monkeypatch, client):
+    stream = tool_use_events(1, "toolu_1", "search", '{"query": "bo')
+    monkeypatch.setattr(
+        demo.claude_client.messages, "create", lambda **request: iter(stream)
+    )
+    pending = []
+
+    def on_tool_use(block, error):
+        pending.append(demo.start_tool_use(client, block, error))
+
+    content, _, _ = demo.stream_claude_response({}, on_tool_use)
+    results, _ = demo.finish_tool_uses(client, content, pending)
+
+    # Nothing was sent to the server, and Claude gets the error back
+    assert client.reader.sent == []
+    assert content[0]["input"] == {}
+    assert results[0]["tool_use_id"] == "toolu_1"
+    assert results[0]["is_error"]
+    assert results[0]["content"].startswith("Error: Invalid tool input")
+
+
+class FakeMCPClient:
+    """Records the tool calls an LLMPoweredMCPClient makes."""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit_tool(self, tool_name, **kwargs):
+        self.calls.append(tool_name)
+
+    def call_tool(self, tool_name, **kwargs):
+        self.calls.append(tool_name)
+
+
+def llm_client(reply):
+    chunk = SimpleNamespace(
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=reply))]
+    )
+    completions = SimpleNamespace(create=lambda **request: iter([chunk]))
+    client = LLMPoweredMCPClient.__new__(LLMPoweredMCPClient)
+    client.openai_client = SimpleNamespace(
+        chat=SimpleNamespace(completions=completions)
+    )
+    client.model = "test-model"
+    client.mcp_client = FakeMCPClient()
+    client.history = ConversationHistory("system prompt")
+    return client
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        '["search", {"query": "boots"}]',
+        '{"tool": "search", "parameters": ["boots"]}',
+        '{"tool": ["search"], "parameters": {"query": "boots"}}',
+    ],
+)
+def test_malformed_llm_decision_is_not_called(reply):
+    client = llm_client(reply)
+    assert client.process_query("boots") == "Error: Invalid LLM response format"
+    assert client.mcp_client.calls == []
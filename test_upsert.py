@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for idempotent product writes (upsert_products).
+"""
+
+import pytest
+from elasticsearch import helpers
+
+from search_mcp_pkg import core
+
+
+class FakeIndices:
+    def exists(self, index):
+        return True
+
+
+class FakeES:
+    """The mget side of Elasticsearch, backed by a dict of stored documents."""
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.indices = FakeIndices()
+
+    def mget(self, index, ids):
+        return {
+            "docs": [
+                (
+                    {"_id": doc_id, "found": True, "_source": self.stored[doc_id]}
+                    if doc_id in self.stored
+                    else {"_id": doc_id, "found": False}
+                )
+                for doc_id in ids
+            ]
+        }
+
+
+@pytest.fixture
+def es(monkeypatch):
+    """A fake client whose bulk writes are applied like Elasticsearch would."""
+    fake = FakeES({})
+    fake.actions = []
+
+    def bulk(client, actions):
+        for action in actions:
+            fake.actions.append(action)
+            assert action["_op_type"] == "index"
+            fake.stored[action["_id"]] = dict(action["_source"])
+
+    monkeypatch.setattr(core, "get_es", lambda: fake)
+    monkeypatch.setattr(helpers, "bulk", bulk)
+    return fake
+
+
+def product(**fields):
+    return {"sku": "SKU-1", "product_name": "Trail Shoe", "price": 50.0, **fields}
+
+
+def test_new_product_is_created(es):
+    result = core.upsert_products("products", [product()])
+    assert (result["created"], result["updated"], result["unchanged"]) == (1, 0, 0)
+    assert result["ids"] == ["SKU-1"]
+    assert es.stored["SKU-1"][core.CONTENT_HASH_FIELD] == core.content_hash(product())
+
+
+def test_unchanged_product_is_skipped(es):
+    core.upsert_products("products", [product()])
+    es.actions.clear()
+    result = core.upsert_products("products", [product()])
+    assert result["unchanged"] == 1
+    assert es.actions == []
+
+
+def test_changed_product_is_indexed_in_full(es):
+    core.upsert_products("products", [product()])
+    result = core.upsert_products("products", [product(price=45.0)])
+    assert result["updated"] == 1
+    assert es.stored["SKU-1"]["price"] == 45.0
+
+
+def test_removed_field_is_cleared_and_then_unchanged(es):
+    core.upsert_products("products", [product(color="red")])
+    result = core.upsert_products("products", [product()])
+    assert result["updated"] == 1
+    assert "color" not in es.stored["SKU-1"]
+
+    # The stored document now matches its hash, so the next sync skips it
+    result = core.upsert_products("products", [product()])
+    assert result["unchanged"] == 1